@@ -0,0 +1,68 @@
+"""Benchmark building a collection of many synthetic items.
+
+    python benchmarks/collection.py [N_ITEMS]
+
+Writes N_ITEMS (default 100,000) markdown items into a temporary content
+directory, then times `App.generate_urls()` for a collection with a url
+format and a date order. It is timed again after `App.reset()`, like the
+rebuilds in watch mode, where frontmatter comes from the app's cache.
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+import shutil
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import clearice  # noqa: E402
+
+COLLECTION_YAML = """
+name: blog
+order: -date
+url_format: "{{ date.year }}/{{ slug }}"
+"""
+
+
+def write_site(root, n_items):
+    rand = random.Random(0)
+    start = datetime.date(2000, 1, 1)
+    blog_dir = os.path.join(root, "content", "blog")
+    os.makedirs(blog_dir)
+    os.makedirs(os.path.join(root, "templates"))
+    with open(os.path.join(root, "templates", "default.html"), "w") as f:
+        f.write("{{ title }}")
+    with open(os.path.join(blog_dir, "_collection.yaml"), "w") as f:
+        f.write(COLLECTION_YAML)
+    for i in range(n_items):
+        date = start + datetime.timedelta(days=rand.randrange(365 * 20))
+        with open(os.path.join(blog_dir, "item{}.md".format(i)), "w") as f:
+            f.write("---\ntitle: Item {}\ndate: {}\n---\n".format(i, date))
+
+
+def main(n_items):
+    root = tempfile.mkdtemp()
+    try:
+        write_site(root, n_items)
+        app = clearice.app.App(root)
+
+        start = time.perf_counter()
+        app.generate_urls()
+        print("generate_urls() with {} items: {:.2f}s".format(
+                n_items, time.perf_counter() - start))
+        for name, phase in app.stats.phases.items():
+            print("  {}: {:.2f}s".format(name, phase.wall_time))
+
+        app.reset(reload_conf=False)
+        start = time.perf_counter()
+        app.generate_urls()
+        print("generate_urls() again after reset(): {:.2f}s".format(
+                time.perf_counter() - start))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -1 +1 @@
-from . import app, exceptions, generators, helpers, views
+from . import app, cache, exceptions, generators, helpers, output, views
@@ -1,50 +1,140 @@
 import os
+import copy
+import time
+import bisect
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
 
 from markdown import Markdown
 import jinja2
 import yaml
 
 from .helpers import walk_dir, normalize_url, remove_suffix
-from .exceptions import ConfigError, UrlConflictError, YamlError, TemplateVarUndefined, TemplateError
-from . import generators, buildactions
+from .exceptions import ConfigError, UrlConflictError, YamlError, TemplateVarUndefined, TemplateError, BuildCancelled
+from .stats import BuildStats
+from .minify import minify_html
+from .cache import FileHashCache
+from .output import DirectoryOutput
+from . import generators, buildactions, shards, sitemap, search, views
 
 class App():
 
-    def __init__(self, root_dir=None, print_progress=False, **conf_overwrite):
+    def __init__(self, root_dir=None, print_progress=False, shard=None,
+                 manifest_path=None, trace_memory=False, output=None, **conf_overwrite):
+        """
+        `output`: Where to write the build, see `clearice.output`. Defaults
+            to a `DirectoryOutput` for the build directory.
+        `shard`: A 1-based `(index, count)` tuple. If given, only that shard's
+            portion of the urls is built. See `clearice.shards`.
+        `manifest_path`: Build manifest with render times from a previous
+            build, used to balance shards. Defaults to the one in the build
+            directory.
+        `trace_memory`: Record peak memory per build phase in `self.stats`
+            using `tracemalloc`. See `clearice.stats.BuildStats`.
+        """
         self.root_dir = os.path.abspath(root_dir) if root_dir else os.getcwd()
         self.print_progress = print_progress
+        self.shard = shard
+        self.trace_memory = trace_memory
         self.conf_overwrite = conf_overwrite
+        self._manifest_path = manifest_path
+        self._output = output
+
+        if self.shard:
+            shards.check_shard(self.shard)
+
+        # Kept across resets, entries are checked against the files
+        self.frontmatter_cache = views.FrontmatterCache()
+        self.jinja_env = None
+
+        # A `threading.Event` which, when set, stops the build in progress by
+        # raising `BuildCancelled`
+        self.cancel_event = None
+
+        # Per thread, since the dev server renders pages in parallel
+        self._render_state = threading.local()
 
         self.reset()
 
-    def reset(self):
+    def reset(self, reload_conf=True):
+        """Start over, ready to generate urls and build again.
+
+        `reload_conf`: Read "conf.yaml" again and start a new template
+            environment. Otherwise, the config from the last time it was read
+            is used and compiled templates are kept. Jinja compiles a
+            template again when its file changes.
+        """
+        if hasattr(self, "stats"):
+            self.stats.stop()
+        self.stats = BuildStats(trace_memory=self.trace_memory)
         self.conf_path = os.path.join(self.root_dir, 'conf.yaml')
-        self.conf = self.read_conf()
-
-        self.content_dir = os.path.join(self.root_dir, self.conf['content_dir'])
-        self.build_dir = os.path.join(self.root_dir, self.conf['build_dir'])
-        self.template_dir = os.path.join(self.root_dir, self.conf['template_dir'])
+        if reload_conf or self.jinja_env is None:
+            self.load_conf()
+
+        # Generators pop their sections, so every build gets its own copy
+        self.conf = copy.deepcopy(self._loaded_conf)
+        compress_conf = self.conf.pop("compress", None)
+        if compress_conf is None or compress_conf is False:
+            self.compressor = None
+        else:
+            self.compressor = buildactions.Compressor.from_conf(self.conf_path, compress_conf)
 
-        self.jinja_env = self.make_jinja_environment()
         self.consumed_files = set()
         self._generators = []
+        self._named_generators = {}  # Maps name to generator
         self.collections = _Collections(self)
         self.url_map = {}  # Maps URLs to Views
+        self.url_names = {}  # Maps `route_key()` of names to URLs
+        self._sorted_urls = []  # Keys of `url_map` in order, see `sorted_urls`
+        self._new_urls = []  # Added since `_sorted_urls` was last updated
+        self.asset_urls = {}  # Maps content-relative paths to published urls
+        self._hash_cache = None
+        self._build_urls = None
+        self.output_files = {}  # Maps urls to the files `build_content()` wrote
         self.has_generated_urls = False
         self.has_built = False
 
-        # Markdown Template Filter
-        self.add_template_filter(self.markdown_filter, "markdown")
+        self._html_transforms = []
+        if self.conf['minify_html']:
+            self.add_html_transform(self.minify_transform)
 
         if not self.conf['skip_default_generators']:
             self.add_default_generators()
 
+    def load_conf(self):
+        with self.stats.phase("config"):
+            conf = self.read_conf()
+
+        self.content_dir = os.path.normpath(os.path.join(self.root_dir, conf['content_dir']))
+        self.build_dir = os.path.normpath(os.path.join(self.root_dir, conf['build_dir']))
+        self.template_dir = os.path.normpath(os.path.join(self.root_dir, conf['template_dir']))
+        self.cache_dir = os.path.normpath(os.path.join(self.root_dir, conf['cache_dir']))
+        self.output = self._output or DirectoryOutput(self.build_dir)
+
+        if not isinstance(conf['static_workers'], int) or conf['static_workers'] < 0:
+            raise ConfigError(self.conf_path, '"static_workers" must be a non-negative integer')
+        if not isinstance(conf['static_max_pending'], int) or conf['static_max_pending'] < 1:
+            raise ConfigError(self.conf_path, '"static_max_pending" must be a positive integer')
+        self._loaded_conf = conf
+
+        self.jinja_env = self.make_jinja_environment()
+
+        # Markdown Template Filter
+        self.add_template_filter(self.markdown_filter, "markdown")
+        self.add_template_global(self.asset_url, "asset_url")
+        self.add_template_global(self.url_for, "url_for")
+
     def read_conf(self):
         conf = {
             'content_dir': 'content',
             'build_dir': 'build',
             'template_dir': 'templates',
+            'cache_dir': '.clearice-cache',
             'skip_default_generators': False,
+            'minify_html': False,
+            'static_workers': 4,
+            'static_max_pending': 64,
         }
 
         if os.path.exists(self.conf_path):
@@ -70,12 +160,28 @@ class App():
         # Markdown page generator
         self.add_generator(generators.MarkdownGenerator())
 
+        # Image Derivative Generator. Runs before the static file generator,
+        # which would consume the images.
+        images_conf = self.conf.pop("images", {}) or {}
+        if images_conf:
+            self.add_generator(generators.ImageGenerator.from_conf(self.conf_path, images_conf))
+
         # Static File Generator
         static_conf = self.conf.pop("static", {}) or {}
         if static_conf:
             static_gen = generators.StaticFileGeneraor.from_conf(self.conf_path, static_conf)
             self.add_generator(static_gen)
 
+        # Search index
+        search_conf = self.conf.pop("search", None)
+        if search_conf:
+            self.add_generator(search.SearchIndexGenerator.from_conf(self.conf_path, search_conf))
+
+        # Sitemap. Runs last so it sees the pages of every generator above.
+        sitemap_conf = self.conf.pop("sitemap", None)
+        if sitemap_conf:
+            self.add_generator(sitemap.SitemapGenerator.from_conf(self.conf_path, sitemap_conf))
+
     @jinja2.contextfilter
     def markdown_filter(self, context, value):
         md_parser = Markdown()
@@ -93,7 +199,26 @@ class App():
             lstrip_blocks=True,
         )
 
+    def render_cache(self):
+        """A dict for caching things for the rest of the template render in
+        progress, or None if nothing is being rendered.
+
+        Emptied when the outermost render in this thread finishes.
+        """
+        return getattr(self._render_state, "cache", None)
+
     def render_template(self, template, context):
+        state = self._render_state
+        outermost = getattr(state, "cache", None) is None
+        if outermost:
+            state.cache = {}
+        try:
+            return self._render_template(template, context)
+        finally:
+            if outermost:
+                state.cache = None
+
+    def _render_template(self, template, context):
 
         # Get template
         try:
@@ -129,6 +254,13 @@ class App():
                     "{}".format(absolute, self.content_dir))
         return absolute
 
+    def get_cache_path(self, path):
+        absolute = os.path.abspath(os.path.join(self.cache_dir, path))
+        if not absolute.startswith(self.cache_dir):
+            raise ValueError("Tried to get path {} outside of cache directory "
+                    "{}".format(absolute, self.cache_dir))
+        return absolute
+
     def walk_content(self, include_consumed=False, **kwargs):
         files = walk_dir(
             root=self.content_dir,
@@ -142,16 +274,156 @@ class App():
     def n_urls(self):
         return len(self.url_map)
 
+    @property
+    def manifest_path(self):
+        if self._manifest_path:
+            return os.path.abspath(self._manifest_path)
+        return os.path.join(self.build_dir, shards.BUILD_MANIFEST)
+
+    @property
+    def build_urls(self):
+        """The urls `build_content()` will build: all of them, or one shard."""
+        if not self.has_generated_urls:
+            raise RuntimeError("generate_urls() must be called before urls can be built")
+        if self._build_urls is None:
+            if self.shard:
+                index, count = self.shard
+                render_times = shards.read_render_times(self.manifest_path)
+                partition = shards.partition_urls(self.url_map.keys(), count, render_times)
+                self._build_urls = partition[index-1]
+            else:
+                self._build_urls = list(self.url_map.keys())
+        return self._build_urls
+
     def add_template_filter(self, func, name):
         #TODO: Enable use as decorator, like flask
         self.jinja_env.filters[name] = func
 
-    def add_url(self, url, view):
-        #TODO: Add name for reverse lookup
+    def add_template_global(self, func, name):
+        self.jinja_env.globals[name] = func
+
+    @property
+    def hash_cache(self):
+        """Content hashes of files, cached between builds."""
+        if self._hash_cache is None:
+            self._hash_cache = FileHashCache(os.path.join(self.cache_dir, "hashes.json"))
+        return self._hash_cache
+
+    def add_asset(self, abspath, url):
+        """Record that content file `abspath` is published at `url`."""
+        relpath = os.path.relpath(abspath, self.content_dir)
+        self.asset_urls[relpath] = url
+
+    def asset_url(self, path):
+        """The url a static file is published at, given its content path.
+
+        Available in templates, for example `{{ asset_url('css/style.css') }}`,
+        which gives the fingerprinted url if the file is fingerprinted.
+        """
+        try:
+            return self.asset_urls[path.lstrip('/')]
+        except KeyError:
+            raise jinja2.exceptions.TemplateRuntimeError(
+                    'No static file "{}" in content directory'.format(path)) from None
+
+    def add_html_transform(self, func):
+        """Add a function to post-process rendered HTML before it's written.
+
+        `func(html, url)` receives the rendered HTML of each page and returns
+        the HTML to write. Transforms run in the order they are added.
+        """
+        self._html_transforms.append(func)
+
+    def minify_transform(self, html, url):
+        minified = minify_html(html)
+        self.stats.incr("html bytes before minify", len(html.encode('utf-8')))
+        self.stats.incr("html bytes after minify", len(minified.encode('utf-8')))
+        return minified
+
+    def add_url(self, url, view, name=None, params=None):
+        """Add `url`, built by `view`.
+
+        `name` and `params` let templates find the url with
+        `url_for(name, **params)`. Built-in generators name pages after their
+        source file in the content directory, without the extension, like
+        "blog/my-post". Pages of the same name are told apart by params, like
+        `page=2` for the pages of a paginated page.
+        """
         #TODO: Option to not care about overwriting url
         if url in self.url_map:
-            raise UrlConflictError
+            raise UrlConflictError('Url "{}" was added more than once'.format(url))
+        if name is not None:
+            key = route_key(name, params or {})
+            if key in self.url_names:
+                raise UrlConflictError('Url name "{}" is already used by '
+                        '"{}"'.format(name, self.url_names[key]))
+            # Files other than pages are published without the trailing "/"
+            self.url_names[key] = url if buildactions.is_page(view) else url.rstrip('/')
         self.url_map[url] = view
+        self._new_urls.append(url)
+
+    @property
+    def sorted_urls(self):
+        """All urls in order, so the urls under a prefix are contiguous."""
+        if self._new_urls:
+            # Sorting two sorted runs is linear, so adding urls between
+            # queries doesn't mean sorting everything again.
+            self._new_urls.sort()
+            self._sorted_urls = sorted(self._sorted_urls + self._new_urls)
+            self._new_urls = []
+        return self._sorted_urls
+
+    def urls_under(self, prefix):
+        """Urls below `prefix`, not including `prefix` itself, in order.
+
+        Available in templates as `app.urls_under("/docs/")`.
+        """
+        prefix = normalize_url(prefix)
+        urls = self.sorted_urls
+        result = []
+        for i in range(bisect.bisect_right(urls, prefix), len(urls)):
+            if not urls[i].startswith(prefix):
+                break
+            result.append(urls[i])
+        return result
+
+    def children(self, url):
+        """Urls directly below `url`, like "/docs/a/" for "/docs/", in order."""
+        url = normalize_url(url)
+        urls = self.sorted_urls
+        result = []
+        i = bisect.bisect_right(urls, url)
+        while i < len(urls) and urls[i].startswith(url):
+            rest = urls[i][len(url):]
+            child = url + rest[:rest.index('/')+1]
+            if urls[i] == child:
+                result.append(child)
+            # Skip the child's own subtree: "0" sorts right after "/"
+            i = bisect.bisect_left(urls, child[:-1] + '0', i+1)
+        return result
+
+    def parent(self, url):
+        """The closest url above `url`, or None."""
+        url = normalize_url(url)
+        while url != '/':
+            url = url[:url.rindex('/', 0, -1)+1]
+            if url in self.url_map:
+                return url
+        return None
+
+    def url_for(self, name, **params):
+        """The url added with `name` and `params`.
+
+        Available in templates, for example `{{ url_for('blog/index', page=2) }}`.
+        """
+        try:
+            return self.url_names[route_key(name, params)]
+        except KeyError:
+            if params:
+                name += " with " + ", ".join(
+                        "{}={}".format(k, v) for k, v in sorted(params.items()))
+            raise jinja2.exceptions.TemplateRuntimeError(
+                    'No url named "{}"'.format(name)) from None
 
     def consume(self, abspath):
         assert os.path.isabs(abspath)
@@ -168,10 +440,10 @@ class App():
 
         # Check name for uniqueness
         if hasattr(gen, 'name'):
-            for gen2 in self._generators:
-                if hasattr(gen2, 'name') and gen.name == gen2.name:
-                    raise ConfigError(None, 'Cannot have two generators with '
-                            'the same name "{}"'.format(gen.name))
+            if gen.name in self._named_generators:
+                raise ConfigError(None, 'Cannot have two generators with '
+                        'the same name "{}"'.format(gen.name))
+            self._named_generators[gen.name] = gen
 
         self._generators.append(gen)
 
@@ -181,45 +453,127 @@ class App():
             raise RuntimeError("reset() must be called before calling generate_urls() a second time")
         self.has_generated_urls = True
 
-        for generator in self._generators:
-            generator(self)
+        with self.stats.phase("generate_urls"):
+            for generator in self._generators:
+                self.check_cancelled()
+                with self.stats.phase("generator: "+generator_label(generator)):
+                    generator(self)
+            if self._hash_cache:
+                self.stats.incr("files hashed", self._hash_cache.n_hashed)
+                self._hash_cache.save()
         if self.print_progress:
             print()  # Newline after printing in consume()
 
-    def build_content(self):
-        """Yield pages as they are rendered into the build directory."""
+    def build_content(self, unchanged=None):
+        """Yield pages as they are rendered into the build directory.
+
+        `unchanged`: Maps urls known to be unchanged since they were last built
+            to the file they were built to. These aren't built again, and
+            their files are kept.
+        """
+        unchanged = unchanged or {}
         if self.has_built:
             raise RuntimeError("reset() must be called before calling build_content() a second time")
         self.has_built = True
 
-        # Create build dir
-        if not os.path.isdir(self.build_dir):
-            os.makedirs(self.build_dir)
-
         # Record existing files in build dir
-        existing_files = set()
-        for abspath, relpath in walk_dir(self.build_dir):
-            existing_files.add(abspath)
+        with self.stats.phase("scan build dir"):
+            existing_files = self.output.existing_files()
+
+        # Compression runs in the background while rendering continues
+        compress_pool = None
+        compress_jobs = []
+        if self.compressor and self.output.is_directory:
+            compress_pool = ThreadPoolExecutor(self.compressor.workers)
+
+        # Actions that are mostly waiting on I/O, like copying static files,
+        # run in a thread pool alongside rendering. `pending` holds their
+        # (url, future)s in the order they were submitted.
+        publish_pool = None
+        pending = collections.deque()
+        if self.conf['static_workers']:
+            publish_pool = ThreadPoolExecutor(self.conf['static_workers'])
+        max_pending = self.conf['static_max_pending']
 
-        # Render all urls
         written_files = set()
-        for url, view in self.url_map.items():
-            filename = self._build_url(url, view)
-            written_files.add(filename)
-            yield url
+        render_times = {}
 
-        # Remove files that existed before
-        for filename in existing_files - written_files:
-            os.remove(filename)
-            parent = os.path.dirname(filename)
-            if not os.listdir(parent):
-                os.removedirs(parent)
-
-    def _build_url(self, url, view):
+        def finish(url, filename, seconds):
+            render_times[url] = seconds
+            written_files.add(filename)
+            self.output_files[url] = filename
+            self.stats.incr("urls built")
+            if compress_pool and self.compressor.matches(filename):
+                written_files.update(self.compressor.sibling_paths(filename))
+                compress_jobs.append(compress_pool.submit(self.compressor.compress, filename))
 
-        # Remove leading '/'
-        assert url[0] == '/'
-        url = url[1:]
+        # Render all urls
+        try:
+            for url in self.build_urls:
+                self.check_cancelled()
+                if url in unchanged:
+                    filename = unchanged[url]
+                    written_files.add(filename)
+                    self.output_files[url] = filename
+                    self.stats.incr("urls unchanged")
+                    if compress_pool and self.compressor.matches(filename):
+                        written_files.update(self.compressor.sibling_paths(filename))
+                    continue
+
+                view = self.url_map[url]
+                if publish_pool and getattr(view, 'parallel', False):
+                    pending.append((url, publish_pool.submit(self._timed_build_url, url, view)))
+                else:
+                    finish(url, *self._timed_build_url(url, view))
+                    yield url
+
+                # Collect finished actions, waiting if too many are queued
+                while pending and (len(pending) >= max_pending or pending[0][1].done()):
+                    done_url, future = pending.popleft()
+                    finish(done_url, *future.result())
+                    yield done_url
+
+            while pending:
+                done_url, future = pending.popleft()
+                finish(done_url, *future.result())
+                yield done_url
+
+            if compress_pool:
+                with self.stats.phase("compress"):
+                    for job in compress_jobs:
+                        self.stats.incr("compressed files written", job.result())
+        finally:
+            if publish_pool:
+                publish_pool.shutdown()
+            if compress_pool:
+                compress_pool.shutdown()
+
+        with self.stats.phase("cleanup"):
+            if self.shard:
+                # Other shards write the rest of the site, so nothing here is
+                # stale. Stale files are removed when the shards are merged.
+                shards.write_shard_manifest(self.build_dir, self.shard,
+                        written_files, render_times)
+            else:
+                # Remove files that existed before
+                stale_files = existing_files - written_files
+                self.output.remove(stale_files)
+                self.stats.incr("stale files removed", len(stale_files))
+
+    def check_cancelled(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise BuildCancelled()
+
+    def _timed_build_url(self, url, view):
+        """Returns (file written, seconds taken)."""
+        start = time.perf_counter()
+        filename = self._build_url(url, view)
+        return filename, time.perf_counter() - start
+
+    def resolve_action(self, url, view=None):
+        """The `BuildAction` that builds `url`, rendering it if needed."""
+        if view is None:
+            view = self.url_map[url]
 
         # A view can be:
         #   - Instance of `buildactions.BuildAction`
@@ -229,7 +583,9 @@ class App():
         #   - Any callable
         #       Calls the view, then acts accordingly like one of the above.
         if callable(view):
+            start = time.perf_counter()
             view = view()
+            self.stats.add_time("render", time.perf_counter() - start)
         if isinstance(view, buildactions.BuildAction):
             action = view
         elif isinstance(view, str):
@@ -237,12 +593,23 @@ class App():
         else:
             raise RuntimeError("Could not resolve action from view {}".format(view))
 
-        out_path = self.get_build_path(url)
-        file_written = action.do(self, out_path)
-        if not file_written:
-            file_written = out_path
+        if self._html_transforms and isinstance(action, buildactions.Html):
+            start = time.perf_counter()
+            action = copy.copy(action)
+            for transform in self._html_transforms:
+                action.content = transform(action.content, url)
+            self.stats.add_time("transform", time.perf_counter() - start)
+        return action
+
+    def _build_url(self, url, view):
+        action = self.resolve_action(url, view)
 
-        return file_written
+        # Remove leading '/'
+        assert url[0] == '/'
+        start = time.perf_counter()
+        filename = action.write_to(self, self.output, url[1:])
+        self.stats.add_time("write", time.perf_counter() - start)
+        return filename
 
     @property
     def needs_reset(self):
@@ -257,6 +624,21 @@ class App():
         for url in self.build_content():
             pass
 
+def route_key(name, params):
+    # Names without params, the common case, are their own key. Param values
+    # are compared as strings, so `page=2` and `page="2"` are the same.
+    if not params:
+        return name
+    return (name,) + tuple(sorted((k, str(v)) for k, v in params.items()))
+
+def generator_label(generator):
+    """Short description of a generator for progress and stats output."""
+    label = type(generator).__name__
+    name = getattr(generator, "name", None) or getattr(generator, "url", None)
+    if name:
+        label += " " + name
+    return label
+
 class _Collections():
     """Passthrough object for handy access in templates."""
 
@@ -267,9 +649,9 @@ class _Collections():
         return filter(lambda g: g.is_collection, self.app._generators)
 
     def __getattr__(self, name):
-        for c in self:
-            if c.name == name:
-                return c
+        c = self.app._named_generators.get(name)
+        if c is not None and c.is_collection:
+            return c
         raise AttributeError('Collection "{}" not found'.format(name))
 
     def __len__(self):
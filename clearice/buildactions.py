@@ -1,18 +1,70 @@
 
 import os
-import shutil
+import gzip
+import tempfile
+import threading
 
+from .helpers import fnmatch_one_of, copy_file
+from .exceptions import ConfigError
+from .output import write_if_changed
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def is_page(view):
+    """If a url_map view produces an HTML page, rather than some other file."""
+    return not isinstance(view, BuildAction) or isinstance(view, Html)
 
 class BuildAction():
 
+    # If true, `do()` is safe to run in a worker thread alongside other
+    # actions. Used for actions that spend most of their time waiting on I/O.
+    parallel = False
+
     def do(self, app, dest):
         raise NotImplementedError()  # pragma: nocover
 
+    def write_to(self, app, output, relpath):
+        """Build into `output` (see `clearice.output`) at `relpath`.
+
+        Returns the name of the file written. By default, runs `do()` for
+        outputs on disk. For other outputs, the file from `source_path()` is
+        referenced, and actions without one are built somewhere temporary.
+        """
+        path = output.local_path(relpath)
+        if path is not None:
+            return self.do(app, path) or path
+
+        source_path = self.source_path(app)
+        if source_path is not None:
+            return output.reference(relpath, source_path)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            dest = os.path.join(tmp_dir, "output")
+            written = self.do(app, dest) or dest
+            with open(written, 'rb') as f:
+                return output.write(relpath, f.read())
+
+    def source_path(self, app):
+        """An existing file with the same content this action outputs.
+
+        Lets the output be served without building it. None if there isn't
+        one.
+        """
+        return None
+
     @staticmethod
     def makedirs(dest):
         dirname = os.path.dirname(dest)
         if not os.path.isdir(dirname):
-            os.makedirs(dirname)
+            os.makedirs(dirname, exist_ok=True)
 
 class File(BuildAction):
 
@@ -20,12 +72,18 @@ class File(BuildAction):
         self.content = content
 
     def do(self, app, dest):
-        self.makedirs(dest)
-        with open(dest, 'w') as f:
-            f.write(self.content)
+        write_if_changed(dest, self.content.encode('utf-8'))
+
+    def write_to(self, app, output, relpath):
+        return output.write(relpath, self.content.encode('utf-8'))
 
 class Html(File):
 
+    def write_to(self, app, output, relpath):
+        if not relpath.endswith('/') and relpath:
+            relpath += '/'
+        return super().write_to(app, output, relpath + 'index.html')
+
     def do(self, app, dest):
 
         # Add index.html filename
@@ -38,35 +96,223 @@ class Html(File):
 
 class Copy(BuildAction):
 
-    def __init__(self, src):
+    parallel = True
+
+    def __init__(self, src, sync=True, from_cache=False):
+        """
+        `sync`: If the destination already has the source's size and mtime,
+            assume it's up to date and leave it alone.
+        `from_cache`: `src` is relative to the cache directory instead of the
+            content directory.
+        """
         self.src = src
+        self.sync = sync
+        self.from_cache = from_cache
+
+        # Set to a `DuplicateGroup` if other copies have the same content
+        self.duplicates = None
+
+    def is_up_to_date(self, src, dest):
+        if not self.sync or os.path.islink(dest) or not os.path.isfile(dest):
+            return False
+        src_st = os.stat(src)
+        dest_st = os.stat(dest)
+        # A hard link to the source would also match, but isn't a copy
+        return src_st.st_size == dest_st.st_size and \
+               src_st.st_mtime_ns == dest_st.st_mtime_ns and \
+               not os.path.samestat(src_st, dest_st)
+
+    def source_path(self, app):
+        if self.from_cache:
+            return app.get_cache_path(self.src)
+        return app.get_content_path(self.src)
 
     def do(self, app, dest):
-        if os.path.exists(dest):
+        src = self.source_path(app)
+
+        if self.duplicates is None:
+            self.copy(app, src, dest)
+            return
+
+        # The first duplicate to run is copied, the rest hard link to it
+        with self.duplicates.lock:
+            first_dest = self.duplicates.first_dest
+            if first_dest is None:
+                self.copy(app, src, dest)
+                self.duplicates.first_dest = dest
+        if first_dest is not None:
+            self.link_duplicate(app, first_dest, dest)
+
+    def link_duplicate(self, app, first_dest, dest):
+        if self.sync and os.path.lexists(dest) and not os.path.islink(dest) \
+                and os.path.samefile(first_dest, dest):
+            app.stats.incr("static files skipped")
+        else:
+            if os.path.lexists(dest):
+                os.remove(dest)
+            self.makedirs(dest)
+            os.link(first_dest, dest)
+            app.stats.incr("static files deduplicated")
+        app.stats.incr("dedupe bytes saved", os.path.getsize(dest))
+
+    def copy(self, app, src, dest):
+        if self.is_up_to_date(src, dest):
+            app.stats.incr("static files skipped")
+            return
+
+        if os.path.lexists(dest):
             os.remove(dest)
         self.makedirs(dest)
-        shutil.copy(app.get_content_path(self.src), dest)
+        method = copy_file(src, dest)
+        app.stats.incr("static files copied")
+        app.stats.incr("files copied with "+method)
+
+class DuplicateGroup():
+    """Copies with identical content, which share one inode in the build."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.first_dest = None  # Build path of the copy made first
 
 class Link(BuildAction):
 
-    def __init__(self, src, hard=False, absolute=False):
+    parallel = True
+
+    def __init__(self, src, hard=False, absolute=False, sync=True):
+        """
+        `sync`: If the destination is already the right link, leave it alone.
+        """
         self.src = src
         self.hard = hard
         self.absolute = absolute
+        self.sync = sync
         if self.hard and self.absolute:
             raise ValueError("Links cannot be both hard and absolute.")
 
+    def get_target(self, src, dest):
+        """What a soft link at `dest` should point to."""
+        if self.absolute:
+            return src
+        return os.path.relpath(src, os.path.dirname(dest))
+
+    def is_up_to_date(self, src, dest):
+        if not self.sync or not os.path.lexists(dest):
+            return False
+        if self.hard:
+            return not os.path.islink(dest) and os.path.samefile(src, dest)
+        return os.path.islink(dest) and os.readlink(dest) == self.get_target(src, dest)
+
+    def source_path(self, app):
+        return app.get_content_path(self.src)
+
     def do(self, app, dest):
-        if os.path.exists(dest):
+        src = self.source_path(app)
+        if self.is_up_to_date(src, dest):
+            app.stats.incr("static files skipped")
+            return
+
+        if os.path.lexists(dest):
             os.remove(dest)
         self.makedirs(dest)
 
         if self.hard:
-            os.link(app.get_content_path(self.src), dest)
-        elif self.absolute:
-            os.symlink(app.get_content_path(self.src), dest)
+            os.link(src, dest)
         else:
-            os.symlink(
-                os.path.relpath(app.get_content_path(self.src), os.path.dirname(dest)),
-                dest
-            )
+            os.symlink(self.get_target(src, dest), dest)
+        app.stats.incr("static files linked")
+
+def _gzip_compress(data, level):
+    # mtime=0 so output only depends on the input
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+def _brotli_compress(data, level):
+    return brotli.compress(data, quality=min(level, 11))
+
+def _zstd_compress(data, level):
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+# Maps format name to (file extension, compress function, module available)
+COMPRESSION_FORMATS = {
+    "gzip": (".gz", _gzip_compress, True),
+    "br": (".br", _brotli_compress, brotli is not None),
+    "zstd": (".zst", _zstd_compress, zstandard is not None),
+}
+
+class Compressor():
+    """Writes pre-compressed siblings (like "index.html.gz") of built files.
+
+    This is an output stage run on files after a build action writes them, so
+    web servers can serve the compressed sibling directly (nginx's
+    `gzip_static`, for example). Compressed files get the same mtime as their
+    source, so unchanged outputs are not compressed again on the next build.
+    """
+
+    DEFAULT_PATTERNS = ["*.html", "*.css", "*.js", "*.svg"]
+
+    def __init__(self, patterns=None, level=9, formats=None, workers=None, **kwargs):
+        self.patterns = self.DEFAULT_PATTERNS if patterns is None else patterns
+        self.level = level
+        self.formats = ["gzip"] if formats is None else formats
+        self.workers = workers
+
+        if not isinstance(self.patterns, list) or False in [isinstance(p, str) for p in self.patterns]:
+            raise ConfigError(None, "compress patterns must be a list of strings")
+        if not isinstance(self.level, int) or isinstance(self.level, bool) or not 1 <= self.level <= 9:
+            raise ConfigError(None, "compress level must be an integer from 1 to 9")
+        if self.workers is not None and (not isinstance(self.workers, int) or self.workers < 1):
+            raise ConfigError(None, "compress workers must be a positive integer")
+        if not isinstance(self.formats, list):
+            raise ConfigError(None, "compress formats must be a list")
+        for fmt in self.formats:
+            if fmt not in COMPRESSION_FORMATS:
+                raise ConfigError(None, 'Unrecognized compress format "{}", must '
+                        'be one of: {}'.format(fmt, ", ".join(sorted(COMPRESSION_FORMATS))))
+            if not COMPRESSION_FORMATS[fmt][2]:
+                raise ConfigError(None, 'compress format "{}" requires the "{}" '
+                        'module to be installed'.format(fmt, "brotli" if fmt == "br" else "zstandard"))
+
+        if kwargs:
+            key = list(kwargs.keys())[0]
+            raise ConfigError(None, 'Unexpected field "{}" in compress config'.format(key))
+
+    @classmethod
+    def from_conf(cls, yaml_file, data):
+        if data is True:
+            data = {}
+        if not isinstance(data, dict):
+            raise ConfigError(yaml_file, 'Expected compress option to be a dict, got "{}"'.format(type(data)))
+        try:
+            return cls(**data)
+        except ConfigError as e:
+            # Re-raise after adding yaml_file info
+            e.filename = yaml_file
+            raise e
+
+    def matches(self, path):
+        return fnmatch_one_of(os.path.basename(path), self.patterns)
+
+    def sibling_paths(self, path):
+        return [path + COMPRESSION_FORMATS[fmt][0] for fmt in self.formats]
+
+    def compress(self, path):
+        """Write compressed siblings of `path`, returning how many were written.
+
+        Siblings whose mtime matches `path` are up to date and skipped.
+        """
+        src_mtime = os.stat(path).st_mtime_ns
+        data = None
+        n_written = 0
+        for fmt in self.formats:
+            ext, compress_func, _ = COMPRESSION_FORMATS[fmt]
+            dest = path + ext
+            if os.path.isfile(dest) and os.stat(dest).st_mtime_ns == src_mtime:
+                continue
+
+            if data is None:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            with open(dest, 'wb') as f:
+                f.write(compress_func(data, self.level))
+            os.utime(dest, ns=(src_mtime, src_mtime))
+            n_written += 1
+        return n_written
@@ -0,0 +1,64 @@
+"""Caches kept between builds in the cache directory (`App.cache_dir`)."""
+
+import os
+import json
+import hashlib
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_file(abspath):
+    """Hex SHA-256 digest of a file's contents."""
+    h = hashlib.sha256()
+    with open(abspath, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        try:
+            return json.load(f)
+        except ValueError:
+            # A corrupt cache is just a cold cache
+            return default
+
+def write_json(path, data):
+    """Write JSON atomically, so an interrupted build can't corrupt it."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class FileHashCache():
+    """Content hashes of files, reused while a file's size and mtime match.
+
+    Call `save()` to persist new hashes for the next build.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = read_json(path, {})  # Maps abspath to [size, mtime_ns, hash]
+        self.n_hashed = 0
+        self.dirty = False
+
+    def hash(self, abspath):
+        st = os.stat(abspath)
+        entry = self.entries.get(abspath)
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+
+        digest = hash_file(abspath)
+        self.entries[abspath] = [st.st_size, st.st_mtime_ns, digest]
+        self.n_hashed += 1
+        self.dirty = True
+        return digest
+
+    def save(self):
+        if self.dirty:
+            write_json(self.path, self.entries)
+            self.dirty = False
@@ -1,5 +1,6 @@
 
 import sys
+import json
 import argparse
 import os
 from contextlib import contextmanager
@@ -7,14 +8,26 @@ from contextlib import contextmanager
 from click import progressbar
 
 from .app import App
-from .exceptions import ClearIceException
+from .exceptions import ClearIceException, ShardError
+from .stats import format_bytes
+from . import shards
 
-def get_app(args):
-    kwargs = {}
+def get_app(args, **kwargs):
     if args.build_dir:
         kwargs['build_dir'] = args.build_dir
+    if 'shard' in args and args.shard:
+        kwargs['shard'] = args.shard
+        kwargs['manifest_path'] = args.manifest
+    if 'trace_memory' in args:
+        kwargs['trace_memory'] = args.trace_memory or bool(args.top_allocations)
     return App(root_dir=args.root, **kwargs)
 
+def shard_arg(s):
+    try:
+        return shards.parse_shard(s)
+    except ShardError as e:
+        raise argparse.ArgumentTypeError(e.msg)
+
 @contextmanager
 def print_errors(exit_on_error=True):
     try:
@@ -25,6 +38,11 @@ def print_errors(exit_on_error=True):
             sys.exit(-1)
 
 def cmd_generate(args, quiet=False):
+    show_stats = 'stats' in args and args.stats
+    json_stats = show_stats and args.json
+
+    # Keep stdout parsable when printing JSON
+    quiet = quiet or json_stats
 
     app = get_app(args)
     app.print_progress = not quiet
@@ -35,58 +53,118 @@ def cmd_generate(args, quiet=False):
         app.generate_urls()
         prog = progressbar(
             app.build_content(),
-            length=app.n_urls,
+            length=len(app.build_urls),
             label="Rendering Pages",
             item_show_func=lambda page: page,
         )
         with prog as urls:
             for url in urls:
                 pass
-        print("Generated {} pages".format(app.n_urls))
+        if app.shard:
+            print("Generated {} of {} pages for shard {}/{}".format(
+                len(app.build_urls), app.n_urls, *app.shard))
+        else:
+            print("Generated {} pages".format(app.n_urls))
+
+        counters = app.stats.counters
+        static_counts = [counters.get("static files "+name, 0)
+                         for name in ("copied", "linked", "skipped")]
+        if any(static_counts):
+            print("Static files: {} copied, {} linked, {} unchanged".format(*static_counts))
+        if counters.get("dedupe bytes saved"):
+            print("Deduplicated static files: saved {}".format(
+                format_bytes(counters["dedupe bytes saved"])))
+
+        before = app.stats.counters.get("html bytes before minify")
+        if before:
+            saved = before - app.stats.counters["html bytes after minify"]
+            print("Minified HTML: saved {} ({:.1f}%)".format(
+                format_bytes(saved), 100 * saved / before))
+
+    if show_stats:
+        print_stats(app, args.top_allocations, json_stats)
+
+def print_stats(app, top_allocations=0, as_json=False):
+    top = app.stats.top_allocations(top_allocations) if top_allocations else []
+    app.stats.stop()
+
+    if as_json:
+        data = app.stats.as_dict()
+        data["top_allocations"] = top
+        print(json.dumps(data, indent=2))
+        return
+
+    print()
+    print(app.stats.format())
+    if top:
+        print()
+        print("Top allocation sites:")
+        for site in top:
+            print("  {filename}:{lineno}: {size} bytes in {count} blocks".format(**site))
+
+def cmd_merge_shards(args):
+    build_dir = get_app(args).build_dir
+    n_files = shards.merge_shards(args.shard_dirs, build_dir)
+    print("Merged {} files from {} shards".format(n_files, len(args.shard_dirs)))
 
 def cmd_watch(args, serve=False):
     import time
-    from watchdog.observers import Observer
-    from watchdog.events import FileSystemEventHandler
-
-    class EventHandler(FileSystemEventHandler):
-
-        def __init__(self, build_dir):
-            self.build_dir = build_dir
-            self.last_gen_time = 0
-            self.build_timeout = 0.5
-
-        def on_any_event(self, event):
-            if event.src_path.startswith(self.build_dir):
-                return
-
-            t = time.time()
-            if t - self.last_gen_time >= self.build_timeout:
-                time.sleep(0.2)
-                self.last_gen_time = t
-                self.generate()
-
-        def generate(self):
-            print()
-            print("Rebuilding...")
-            with print_errors(exit_on_error=False):
-                cmd_generate(args, quiet=True)
-            print("Done")
-
-    # Find out what build dir will be by instantiating app
-    build_dir = get_app(args).build_dir
+    from .incremental import IncrementalBuilder
+    from .watch import BuildScheduler, ChangeHandler, make_observer
+
+    def build(changed_paths):
+        print()
+        print("Rebuilding...")
+        with print_errors(exit_on_error=False):
+            if on_demand:
+                site.reload(changed_paths)
+            else:
+                n_built = builder.build(changed_paths)
+                print("Built {} urls".format(n_built))
+            if live_reload:
+                live_reload.notify(site)
+        print("Done")
 
-    handler = EventHandler(build_dir)
-    handler.generate()
+    on_demand = serve and args.on_demand
+    in_memory = serve and not on_demand and args.in_memory
 
-    observer = Observer()
-    observer.schedule(handler, args.root, recursive=True)
+    # One app is kept between builds, which only redo what changed
+    output = None
+    if in_memory:
+        from .output import MemoryOutput
+        output = MemoryOutput()
+    app = get_app(args, output=output)
+    builder = IncrementalBuilder(app)
+
+    site = None
+    live_reload = None
+    if on_demand:
+        # Render pages as they're requested, rather than building the site
+        from .server import OnDemandSite
+        site = OnDemandSite(app)
+    elif in_memory:
+        from .server import MemorySite
+        site = MemorySite(output)
+    elif serve:
+        from .server import DirectorySite
+        site = DirectorySite(app.build_dir)
+    if serve and not args.no_live_reload:
+        from .server import LiveReload
+        live_reload = LiveReload()
+
+    # Builds run on a worker thread, and restart when files change mid-build
+    scheduler = BuildScheduler(build)
+    app.cancel_event = scheduler.cancel_event
+    scheduler.start()
+    if not on_demand:
+        scheduler.add_changes(None)
+
+    observer = make_observer(app, ChangeHandler(app, scheduler))
     observer.start()
 
     if serve:
-        from http.server import HTTPServer, SimpleHTTPRequestHandler
-        os.chdir(build_dir)
-        server = HTTPServer((args.bind, args.port), SimpleHTTPRequestHandler)
+        from .server import make_server
+        server = make_server(site, args.bind, args.port, live_reload=live_reload)
 
     try:
         if serve:
@@ -96,7 +174,10 @@ def cmd_watch(args, serve=False):
                 time.sleep(1)
     except KeyboardInterrupt:
         observer.stop()
+        scheduler.stop()
         if serve:
+            if live_reload:
+                live_reload.close()
             server.server_close()
     observer.join()
 
@@ -119,8 +200,32 @@ def main():
     gen_parser = subparsers.add_parser('generate',
         aliases=('gen',),
         help='Generate a static site (default)')
+    gen_parser.add_argument("--shard", metavar="i/N", type=shard_arg,
+        help="Only render the i-th of N deterministic portions of the site. "
+        "Combine the outputs afterwards with merge-shards.")
+    gen_parser.add_argument("--manifest", metavar="PATH", default=None,
+        help="Build manifest from a previous merged build, used to balance "
+        "shards by render time. (default: the one in the build directory)")
+    gen_parser.add_argument("--stats", action="store_true",
+        help="Print time and memory used by each phase of the build.")
+    gen_parser.add_argument("--json", action="store_true",
+        help="With --stats, print statistics as JSON instead of a table.")
+    gen_parser.add_argument("--trace-memory", action="store_true",
+        help="With --stats, record peak allocated memory per phase. Slows "
+        "down the build.")
+    gen_parser.add_argument("--top-allocations", metavar="N", type=int, default=0,
+        help="With --stats, list the N source lines holding the most memory "
+        "at the end of the build. Implies --trace-memory.")
     gen_parser.set_defaults(func=cmd_generate)
 
+    # Merge Shards Command Parser
+    merge_parser = subparsers.add_parser('merge-shards',
+        help='Combine the outputs of "generate --shard" into the build '
+        'directory, removing stale files.')
+    merge_parser.add_argument("shard_dirs", metavar="SHARD_DIR", nargs='+',
+        help="Build directory of each shard.")
+    merge_parser.set_defaults(func=cmd_merge_shards)
+
     # Watch Command Parser
     watch_parser = subparsers.add_parser('watch',
         help='Re-generate site whenever files in the current directory change.')
@@ -134,6 +239,14 @@ def main():
         help="Port to listen on (defalut: 8000)")
     serve_parser.add_argument("--bind", "-b", metavar="ADDRESS", default='localhost',
         help="Bind address to listen on (defalut: localhost)")
+    serve_parser.add_argument("--on-demand", action="store_true",
+        help="Render pages when they are requested instead of building the "
+        "whole site first. Nothing is written to the build directory.")
+    serve_parser.add_argument("--in-memory", action="store_true",
+        help="Keep the built site in memory instead of writing it to the "
+        "build directory. Static files are served from the content directory.")
+    serve_parser.add_argument("--no-live-reload", action="store_true",
+        help="Don't reload pages open in the browser when they change.")
     serve_parser.set_defaults(func=cmd_serve)
 
     # Help Command Parser
@@ -33,6 +33,22 @@ class ConfigError(ClearIceException):
 
 class UrlConflictError(ClearIceException): pass
 
+# Not an error, so not a `ClearIceException`
+class BuildCancelled(Exception):
+    """Raised in a build after `App.cancel_event` is set."""
+
+class ShardError(ClearIceException):
+
+    def __init__(self, msg, filename=None):
+        self.msg = msg
+        self.filename = filename
+
+    def __str__(self):
+        if self.filename:
+            return 'Shard error in "{}"\n{}'.format(self.filename, self.msg)
+        else:
+            return 'Shard error: {}'.format(self.msg)
+
 class TemplateError(ClearIceException):
     #TODO: Include context? It's helpful on variable undefined error.
 
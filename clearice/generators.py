@@ -1,17 +1,42 @@
 import os
+import datetime
+import threading
 
 import yaml
 from jinja2 import Template
 import jinja2.exceptions
 from hfilesize import FileSize
 
-from .helpers import normalize_url, remove_prefix, remove_extension
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from .helpers import normalize_url, remove_prefix, remove_extension, fnmatch_one_of, slugify
 from .exceptions import ConfigError, YamlError, UrlConflictError
+from .cache import read_json, write_json
 from . import views, buildactions
 
 MARKDOWN_EXTENSIONS = [".md", ".markdown"]
 MARKDOWN_FILES = list("*"+ext for ext in MARKDOWN_EXTENSIONS)
 
+# Maps image format names to (Pillow format, file extension). "original"
+# keeps the format of the source image.
+IMAGE_FORMATS = {
+    "original": (None, None),
+    "webp": ("WEBP", ".webp"),
+    "jpeg": ("JPEG", ".jpg"),
+    "png": ("PNG", ".png"),
+}
+
+
+def route_name(relpath):
+    """Name for `App.add_url()` of a page made from content file `relpath`."""
+    return remove_extension(relpath).strip('/')
+
+def url_path_name(path):
+    """Name for `App.add_url()` from a url-like path, "/a//b/" -> "a/b"."""
+    return "/".join(part for part in path.split("/") if part)
 
 class GeneratorBase():
     """Base class for content generators.
@@ -46,9 +71,52 @@ class MarkdownGenerator(GeneratorBase):
         for abspath, relpath in files:
             url = normalize_url(remove_extension(relpath))
             view = views.MarkdownView(abspath, app, url)
-            app.add_url(url, view)
+            app.add_url(url, view, name=route_name(relpath))
             app.consume(abspath)
 
+def _year_key(date):
+    return date.year
+
+def _month_key(date):
+    return (date.year, date.month)
+
+def sort_key(value):
+    return str(value).lower()
+
+def typed_sort_key(value):
+    """Sort key that compares numbers and dates by value rather than as text.
+
+    Values of different types can't be compared directly, so they are grouped:
+    missing values first, then numbers, dates, and everything else as
+    case-insensitive text.
+    """
+    if value is None:
+        return (0,)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, datetime.datetime):
+        seconds = value.hour * 3600 + value.minute * 60 + value.second
+        return (2, value.toordinal(), seconds, value.microsecond)
+    if isinstance(value, datetime.date):
+        return (2, value.toordinal(), 0, 0)
+    return (3, str(value).lower())
+
+class _Descending():
+    """Wraps a sort key to reverse its order."""
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+def check_paginate(yaml_path, paginate):
+    if paginate is not None and (not isinstance(paginate, int) or
+            isinstance(paginate, bool) or paginate < 1):
+        raise ConfigError(yaml_path, '"paginate" option must be a positive '
+                'number of items per page')
+
 class Collection(GeneratorBase):
     #TODO: Describe collections and yaml data.
 
@@ -63,6 +131,8 @@ class Collection(GeneratorBase):
         self.url = url
         self.yaml_path = yaml_path
         self.items = []
+        self._indexes = {}  # Query results, cached until items change
+        self._url_template = None
 
         self.read_yaml_data()
 
@@ -83,6 +153,7 @@ class Collection(GeneratorBase):
         # Register static pages
         if not isinstance(self.pages, list):
             raise ConfigError(self.yaml_path, '"pages" field must be a list')
+        self.paginated_pages = []
         for page in self.pages:
             self.register_page(page)
 
@@ -93,23 +164,112 @@ class Collection(GeneratorBase):
         )
         for abspath, relpath in files:
             if self.file_is_item(app, abspath, relpath):
-                view = views.MarkdownView(abspath, app, collection=self)
-                if view.context.get('url', None):
-                    url = normalize_url(view.context['url'])
+                item = views.CollectionItem(abspath, app, self)
+                if item.frontmatter.get('url', None):
+                    url = normalize_url(item.frontmatter['url'])
                 else:
-                    url = self.file_to_url(app, view, abspath, relpath)
-                view.set_url(url)
+                    url = self.file_to_url(app, item, abspath, relpath)
+                item.set_url(url)
 
-                self.items.append(view)
+                self.items.append(item)
                 app.consume(abspath)
-                app.add_url(url, view)
-
-        # Sort items
-        if self.item_order:
-            def sortfunc(item):
-                value = item.context.get(self.item_order, "")
-                return str(value).lower()
-            self.items = list(sorted(self.items, key=sortfunc))
+                app.add_url(url, item, name=route_name(relpath))
+
+        self.sort_items()
+
+        self.register_paginated_pages()
+        for taxonomy in self.taxonomies.values():
+            taxonomy.register(app)
+
+    def item_sort_key(self, item):
+        key = typed_sort_key(item.get(self.order_field))
+        key = (key, item.url or "")  # Ties are broken by url
+        return _Descending(key) if self.order_descending else key
+
+    def sort_items(self):
+        """Sort items by the "order" field, computing each key only once."""
+        if self.order_field:
+            keys = [self.item_sort_key(item) for item in self.items]
+            order = sorted(range(len(keys)), key=keys.__getitem__)
+            self.items = [self.items[i] for i in order]
+        self._indexes = {}
+
+    def _index(self, key, build):
+        index = self._indexes.get(key)
+        if index is None:
+            index = self._indexes[key] = build()
+        return index
+
+    def _field_index(self, field):
+        # Maps each value of `field` to the items with that value, in
+        # collection order. Items with a list value are indexed under each
+        # element, so `where(tags="x")` finds items tagged with "x".
+        def build():
+            index = {}
+            for item in self.items:
+                value = item.get(field)
+                values = value if isinstance(value, (list, tuple, set)) else [value]
+                for value in values:
+                    try:
+                        index.setdefault(value, []).append(item)
+                    except TypeError:
+                        pass  # Unhashable values can't be queried
+            return index
+        return self._index(("where", field), build)
+
+    def where(self, **fields):
+        """Items whose context matches all of the given field values.
+
+        Indexes are built on the first query of each field, so repeated
+        queries from many pages cost a dict lookup.
+        """
+        results = None
+        for field, value in fields.items():
+            try:
+                matches = self._field_index(field).get(value, [])
+            except TypeError:
+                matches = []
+            if results is None:
+                results = matches
+            else:
+                ids = set(id(item) for item in matches)
+                results = [item for item in results if id(item) in ids]
+        return list(self.items if results is None else results)
+
+    def values(self, field):
+        """The distinct values of `field` across items, sorted."""
+        return sorted((v for v in self._field_index(field) if v is not None), key=sort_key)
+
+    def _date_groups(self, key, date_field):
+        def build():
+            groups = {}
+            for item in self.items:
+                date = item.get(date_field)
+                if hasattr(date, "year"):
+                    groups.setdefault(key(date), []).append(item)
+            return sorted(groups.items(), reverse=True)
+        return self._index(("date", key, date_field), build)
+
+    def by_year(self, field="date"):
+        """List of `(year, items)` for items with a date, newest first."""
+        return self._date_groups(_year_key, field)
+
+    def by_month(self, field="date"):
+        """List of `((year, month), items)` for items with a date, newest first."""
+        return self._date_groups(_month_key, field)
+
+    def sorted_by(self, field, reverse=False):
+        """Items sorted by `field`. Items without the field come last."""
+        def build():
+            present = [item for item in self.items if item.get(field) is not None]
+            missing = [item for item in self.items if item.get(field) is None]
+            try:
+                present.sort(key=lambda item: item.get(field), reverse=reverse)
+            except TypeError:
+                # Mixed types, compare as strings instead
+                present.sort(key=lambda item: sort_key(item.get(field)), reverse=reverse)
+            return present + missing
+        return self._index(("sorted", field, reverse), build)
 
     def file_is_item(self, app, abspath, relpath):
         # If `self.url` is in "/blog/", then "/blog/foo.md" and
@@ -125,8 +285,9 @@ class Collection(GeneratorBase):
     def file_to_url(self, app, view, abspath, relpath):
         if self.url_format:
             try:
-                template = Template(self.url_format)
-                url = template.render(view.context)
+                if self._url_template is None:
+                    self._url_template = Template(self.url_format)
+                url = self._url_template.render(view.fields())
             except jinja2.exceptions.TemplateError as e:
                 raise ConfigError(self.yaml_path, 'Error with url format: '
                         '{}'.format(e)) from None
@@ -153,7 +314,14 @@ class Collection(GeneratorBase):
         self.pages = data.pop("pages", []) or []
         self.context = data.pop("context", {}) or {}
         self.item_order = data.pop("order", None)
+        # A leading "-" sorts in descending order, like "-date"
+        self.order_field = self.item_order
+        self.order_descending = False
+        if isinstance(self.item_order, str) and self.item_order.startswith('-'):
+            self.order_field = self.item_order[1:]
+            self.order_descending = True
         self.url_format = data.pop("url_format", None)
+        taxonomies = data.pop("taxonomies", []) or []
 
         if self.url_format and self.url_format.startswith('/'):
             raise ConfigError(self.yaml_path, 'Collection url formats are '
@@ -165,6 +333,16 @@ class Collection(GeneratorBase):
             raise ConfigError(self.yaml_path, 'Unexpected fields: '
                     '{}'.format(list(data.keys())))
 
+        if not isinstance(taxonomies, list):
+            raise ConfigError(self.yaml_path, '"taxonomies" field must be a list')
+        self.taxonomies = {}  # Maps field name to `Taxonomy`
+        for conf in taxonomies:
+            taxonomy = Taxonomy.from_conf(self, conf)
+            if taxonomy.field in self.taxonomies:
+                raise ConfigError(self.yaml_path, 'Duplicate taxonomy for field '
+                        '"{}"'.format(taxonomy.field))
+            self.taxonomies[taxonomy.field] = taxonomy
+
     def register_page(self, page):
         if not isinstance(page, dict):
             raise ConfigError(self.yaml_path, 'Expected dict describing '
@@ -172,6 +350,7 @@ class Collection(GeneratorBase):
         title = page.pop("title", None)
         template = page.pop("template", None)
         context = page.pop("context", {})
+        paginate = page.pop("paginate", None)
 
         if title is None:
             raise ConfigError(self.yaml_path, 'Collection pages must have a '
@@ -179,6 +358,7 @@ class Collection(GeneratorBase):
         if not isinstance(title, str):
             raise ConfigError(self.yaml_path, 'Page title must be '
                     'a non-zero length string (not {})'.format(title))
+        check_paginate(self.yaml_path, paginate)
 
         # Unrecognized field error
         if page:
@@ -197,24 +377,190 @@ class Collection(GeneratorBase):
             os.path.abspath(self.app.content_dir),
             self.url[1:] + title + ".md"
         )
-        if os.path.exists(md_path):
-            view = views.MarkdownView(md_path, self.app, url, template, self, context=context)
+        if not os.path.exists(md_path):
+            md_path = None
+        else:
             self.app.consume(md_path)
+
+        if paginate:
+            # Only the first page is known until items are collected
+            self.paginated_pages.append((title, url, md_path, template, context, paginate))
+            paginator = views.Paginator(self, url, paginate, 1)
+            self.add_page_url(title, url, md_path, template, dict(context, paginator=paginator))
+        else:
+            self.add_page_url(title, url, md_path, template, context)
+
+    def register_paginated_pages(self):
+        """Add urls for the pages after the first of paginated pages."""
+        for title, url, md_path, template, context, per_page in self.paginated_pages:
+            n_pages = views.Paginator.count_pages(len(self.items), per_page)
+            for number in range(2, n_pages+1):
+                paginator = views.Paginator(self, url, per_page, number)
+                page_url = paginator.page_url(number)
+                self.add_page_url(title, page_url, md_path, template,
+                        dict(context, paginator=paginator), {"page": number})
+
+    def add_page_url(self, title, url, md_path, template, context, params=None):
+        if md_path:
+            view = views.MarkdownView(md_path, self.app, url, template, self, context=context)
         else:
             context.setdefault("content", "")
             view = views.TemplateView(self.app, url, template, self, context=context)
 
+        # Named like the markdown file the page would have, "blog/index"
+        name = url_path_name(self.url + title)
         try:
-            self.app.add_url(url, view)
+            self.app.add_url(url, view, name=name, params=params)
         except UrlConflictError:
             raise ConfigError(self.yaml_path, 'Page title "{}" with url '
                     '"{}" conflicts with an existing url.'.format(
                     title, url))
 
 
+class TaxonomyTerm():
+    """One value of a taxonomy's field, and the items that have it."""
+
+    def __init__(self, name, url, items):
+        self.name = name
+        self.url = url
+        self.items = items
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __str__(self):
+        return str(self.name)
+
+class Taxonomy():
+    """Pages listing a collection's items by the values of a field.
+
+    Registered by the collection, from the "taxonomies" list in its yaml:
+
+        taxonomies:
+            - field: tags
+              url: tags  # Relative to the collection, defaults to the field
+              template: tag.html
+              index_template: tags.html
+              paginate: 10
+
+    This adds one page per term (`/blog/tags/<term>/`) with `term` in its
+    context, and an index page (`/blog/tags/`) with `taxonomy` in its context.
+    Term urls are slugified, see `term_slugs()`.
+    Items with a list value, like `tags: [a, b]`, appear under each element.
+    """
+
+    def __init__(self, collection, field, url=None, template=None,
+                 index_template=None, paginate=None):
+        self.collection = collection
+        self.field = field
+        self.url = normalize_url(collection.url + (url or field))
+        self.template = template
+        self.index_template = index_template
+        self.paginate = paginate
+        self.terms = []
+        self._terms_by_name = {}
+
+    @classmethod
+    def from_conf(cls, collection, conf):
+        yaml_path = collection.yaml_path
+        if not isinstance(conf, dict):
+            raise ConfigError(yaml_path, 'Expected dict describing taxonomy, '
+                    'got "{}"'.format(type(conf)))
+        conf = dict(conf)
+        field = conf.pop("field", None)
+        if not isinstance(field, str) or not field:
+            raise ConfigError(yaml_path, 'Taxonomies must have a "field"')
+        url = conf.pop("url", None)
+        if url is not None and (not isinstance(url, str) or url.startswith('/')):
+            raise ConfigError(yaml_path, 'Taxonomy url must be a string relative '
+                    'to the collection (got "{}")'.format(url))
+        kwargs = {
+            "template": conf.pop("template", None),
+            "index_template": conf.pop("index_template", None),
+            "paginate": conf.pop("paginate", None),
+        }
+        check_paginate(yaml_path, kwargs["paginate"])
+        if conf:
+            raise ConfigError(yaml_path, 'Unexpected fields in taxonomy: '
+                    '{}'.format(list(conf.keys())))
+        return cls(collection, field, url, **kwargs)
+
+    @staticmethod
+    def term_slugs(names):
+        """Maps each term name to a unique slug for its url.
+
+        Names that slugify the same, like "C" and "C++", get "-2", "-3", ...
+        added in the order given. Names without any word characters are
+        slugified as "term".
+        """
+        slugs = {}
+        used = set()
+        for name in names:
+            base = slugify(name) or "term"
+            slug = base
+            n = 1
+            while slug in used:
+                n += 1
+                slug = "{}-{}".format(base, n)
+            used.add(slug)
+            slugs[name] = slug
+        return slugs
+
+    def __getitem__(self, name):
+        return self._terms_by_name[name]
+
+    def __iter__(self):
+        return iter(self.terms)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def register(self, app):
+        # The collection's field index is the inverted index: one pass over
+        # the items finds every term.
+        index = self.collection._field_index(self.field)
+        # Ties are broken so slugs don't depend on the order of items
+        names = sorted((name for name in index if name is not None),
+                       key=lambda name: (sort_key(name), str(name)))
+        slugs = self.term_slugs(names)
+        self.terms = [TaxonomyTerm(name, normalize_url(self.url + slugs[name]), index[name])
+                      for name in names]
+        self._terms_by_name = dict((term.name, term) for term in self.terms)
+
+        self.add_url(app, self.url, self.index_template, {"taxonomy": self})
+        for term in self.terms:
+            context = {"taxonomy": self, "term": term}
+            params = {"term": term.name}
+            if not self.paginate:
+                self.add_url(app, term.url, self.template, context, params)
+                continue
+            n_pages = views.Paginator.count_pages(len(term.items), self.paginate)
+            for number in range(1, n_pages+1):
+                paginator = views.Paginator(term, term.url, self.paginate, number)
+                if number > 1:
+                    params = {"term": term.name, "page": number}
+                self.add_url(app, paginator.page_url(number), self.template,
+                        dict(context, paginator=paginator), params)
+
+    def add_url(self, app, url, template, context, params=None):
+        """Add a taxonomy page, named like "blog/tags" plus `params`."""
+        context["content"] = ""
+        view = views.TemplateView(app, url, template, self.collection, context=context)
+        try:
+            app.add_url(url, view, name=url_path_name(self.url), params=params)
+        except UrlConflictError:
+            raise ConfigError(self.collection.yaml_path, 'Taxonomy "{}" url '
+                    '"{}" conflicts with an existing url.'.format(
+                    self.field, url)) from None
+
+
 class StaticFileGeneraor(GeneratorBase):
 
-    def __init__(self, patterns=None, link=None, link_above=None, link_type="soft", **kwargs):
+    def __init__(self, patterns=None, link=None, link_above=None, link_type="soft",
+                 fingerprint=False, sync=True, dedupe=False, **kwargs):
         self.patterns = patterns or []
         self.link = link_above is not None if link is None else link
         try:
@@ -223,12 +569,28 @@ class StaticFileGeneraor(GeneratorBase):
             raise ConfigError(None, "Unrecognized file size: {}".format(link_above))
         self.link_type = link_type
 
+        # Either a bool, or a list of patterns of files to fingerprint
+        self.fingerprint = fingerprint
+
+        # Skip files already up to date in the build directory
+        self.sync = sync
+
+        # Hard link copies with identical content to each other
+        self.dedupe = dedupe
+
         if not isinstance(self.link, bool):
             raise ConfigError(None, "static link option must be true or false")
         if self.link_type not in ("hard", "soft"):
             raise ConfigError(None, 'Unrecognized link_type "geort", must be "soft" or "hard"')
         if not isinstance(self.patterns, list) or False in [isinstance(p, str) for p in self.patterns]:
             raise ConfigError(None, "static patterns must be a list of strings")
+        if not isinstance(self.fingerprint, (bool, list)) or \
+                isinstance(self.fingerprint, list) and False in [isinstance(p, str) for p in self.fingerprint]:
+            raise ConfigError(None, "static fingerprint option must be true, false or a list of strings")
+        if not isinstance(self.sync, bool):
+            raise ConfigError(None, "static sync option must be true or false")
+        if not isinstance(self.dedupe, bool):
+            raise ConfigError(None, "static dedupe option must be true or false")
 
         if kwargs:
             key = list(kwargs.keys())[0]
@@ -246,11 +608,59 @@ class StaticFileGeneraor(GeneratorBase):
             raise e
 
     def __call__(self, app):
+        copies = []
         for abspath, relpath in app.walk_content(patterns=self.patterns):
             app.consume(abspath)
+            relpath = remove_prefix(relpath, '/')
+            name = relpath
+            if self.should_fingerprint(relpath):
+                relpath = self.fingerprint_path(relpath, app.hash_cache.hash(abspath))
             url = normalize_url(relpath)
             action = self.get_action(abspath)
-            app.add_url(url, action)
+            app.add_url(url, action, name=name)
+            app.add_asset(abspath, '/' + relpath)
+            if isinstance(action, buildactions.Copy):
+                copies.append((abspath, action))
+
+        if self.dedupe:
+            self.find_duplicates(app, copies)
+
+    @staticmethod
+    def find_duplicates(app, copies):
+        """Put copies with identical content into shared `DuplicateGroup`s."""
+
+        # Only files of the same size can be duplicates, so only those need
+        # to be hashed.
+        by_size = {}
+        for abspath, action in copies:
+            by_size.setdefault(os.path.getsize(abspath), []).append((abspath, action))
+
+        for same_size in by_size.values():
+            if len(same_size) < 2:
+                continue
+            by_hash = {}
+            for abspath, action in same_size:
+                by_hash.setdefault(app.hash_cache.hash(abspath), []).append(action)
+            for actions in by_hash.values():
+                if len(actions) > 1:
+                    group = buildactions.DuplicateGroup()
+                    for action in actions:
+                        action.duplicates = group
+
+    def should_fingerprint(self, relpath):
+        if isinstance(self.fingerprint, list):
+            return fnmatch_one_of(os.path.basename(relpath), self.fingerprint)
+        return self.fingerprint
+
+    @staticmethod
+    def fingerprint_path(relpath, digest):
+        """Insert a short content hash before the extension.
+
+        "css/style.css" -> "css/style.3f2a9c1e.css"
+        """
+        dirname, filename = os.path.split(relpath)
+        base, ext = os.path.splitext(filename)
+        return os.path.join(dirname, "{}.{}{}".format(base, digest[:8], ext))
 
     def get_action(self, abspath):
         if self.link:
@@ -260,7 +670,191 @@ class StaticFileGeneraor(GeneratorBase):
                 size = float('inf')
             if size > self.link_above:
                 is_hard = self.link_type=='hard'
-                return buildactions.Link(abspath, hard=is_hard)
+                return buildactions.Link(abspath, hard=is_hard, sync=self.sync)
 
         # Default to copy
-        return buildactions.Copy(abspath)
+        return buildactions.Copy(abspath, sync=self.sync)
+
+
+def make_image_derivative(src, dest, width, fmt, quality):
+    """Save `src` resized to `width` pixels wide to `dest` in format `fmt`."""
+    with Image.open(src) as image:
+        save_format = IMAGE_FORMATS[fmt][0] or image.format
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+        if save_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        # Images with the same content share `dest`, and may be made at once
+        tmp_path = "{}.{}-{}.tmp".format(dest, os.getpid(), threading.get_ident())
+        image.save(tmp_path, format=save_format, quality=quality)
+        os.replace(tmp_path, dest)
+
+class ImageVariant(buildactions.Copy):
+    """Publishes a variant of an image from the cache, making it first if it
+    isn't cached yet."""
+
+    def __init__(self, generator, src, cache_relpath, width, fmt):
+        super().__init__(cache_relpath, from_cache=True)
+        self.generator = generator
+        self.image_src = src
+        self.width = width
+        self.format = fmt
+        self.parallel = generator.workers != 0
+
+    def source_path(self, app):
+        cache_path = super().source_path(app)
+        if not os.path.exists(cache_path):
+            self.generator.make(app, self.image_src, cache_path, self.width, self.format)
+        return cache_path
+
+class ImageGenerator(GeneratorBase):
+    """Adds resized and re-encoded variants of images.
+
+    For "photos/cat.jpg" with widths [480, 960], this adds urls like
+    "/photos/cat.jpg.480w.jpg" and "/photos/cat.jpg.960w.webp". Images are not
+    consumed, so the originals can still be published by the static file
+    generator. Images are never scaled up: widths larger than the image are
+    replaced by the image's own width.
+
+    Variants are made when their url is built, so sharded builds and the
+    on-demand server only make the ones they publish. They run on the static
+    file thread pool, and are cached in the cache directory by source hash
+    and parameters, so only new or changed images are processed. Cached
+    variants no image uses anymore are removed. The `srcset()` template
+    global lists the variants of an image.
+    """
+
+    DEFAULT_PATTERNS = ["*.jpg", "*.jpeg", "*.png"]
+
+    def __init__(self, patterns=None, widths=None, formats=None, quality=80, workers=None, **kwargs):
+        self.patterns = self.DEFAULT_PATTERNS if patterns is None else patterns
+        self.widths = [480, 960, 1920] if widths is None else widths
+        self.formats = ["original", "webp"] if formats is None else formats
+        self.quality = quality
+        # Most images made at once, or 0 to make them in the rendering thread
+        self.workers = workers
+        self.variants = {}  # Maps content-relative path to [(format, width, url), ...]
+
+        if Image is None:
+            raise ConfigError(None, 'The images option requires Pillow to be installed')
+        if not isinstance(self.patterns, list) or False in [isinstance(p, str) for p in self.patterns]:
+            raise ConfigError(None, "images patterns must be a list of strings")
+        if not isinstance(self.widths, list) or not self.widths or \
+                False in [isinstance(w, int) and w > 0 for w in self.widths]:
+            raise ConfigError(None, "images widths must be a list of positive integers")
+        if not isinstance(self.formats, list) or not self.formats:
+            raise ConfigError(None, "images formats must be a list")
+        for fmt in self.formats:
+            if fmt not in IMAGE_FORMATS:
+                raise ConfigError(None, 'Unrecognized images format "{}", must be one '
+                        'of: {}'.format(fmt, ", ".join(sorted(IMAGE_FORMATS))))
+        if not isinstance(self.quality, int) or not 1 <= self.quality <= 100:
+            raise ConfigError(None, "images quality must be an integer from 1 to 100")
+        if self.workers is not None and (not isinstance(self.workers, int) or self.workers < 0):
+            raise ConfigError(None, "images workers must be a non-negative integer")
+        self._workers_semaphore = threading.BoundedSemaphore(workers) if workers else None
+
+        if kwargs:
+            key = list(kwargs.keys())[0]
+            raise ConfigError(None, 'Unexpected field "{}" in images config'.format(key))
+
+    @classmethod
+    def from_conf(cls, yaml_file, data):
+        if not isinstance(data, dict):
+            raise ConfigError(yaml_file, 'Expected images option to be a dict, got "{}"'.format(type(data)))
+        try:
+            return cls(**data)
+        except ConfigError as e:
+            # Re-raise after adding yaml_file info
+            e.filename = yaml_file
+            raise e
+
+    def __call__(self, app):
+        self.app = app
+        app.add_template_global(self.srcset, "srcset")
+
+        sizes_path = app.get_cache_path("images/sizes.json")
+        sizes = read_json(sizes_path, {})  # Maps source hash to [width, height]
+        n_sizes = len(sizes)
+        used_cache_paths = set()
+        digests = set()
+
+        for abspath, relpath in app.walk_content(patterns=self.patterns):
+            relpath = remove_prefix(relpath, '/')
+            digest = app.hash_cache.hash(abspath)
+            digests.add(digest)
+            if digest not in sizes:
+                with Image.open(abspath) as image:
+                    sizes[digest] = list(image.size)
+
+            src_ext = os.path.splitext(relpath)[1]
+            variants = self.variants[relpath] = []
+            for width in self.widths_for(sizes[digest][0]):
+                urls = {}  # Maps extension to url, for formats with the same one
+                for fmt in self.formats:
+                    ext = IMAGE_FORMATS[fmt][1] or src_ext
+                    if ext.lower() in urls:
+                        variants.append((fmt, width, urls[ext.lower()]))
+                        continue
+                    cache_relpath = "images/{}-{}w-q{}{}".format(digest, width, self.quality, ext)
+                    cache_path = app.get_cache_path(cache_relpath)
+                    used_cache_paths.add(cache_path)
+
+                    # The source's extension keeps "cat.png" and "cat.jpg" apart
+                    url = urls[ext.lower()] = "/{}.{}w{}".format(relpath, width, ext)
+                    variants.append((fmt, width, url))
+                    app.add_url(normalize_url(url),
+                            ImageVariant(self, abspath, cache_relpath, width, fmt),
+                            name=relpath, params={"width": width, "format": fmt})
+
+        if len(sizes) != n_sizes or len(sizes) != len(digests):
+            write_json(sizes_path, {d: size for d, size in sizes.items() if d in digests})
+        self.prune_cache(app, used_cache_paths | {sizes_path})
+
+    @staticmethod
+    def prune_cache(app, used_paths):
+        """Remove cached derivatives of images that were deleted or changed."""
+        cache_dir = app.get_cache_path("images")
+        if not os.path.isdir(cache_dir):
+            return
+        stale = [os.path.join(cache_dir, filename) for filename in os.listdir(cache_dir)
+                 if os.path.join(cache_dir, filename) not in used_paths]
+        for path in stale:
+            os.remove(path)
+        if stale:
+            app.stats.incr("image derivatives removed", len(stale))
+
+    def widths_for(self, image_width):
+        widths = set(w for w in self.widths if w < image_width)
+        if max(self.widths) >= image_width:
+            widths.add(image_width)
+        return sorted(widths)
+
+    def make(self, app, src, dest, width, fmt):
+        """Make a variant of image `src` at `dest`. Called by `ImageVariant`
+        from any thread."""
+        if self._workers_semaphore:
+            self._workers_semaphore.acquire()
+        try:
+            make_image_derivative(src, dest, width, fmt, self.quality)
+        finally:
+            if self._workers_semaphore:
+                self._workers_semaphore.release()
+        app.stats.incr("image derivatives created")
+
+    def srcset(self, path, format="original"):
+        """Template global giving the `srcset` attribute value for an image.
+
+        `{{ srcset('photos/cat.jpg', 'webp') }}` gives
+        "/photos/cat.jpg.480w.webp 480w, /photos/cat.jpg.960w.webp 960w".
+        """
+        try:
+            variants = self.variants[path.lstrip('/')]
+        except KeyError:
+            raise jinja2.exceptions.TemplateRuntimeError(
+                    'No image "{}" in content directory'.format(path)) from None
+        return ", ".join("{} {}w".format(url, width)
+                         for fmt, width, url in variants if fmt == format)
@@ -1,13 +1,26 @@
 
 import os
+import re
+import sys
+import stat
+import shutil
 from fnmatch import fnmatch
 
+try:
+    import fcntl
+except ImportError:  # pragma: nocover
+    fcntl = None  # Not available on Windows
+
 import jinja2
 from jinja2 import meta
 from jinja2.compiler import CodeGenerator
 
 IGNORED_FILES = [".*", "*~"]
 
+FICLONE = 0x40049409  # ioctl from linux/fs.h: share extents with another file
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+SLUG_SEPARATOR_RE = re.compile(r'[\W_]+')
+
 def remove_extension(filename, divider='.'):
     return filename[:filename.rfind(divider)]
 
@@ -50,6 +63,14 @@ def normalize_url(path):
     assert url.startswith('/') and url.endswith('/')
     return url
 
+def slugify(s):
+    """Lowercase `s` and join its words with "-", for use in urls.
+
+    >>> slugify("Hello, World!")
+    'hello-world'
+    """
+    return SLUG_SEPARATOR_RE.sub('-', str(s).lower()).strip('-')
+
 def fnmatch_one_of(filename, patterns):
     for pattern in patterns:
         if fnmatch(filename, pattern):
@@ -88,6 +109,63 @@ def walk_dir(root, subdir="", patterns=None):
             relpath = remove_prefix(abspath, root)
             yield abspath, relpath
 
+def remove_files(filenames):
+    """Remove files, along with any directories left empty by removing them."""
+    for filename in filenames:
+        os.remove(filename)
+        parent = os.path.dirname(filename)
+        if not os.listdir(parent):
+            os.removedirs(parent)
+
+def copy_file(src, dest):
+    """Copy a file's contents, permission bits and timestamps.
+
+    Uses the cheapest method that works: a reflink (copy-on-write clone on
+    filesystems like btrfs and xfs), then an in-kernel copy with
+    `os.copy_file_range()` or `os.sendfile()`, and finally a buffered copy.
+    Returns the name of the method used.
+    """
+    st = os.stat(src)
+    with open(src, 'rb') as fsrc, open(dest, 'wb') as fdest:
+        method = _reflink(fsrc, fdest) or _copy_in_kernel(fsrc, fdest)
+        if not method:
+            shutil.copyfileobj(fsrc, fdest, 1024 * 1024)
+            method = "buffered"
+    os.chmod(dest, stat.S_IMODE(st.st_mode))
+    os.utime(dest, ns=(st.st_atime_ns, st.st_mtime_ns))
+    return method
+
+def _reflink(fsrc, fdest):
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return None  # pragma: nocover
+    try:
+        fcntl.ioctl(fdest.fileno(), FICLONE, fsrc.fileno())
+    except OSError:
+        return None  # Filesystem doesn't support it, or different filesystems
+    return "reflink"
+
+def _sendfile(src_fd, dest_fd, count):
+    return os.sendfile(dest_fd, src_fd, None, count)
+
+def _copy_in_kernel(fsrc, fdest):
+    methods = [
+        ("copy_file_range", getattr(os, "copy_file_range", None)),
+        ("sendfile", _sendfile if hasattr(os, "sendfile") else None),
+    ]
+    for name, func in methods:
+        if func is None:
+            continue
+        try:
+            while func(fsrc.fileno(), fdest.fileno(), COPY_CHUNK_SIZE):
+                pass
+            return name
+        except OSError:
+            # Not supported for these files. Start over with the next method.
+            fsrc.seek(0)
+            fdest.seek(0)
+            fdest.truncate()
+    return None
+
 class _TrackingCodeGenerator(CodeGenerator):
 
     def __init__(self, environment):
@@ -0,0 +1,257 @@
+"""Incremental rebuilds for watch mode.
+
+`IncrementalBuilder` keeps one `App` between builds. Given the files that
+changed, it only reads "conf.yaml" again when it changed, keeps compiled
+templates, and only renders pages that could have changed.
+
+Urls are always generated again, since adding one file can change urls all
+over a collection (pagination, taxonomies), but the frontmatter of unchanged
+files isn't parsed again (see `views.FrontmatterCache`). What each page
+depends on is found by reading its templates and its markdown as Jinja
+templates:
+
+  - Its markdown file and the templates it extends, includes or imports.
+  - Variables it uses that give access to other pages (`AGGREGATE_NAMES`),
+    which make it depend on every markdown file.
+  - `url_for()`, which makes it depend on the names of urls.
+  - Template globals for static files (`ASSET_NAMES`), which make it depend
+    on every other content file.
+
+Build actions other than pages, like copying static files, run every build.
+They already skip work when their output is up to date.
+"""
+
+import os
+
+import jinja2
+import jinja2.meta
+
+from .exceptions import FrontmatterError, BuildCancelled
+from .generators import MARKDOWN_EXTENSIONS
+from . import views, buildactions
+
+COLLECTION_CONF = "_collection.yaml"
+
+# Template variables that give access to other pages' content. "page" and
+# "context" do too, through `page.collection` or `context.collections`.
+AGGREGATE_NAMES = frozenset(["app", "collections", "collection", "paginator",
+                             "taxonomy", "term", "page", "context"])
+# Template globals whose results depend on static files
+ASSET_NAMES = frozenset(["asset_url", "srcset"])
+
+
+class PageDeps():
+    """What the output of a page depends on."""
+
+    def __init__(self, files, templates, names):
+        self.files = files  # Absolute paths of files it reads
+        self.templates = templates  # Template names, or None if not known
+        self.names = names  # Variable names used, or None if not known
+
+
+class IncrementalBuilder():
+
+    def __init__(self, app):
+        self.app = app
+        # State of the last successful build, None to build everything
+        self.last_build = None
+        # Maps template name to ((size, mtime_ns), `template_info()` result)
+        self._template_info = {}
+        # Maps markdown file to ((size, mtime_ns), variable names or None)
+        self._content_names = {}
+        # Jinja leaves template globals, like `url_for`, out of undeclared
+        # variables, so sources are parsed without the app's globals
+        self._parse_env = jinja2.Environment()
+
+    def build(self, changed_paths=None):
+        """Build the site, returning the number of urls built.
+
+        `changed_paths`: Files changed since the last build. If None, or if
+            nothing was built before, everything is built.
+        """
+        app = self.app
+        changes = None
+        if changed_paths is not None and self.last_build is not None:
+            changes = self.classify(changed_paths)
+            if changes is None:
+                return 0
+
+        last_build = self.last_build
+        self.last_build = None  # Start over if this build fails
+        reload_conf = changes is None or changes["conf"]
+        app.reset(reload_conf=reload_conf)
+        if reload_conf:
+            self._template_info = {}
+
+        try:
+            app.generate_urls()
+            unchanged = {}
+            if changes is not None and not changes["conf"] and not changes["everything"]:
+                with app.stats.phase("find changes"):
+                    unchanged = self.find_unchanged(last_build, changes)
+            for url in app.build_content(unchanged=unchanged):
+                pass
+        except BuildCancelled:
+            # Files written so far are correct. The caller builds again with
+            # these changes plus the new ones, so build from the same state.
+            self.last_build = last_build
+            raise
+
+        self.last_build = {
+            "url_map": app.url_map,
+            "url_names": app.url_names,
+            "output_files": app.output_files,
+        }
+        return app.stats.counters.get("urls built", 0)
+
+    def classify(self, changed_paths):
+        """Sort changed paths into what they affect, or None if nothing."""
+        app = self.app
+        changes = {
+            "conf": False,
+            "everything": False,
+            "templates": set(),  # Names of changed templates
+            "all_templates": False,
+            "files": set(),
+            "markdown": False,
+            "assets": False,
+        }
+        relevant = False
+        for path in changed_paths:
+            path = os.path.abspath(path)
+            if path == app.conf_path:
+                changes["conf"] = True
+            elif path.startswith(app.template_dir + os.sep):
+                name = os.path.relpath(path, app.template_dir)
+                changes["templates"].add(name.replace(os.sep, '/'))
+                if not os.path.isfile(path):
+                    # Deleted or a directory: the names of the templates in
+                    # it aren't known
+                    changes["all_templates"] = True
+            elif path.startswith(app.content_dir + os.sep):
+                changes["files"].add(path)
+                if os.path.basename(path) == COLLECTION_CONF:
+                    # Collection context applies to all of its pages
+                    changes["everything"] = True
+                elif os.path.splitext(path)[1] in MARKDOWN_EXTENSIONS or not os.path.isfile(path):
+                    changes["markdown"] = True
+                else:
+                    changes["assets"] = True
+            else:
+                continue
+            relevant = True
+        return changes if relevant else None
+
+    def find_unchanged(self, last_build, changes):
+        """Maps urls that don't need building again to their built file."""
+        app = self.app
+        urls_changed = app.url_names != last_build["url_names"]
+        last_url_map = last_build["url_map"]
+        unchanged = {}
+        for url, filename in last_build["output_files"].items():
+            view = app.url_map.get(url)
+            if view is None or not buildactions.is_page(view):
+                continue
+            if not app.output.exists(filename):
+                continue
+            if isinstance(view, str):
+                if last_url_map.get(url) == view:
+                    unchanged[url] = filename
+                continue
+
+            deps = self.page_deps(view)
+            if deps is None or deps.files & changes["files"]:
+                continue
+            if deps.names is None:
+                continue
+            if changes["all_templates"] or deps.templates & changes["templates"]:
+                continue
+            if changes["markdown"] and deps.names & AGGREGATE_NAMES:
+                continue
+            if changes["assets"] and deps.names & ASSET_NAMES:
+                continue
+            if urls_changed and "url_for" in deps.names:
+                continue
+            unchanged[url] = filename
+        return unchanged
+
+    def page_deps(self, view):
+        """The `PageDeps` of a page's view, or None if they can't be known."""
+        if not isinstance(view, (views.TemplateView, views.CollectionItem)):
+            return None
+        files = set()
+        names = set()
+        md_file = getattr(view, "md_file", None)
+        if md_file is not None:
+            files.add(md_file)
+            content_names = self.content_names(md_file)
+            if content_names is None:
+                return PageDeps(files, None, None)
+            names |= content_names
+
+        templates = set()
+        todo = [view.get("template")]
+        while todo:
+            name = todo.pop()
+            if name in templates:
+                continue
+            templates.add(name)
+            info = self.template_info(name)
+            if info is None:
+                return PageDeps(files, None, None)
+            referenced, template_names = info
+            if referenced is None:
+                return PageDeps(files, None, None)
+            names |= template_names
+            todo.extend(referenced)
+        return PageDeps(files, templates, names)
+
+    def template_info(self, name):
+        """(names of referenced templates or None if not known, variable
+        names) of template `name`, or None if it can't be read."""
+        app = self.app
+        path = os.path.join(app.template_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            if name == views.DEFAULT_TEMPLATE:
+                # Rendered with a built in template, see `App.render_template()`
+                return set(), {"content"}
+            return None
+        key = (st.st_size, st.st_mtime_ns)
+        cached = self._template_info.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        try:
+            source = app.jinja_env.loader.get_source(app.jinja_env, name)[0]
+            ast = self._parse_env.parse(source)
+        except jinja2.exceptions.TemplateError:
+            info = None
+        else:
+            referenced = set(jinja2.meta.find_referenced_templates(ast))
+            if None in referenced:
+                # Names computed while rendering could be any template
+                referenced = None
+            info = (referenced, jinja2.meta.find_undeclared_variables(ast))
+        self._template_info[name] = (key, info)
+        return info
+
+    def content_names(self, md_file):
+        """Variable names used by markdown rendered as a template, or None."""
+        try:
+            st = os.stat(md_file)
+        except OSError:
+            return None
+        key = (st.st_size, st.st_mtime_ns)
+        cached = self._content_names.get(md_file)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        try:
+            frontmatter, content = self.app.frontmatter_cache.read_file(md_file)
+            names = jinja2.meta.find_undeclared_variables(self._parse_env.parse(content))
+        except (jinja2.exceptions.TemplateError, FrontmatterError):
+            names = None
+        self._content_names[md_file] = (key, names)
+        return names
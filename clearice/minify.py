@@ -0,0 +1,129 @@
+"""A small streaming HTML minifier.
+
+Collapses runs of whitespace in text to a single character and drops
+comments, while leaving the contents of `<pre>`, `<textarea>`, `<script>` and
+`<style>` untouched. Tags themselves are passed through as-is. It is
+deliberately conservative: whitespace between inline elements can be
+significant, so it is collapsed rather than removed.
+"""
+
+import re
+
+PRESERVE_TAGS = ("pre", "textarea", "script", "style")
+
+# Whitespace as HTML defines it. Unlike `\s`, this leaves non-breaking
+# spaces alone.
+WHITESPACE_RE = re.compile(r'[ \t\n\r\f]+')
+TAG_RE = re.compile(r'''<(/?)([a-zA-Z][^\s/>]*)(?:[^>"']|"[^"]*"|'[^']*')*>''')
+
+
+def _collapse_whitespace(match):
+    return '\n' if '\n' in match.group() else ' '
+
+def minify_html(html):
+    minifier = HtmlMinifier()
+    return minifier.feed(html) + minifier.close()
+
+class HtmlMinifier():
+    """Minifies HTML fed to it in chunks.
+
+    Each call to `feed()` returns as much minified output as can be produced
+    so far; anything that might continue in the next chunk (a partial tag,
+    trailing whitespace) is held back until more input or `close()`.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.raw_tag = None  # Set while inside one of `PRESERVE_TAGS`
+        self._raw_end_re = None
+        self._last_char = ""
+        self._skip_space = False  # After a dropped comment that followed whitespace
+
+    def feed(self, data):
+        self.buffer += data
+        return self._process(final=False)
+
+    def close(self):
+        return self._process(final=True)
+
+    def _process(self, final):
+        buf = self.buffer
+        out = []
+        pos = 0
+        while pos < len(buf):
+
+            # Inside <pre> and friends: pass through until the closing tag
+            if self.raw_tag:
+                end = self._raw_end_re.search(buf, pos)
+                if end is None:
+                    cut = len(buf)
+                    if not final and buf.rfind('<', pos) != -1:
+                        cut = buf.rfind('<', pos)  # Maybe a partial closing tag
+                    self._emit(out, buf[pos:cut])
+                    pos = cut
+                    break
+                self._emit(out, buf[pos:end.start()])
+                pos = end.start()
+                self.raw_tag = None
+                continue
+
+            # Text
+            lt = buf.find('<', pos)
+            text_end = len(buf) if lt == -1 else lt
+            if text_end > pos:
+                text = buf[pos:text_end]
+                if lt == -1 and not final:
+                    # Trailing whitespace may continue into the next chunk
+                    text = text.rstrip(' \t\n\r\f')
+                    text_end = pos + len(text)
+                pos = text_end
+                if self._skip_space:
+                    text = text.lstrip(' \t\n\r\f')
+                    self._skip_space = not text
+                self._emit(out, WHITESPACE_RE.sub(_collapse_whitespace, text))
+                if lt == -1:
+                    break
+                continue
+
+            # Comments, except conditional comments
+            if not final and '<!--'.startswith(buf[pos:pos+4]) and len(buf)-pos < 4:
+                break  # Maybe the start of a comment
+            if buf.startswith('<!--', pos):
+                end = buf.find('-->', pos+4)
+                if end == -1:
+                    if final:
+                        self._emit(out, buf[pos:])
+                        pos = len(buf)
+                    break
+                body = buf[pos+4:end]
+                if body.startswith(('[if', '<![endif', '!')):
+                    self._emit(out, buf[pos:end+3])
+                elif self._last_char in (' ', '\n', ''):
+                    self._skip_space = True
+                pos = end + 3
+                continue
+
+            # Tags
+            match = TAG_RE.match(buf, pos)
+            if match is None:
+                looks_like_tag = buf[pos+1:pos+2].isalpha() or buf[pos+1:pos+2] == '/'
+                if not final and (pos+1 == len(buf) or looks_like_tag):
+                    break  # Wait for the rest of the tag
+                self._emit(out, '<')  # A literal "<" in text
+                pos += 1
+                continue
+            self._emit(out, match.group())
+            pos = match.end()
+            name = match.group(2).lower()
+            if not match.group(1) and name in PRESERVE_TAGS and not match.group().endswith('/>'):
+                self.raw_tag = name
+                self._raw_end_re = re.compile(r'</{}[ \t\n\r\f]*>'.format(name), re.I)
+
+        self.buffer = buf[pos:]
+        return ''.join(out)
+
+    def _emit(self, out, s):
+        if s:
+            out.append(s)
+            self._last_char = s[-1]
+            self._skip_space = False
@@ -0,0 +1,132 @@
+"""Where a build is written.
+
+Build actions write their output with `BuildAction.write_to()`, which is given
+one of these:
+
+  - `DirectoryOutput` writes files to the build directory. This is the
+    default, and runs each action's `do()` on a path in the directory.
+  - `MemoryOutput` keeps files in a dict. Files that have the same content as
+    an existing file, like copied static files, refer to that file instead of
+    holding its content. Used by the dev server, and by tests that don't need
+    files on disk.
+
+Files are named by the output: absolute paths for `DirectoryOutput`, paths
+relative to the build root, like "blog/index.html", for `MemoryOutput`.
+"""
+
+import os
+
+from .helpers import walk_dir, remove_files
+
+
+def remove_link(path):
+    """Remove `path` if it's a soft or hard link, before writing to it.
+
+    Writing through a link would change the file it's linked to.
+    """
+    if os.path.islink(path) or os.path.isfile(path) and os.stat(path).st_nlink > 1:
+        os.remove(path)
+
+
+def write_if_changed(path, data):
+    """Write `data` to `path`, leaving the file alone if it already has it."""
+    remove_link(path)
+
+    # Leave unchanged files alone so their mtime shows they're unchanged
+    if os.path.isfile(path) and os.path.getsize(path) == len(data):
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return
+
+    dirname = os.path.dirname(path)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname, exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+class DirectoryOutput():
+
+    # If files are on disk, so they can be compressed and sharded
+    is_directory = True
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def local_path(self, relpath):
+        """The path on disk to write `relpath` to."""
+        absolute = os.path.abspath(os.path.join(self.root, relpath))
+        if os.path.isabs(relpath) or not absolute.startswith(self.root):
+            raise ValueError("Tried to get path {} outside of build directory "
+                    "{}".format(absolute, self.root))
+        return absolute
+
+    def write(self, relpath, data):
+        path = self.local_path(relpath)
+        write_if_changed(path, data)
+        return path
+
+    def exists(self, name):
+        return os.path.exists(name)
+
+    def existing_files(self):
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        return set(abspath for abspath, relpath in walk_dir(self.root))
+
+    def remove(self, names):
+        remove_files(names)
+
+class FileRef():
+    """A `MemoryOutput` file with the same content as the file at `path`."""
+
+    __slots__ = ("path",)
+
+    def __init__(self, path):
+        self.path = path
+
+    def __repr__(self):
+        return "FileRef({!r})".format(self.path)
+
+class MemoryOutput():
+
+    is_directory = False
+
+    def __init__(self):
+        self.files = {}  # Maps relative path to bytes or `FileRef`
+
+    def local_path(self, relpath):
+        return None
+
+    @staticmethod
+    def normalize(relpath):
+        return relpath.strip('/')
+
+    def write(self, relpath, data):
+        relpath = self.normalize(relpath)
+        self.files[relpath] = data
+        return relpath
+
+    def reference(self, relpath, source_path):
+        """Add a file with the content of the existing file `source_path`."""
+        relpath = self.normalize(relpath)
+        self.files[relpath] = FileRef(source_path)
+        return relpath
+
+    def read(self, name):
+        """The content of file `name` as bytes."""
+        value = self.files[name]
+        if isinstance(value, FileRef):
+            with open(value.path, 'rb') as f:
+                return f.read()
+        return value
+
+    def exists(self, name):
+        return name in self.files
+
+    def existing_files(self):
+        return set(self.files)
+
+    def remove(self, names):
+        for name in names:
+            self.files.pop(name, None)
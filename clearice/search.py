@@ -0,0 +1,186 @@
+"""A search index for client-side search.
+
+Enabled with a "search" section in the config (`search: true` for defaults):
+
+    search:
+        url: search  # Where the index is published
+        prefix_length: 2
+
+Every page with a markdown file is tokenized into an inverted index, which is
+split into one JSON file per term prefix so a client only fetches the part it
+needs. For "search/" and a prefix length of 2, the published files are:
+
+  - "/search/docs.json": `{"prefix_length": 2, "docs": [[url, title], ...]}`.
+    A term's postings refer to pages by their index in "docs". Entries of
+    removed pages are null.
+  - "/search/<prefix>.json": `{term: [[doc index, count], ...], ...}` for
+    every term starting with `<prefix>`.
+
+Pages are indexed from their markdown source, since rendered HTML isn't
+available until after urls are generated. The index is kept in the cache
+directory and updated incrementally: only pages whose markdown file changed
+are tokenized again, and only the prefix files containing their old or new
+terms are rewritten.
+"""
+
+import os
+import re
+import shutil
+import collections
+
+from .exceptions import ConfigError
+from .generators import GeneratorBase
+from .helpers import normalize_url
+from .cache import read_json, write_json
+from . import buildactions
+
+TOKEN_RE = re.compile(r'\w+')
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 32
+STATE_VERSION = 1
+
+
+def tokenize(text):
+    """Lowercased words of `text` that are worth indexing."""
+    for match in TOKEN_RE.finditer(text.lower()):
+        term = match.group()
+        if MIN_TERM_LENGTH <= len(term) <= MAX_TERM_LENGTH:
+            yield term
+
+
+class SearchIndexGenerator(GeneratorBase):
+
+    CACHE_DIR = "search"
+
+    def __init__(self, url="search", prefix_length=2, **kwargs):
+        if not isinstance(url, str) or not url.strip('/'):
+            raise ConfigError(None, "search url must be a non-empty string")
+        self.url = normalize_url(url)
+        self.prefix_length = prefix_length
+
+        if not isinstance(self.prefix_length, int) or not 1 <= self.prefix_length <= MIN_TERM_LENGTH:
+            raise ConfigError(None, "search prefix_length must be an integer from 1 "
+                    "to {}".format(MIN_TERM_LENGTH))
+        if kwargs:
+            key = list(kwargs.keys())[0]
+            raise ConfigError(None, 'Unexpected field "{}" in search config'.format(key))
+
+    @classmethod
+    def from_conf(cls, yaml_file, data):
+        if data is True:
+            data = {}
+        if not isinstance(data, dict):
+            raise ConfigError(yaml_file, 'Expected search option to be true or a dict, got "{}"'.format(type(data)))
+        try:
+            return cls(**data)
+        except ConfigError as e:
+            # Re-raise after adding yaml_file info
+            e.filename = yaml_file
+            raise e
+
+    def read_state(self, app):
+        state = read_json(app.get_cache_path(self.CACHE_DIR + "/state.json"), None)
+        if not state or state.get("version") != STATE_VERSION or \
+                state.get("prefix_length") != self.prefix_length:
+            # Start over, the cached prefix files can't be reused
+            shutil.rmtree(app.get_cache_path(self.CACHE_DIR), ignore_errors=True)
+            state = {
+                "version": STATE_VERSION,
+                "prefix_length": self.prefix_length,
+                "docs": {},  # Maps url to [doc index, md file, size, mtime_ns, title, [prefixes]]
+                "free": [],  # Doc indexes of removed pages, to be reused
+                "n_docs": 0,
+            }
+        return state
+
+    def __call__(self, app):
+        state = self.read_state(app)
+        docs = state["docs"]
+        shards_dir = app.get_cache_path(self.CACHE_DIR + "/shards")
+        shards = {}  # Maps prefix to postings of shards being updated
+
+        def get_shard(prefix):
+            if prefix not in shards:
+                path = os.path.join(shards_dir, prefix + ".json")
+                shards[prefix] = read_json(path, {})
+            return shards[prefix]
+
+        # Find pages that are new, changed or removed since the last build
+        pages = {}
+        for url, view in app.url_map.items():
+            md_file = getattr(view, "md_file", None)
+            if md_file is None:
+                continue
+            # Pages after the first of a paginated page share its markdown
+            paginator = view.get("paginator")
+            if paginator is not None and paginator.number > 1:
+                continue
+            pages[url] = view
+        changed = []
+        for url, view in pages.items():
+            st = os.stat(view.md_file)
+            doc = docs.get(url)
+            if not doc or doc[1:4] != [view.md_file, st.st_size, st.st_mtime_ns]:
+                changed.append((url, view, st))
+        removed = [url for url in docs if url not in pages]
+
+        # Remove postings of the old versions
+        for url in removed + [url for url, view, st in changed if url in docs]:
+            index, prefixes = docs[url][0], docs[url][5]
+            for prefix in prefixes:
+                shard = get_shard(prefix)
+                for term in list(shard):
+                    postings = [p for p in shard[term] if p[0] != index]
+                    if postings:
+                        shard[term] = postings
+                    else:
+                        del shard[term]
+        for url in removed:
+            state["free"].append(docs.pop(url)[0])
+
+        # Add postings of the new versions
+        for url, view, st in changed:
+            if url in docs:
+                index = docs[url][0]
+            elif state["free"]:
+                index = state["free"].pop()
+            else:
+                index = state["n_docs"]
+                state["n_docs"] += 1
+            frontmatter, content = app.frontmatter_cache.read_file(view.md_file)
+            title = str(view.get("title") or "")
+            counts = collections.Counter(tokenize(title + "\n" + content))
+            for term, count in counts.items():
+                get_shard(term[:self.prefix_length]).setdefault(term, []).append([index, count])
+            prefixes = sorted(set(term[:self.prefix_length] for term in counts))
+            docs[url] = [index, view.md_file, st.st_size, st.st_mtime_ns, title, prefixes]
+
+        # Save what changed
+        for prefix, shard in shards.items():
+            path = os.path.join(shards_dir, prefix + ".json")
+            if shard:
+                write_json(path, shard)
+            elif os.path.exists(path):
+                os.remove(path)
+        docs_path = app.get_cache_path(self.CACHE_DIR + "/docs.json")
+        if changed or removed or not os.path.exists(docs_path):
+            doc_list = [None] * state["n_docs"]
+            for url, doc in docs.items():
+                doc_list[doc[0]] = [url, doc[4]]
+            write_json(docs_path, {"prefix_length": self.prefix_length, "docs": doc_list})
+        write_json(app.get_cache_path(self.CACHE_DIR + "/state.json"), state)
+        app.stats.incr("search pages indexed", len(changed))
+        app.stats.incr("search index files updated", len(shards))
+
+        # Publish from the cache. Unchanged files keep their mtime, so the
+        # copies skip them.
+        app.add_url(normalize_url(self.url + "docs.json"),
+                buildactions.Copy(self.CACHE_DIR + "/docs.json", from_cache=True),
+                name=self.url[1:] + "docs.json")
+        if os.path.isdir(shards_dir):
+            for filename in sorted(os.listdir(shards_dir)):
+                if not filename.endswith(".json"):
+                    continue
+                app.add_url(normalize_url(self.url + filename),
+                        buildactions.Copy(self.CACHE_DIR + "/shards/" + filename, from_cache=True),
+                        name=self.url[1:] + filename)
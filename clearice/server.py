@@ -0,0 +1,471 @@
+"""Development server.
+
+The server serves a "site", anything with a `get(path)` method returning a
+`Response` or None:
+
+  - `DirectorySite` serves an already built build directory.
+  - `MemorySite` serves a build kept in a `MemoryOutput`.
+  - `OnDemandSite` doesn't build the site. It only runs `App.generate_urls()`,
+    then renders each url from `App.url_map` the first time it is requested.
+    Rendered responses are cached in memory until `reload()` is called after
+    files change, which generates urls again with the same `App`.
+
+Requests are handled in threads over persistent HTTP/1.1 connections, so a
+slow response (a large video) doesn't hold up the rest of the page. Responses
+carry an ETag and Last-Modified date so unchanged files get a 304 on reload,
+files are sent with `sendfile()`, and byte range requests are supported.
+
+With a `LiveReload`, served pages get a script that listens for Server-Sent
+Events on `EVENTS_PATH`. After a rebuild, `LiveReload.notify()` reloads only
+the tabs whose page changed, and swaps in changed stylesheets without
+reloading the page.
+"""
+
+import os
+import re
+import time
+import queue
+import hashlib
+import mimetypes
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import urlsplit, unquote, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from .helpers import normalize_url
+from .exceptions import ClearIceException
+from .output import MemoryOutput, FileRef
+from .incremental import IncrementalBuilder
+
+HTML_CONTENT_TYPE = "text/html; charset=utf-8"
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+BODY_END_RE = re.compile(br'</body>', re.IGNORECASE)
+
+EVENTS_PATH = "/__clearice/events"
+PING_INTERVAL = 15  # Seconds between keep-alive comments on event streams
+
+# Sends the page url, the ETag it was served with and its stylesheet urls, so
+# the server knows what the tab is showing.
+LIVE_RELOAD_SCRIPT = """
+(function() {
+    var etag = document.currentScript.dataset.etag;
+    function stylesheets() {
+        return [].filter.call(document.querySelectorAll('link[rel="stylesheet"]'), function(link) {
+            return new URL(link.href).origin === location.origin;
+        });
+    }
+    var params = "?url=" + encodeURIComponent(location.pathname) + "&etag=" + encodeURIComponent(etag);
+    stylesheets().forEach(function(link) {
+        params += "&css=" + encodeURIComponent(new URL(link.href).pathname);
+    });
+    var source = new EventSource("EVENTS_PATH" + params);
+    source.addEventListener("reload", function() {
+        source.close();
+        location.reload();
+    });
+    source.addEventListener("css", function(event) {
+        stylesheets().forEach(function(link) {
+            var url = new URL(link.href);
+            if (url.pathname === event.data) {
+                url.searchParams.set("clearice-reload", Date.now());
+                link.href = url.href;
+            }
+        });
+    });
+})();
+</script>
+""".replace("EVENTS_PATH", EVENTS_PATH)
+
+
+class Response():
+    """A rendered url: either `body` bytes or the `path` of a file to send."""
+
+    def __init__(self, content_type, body=None, path=None):
+        self.content_type = content_type
+        self.body = body
+        self.path = path
+        if body is not None:
+            self.mtime = time.time()
+            self.etag = '"{}"'.format(hashlib.sha1(body).hexdigest()[:16])
+
+    def stat(self):
+        """Returns (size, mtime, etag), checking the file for path responses."""
+        if self.path is None:
+            return len(self.body), self.mtime, self.etag
+        st = os.stat(self.path)
+        etag = '"{:x}-{:x}"'.format(st.st_mtime_ns, st.st_size)
+        return st.st_size, st.st_mtime, etag
+
+def guess_content_type(url):
+    content_type = mimetypes.guess_type(url.rstrip('/'))[0] or DEFAULT_CONTENT_TYPE
+    if content_type.startswith("text/"):
+        content_type += "; charset=utf-8"
+    return content_type
+
+def output_response(output, name):
+    """The `Response` for file `name` of a `MemoryOutput`."""
+    value = output.files[name]
+    if isinstance(value, FileRef):
+        return Response(guess_content_type(name), path=value.path)
+    return Response(guess_content_type(name), body=value)
+
+def path_to_url(path):
+    """The url_map url for a request path, like "/blog/index.html" -> "/blog/"."""
+    path = unquote(urlsplit(path).path)
+    if path.endswith("/index.html"):
+        path = path[:-len("index.html")]
+    return normalize_url(path)
+
+
+class DirectorySite():
+    """Serves the files of a directory, like a build directory."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def get(self, path):
+        path = unquote(urlsplit(path).path)
+        abspath = os.path.abspath(os.path.join(self.root, path.lstrip('/')))
+        if abspath != self.root and not abspath.startswith(self.root + os.sep):
+            return None
+        if os.path.isdir(abspath):
+            abspath = os.path.join(abspath, "index.html")
+        if not os.path.isfile(abspath):
+            return None
+        return Response(guess_content_type(abspath), path=abspath)
+
+class MemorySite():
+    """Serves the files of a `MemoryOutput`, as they are built into it."""
+
+    def __init__(self, output):
+        self.output = output
+
+    def get(self, path):
+        relpath = unquote(urlsplit(path).path).strip('/')
+        for name in (relpath, relpath + "/index.html" if relpath else "index.html"):
+            if self.output.exists(name):
+                try:
+                    return output_response(self.output, name)
+                except KeyError:
+                    return None  # Removed since checking
+        return None
+
+class OnDemandSite():
+
+    def __init__(self, app):
+        """
+        `app`: The `App` to render with. It's kept between reloads, like in
+            `IncrementalBuilder`, so compiled templates and parsed
+            frontmatter are reused.
+        """
+        self.app = app
+        self.builder = IncrementalBuilder(app)
+        self.cache = {}  # Maps url to `Response`
+        self.lock = threading.Lock()
+        # Signalled when a render or reload finishes
+        self.idle = threading.Condition(self.lock)
+        self.n_rendering = 0
+        self.reloading = False
+        self.reload()
+
+    def reload(self, changed_paths=None):
+        """Generate urls again, after files have changed.
+
+        `changed_paths`: Files changed since the last reload. "conf.yaml" is
+            only read again if it's one of them, or if this is None.
+        """
+        reload_conf = True
+        if changed_paths is not None:
+            changes = self.builder.classify(changed_paths)
+            if changes is None:
+                return
+            reload_conf = changes["conf"]
+
+        # The app can't change under renders, so wait for them to finish
+        with self.lock:
+            self.reloading = True
+            while self.n_rendering:
+                self.idle.wait()
+        try:
+            self.app.reset(reload_conf=reload_conf)
+            self.app.generate_urls()
+        finally:
+            with self.lock:
+                self.reloading = False
+                self.cache = {}
+                self.idle.notify_all()
+
+    def get(self, path):
+        """The `Response` for request `path`, or None if there is no such url."""
+        url = path_to_url(path)
+        with self.lock:
+            while self.reloading:
+                self.idle.wait()
+            response = self.cache.get(url)
+            if response is not None:
+                return response
+            if url not in self.app.url_map:
+                return None
+            self.n_rendering += 1
+
+        response = None
+        try:
+            response = self.render(self.app, url)
+        finally:
+            with self.lock:
+                self.n_rendering -= 1
+                if response is not None:
+                    self.cache[url] = response
+                self.idle.notify_all()
+        return response
+
+    def render(self, app, url):
+        output = MemoryOutput()
+        name = app.resolve_action(url).write_to(app, output, url[1:])
+        return output_response(output, name)
+
+
+class SiteRequestHandler(BaseHTTPRequestHandler):
+    """Serves `self.server.site`."""
+
+    # Keep connections open between requests
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_site_response(send_body=True)
+
+    def do_HEAD(self):
+        self.send_site_response(send_body=False)
+
+    def send_site_response(self, send_body):
+        live_reload = self.server.live_reload
+        if live_reload and urlsplit(self.path).path == EVENTS_PATH:
+            live_reload.stream_events(self, self.server.site)
+            return
+        try:
+            response = self.server.site.get(self.path)
+        except ClearIceException as e:
+            self.send_error(500, "Error rendering page", str(e))
+            return
+        if response is None:
+            self.send_error(404)
+            return
+
+        # Pages are served from their directory, so relative links work
+        path = urlsplit(self.path).path
+        if response.content_type == HTML_CONTENT_TYPE and not path.endswith(('/', '.html')):
+            self.send_response(301)
+            self.send_header("Location", path + '/')
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        try:
+            if live_reload and response.content_type == HTML_CONTENT_TYPE:
+                response = live_reload.inject(response)
+            size, mtime, etag = response.stat()
+        except FileNotFoundError:
+            self.send_error(404)
+            return
+        last_modified = formatdate(mtime, usegmt=True)
+
+        if self.is_not_modified(etag, mtime):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            self.end_headers()
+            return
+
+        start, end = 0, size
+        status = 200
+        byte_range = self.get_range(size, etag)
+        if byte_range == "unsatisfiable":
+            self.send_response(416)
+            self.send_header("Content-Range", "bytes */{}".format(size))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if byte_range:
+            start, end = byte_range
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", response.content_type)
+        self.send_header("Content-Length", str(end - start))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        self.send_header("Cache-Control", "no-cache")  # Always revalidate
+        if status == 206:
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(start, end-1, size))
+        self.end_headers()
+        if not send_body:
+            return
+
+        if response.body is not None:
+            self.wfile.write(response.body[start:end])
+        else:
+            self.wfile.flush()
+            with open(response.path, 'rb') as f:
+                # Falls back to plain sends where sendfile() isn't available
+                self.connection.sendfile(f, start, end - start)
+
+    def is_not_modified(self, etag, mtime):
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(mtime) <= since
+        return False
+
+    def get_range(self, size, etag):
+        """(start, end) of a single satisfiable byte range, "unsatisfiable",
+        or None to send the whole response."""
+        header = self.headers.get("Range")
+        if not header:
+            return None
+        if_range = self.headers.get("If-Range")
+        if if_range is not None and if_range.strip() != etag:
+            return None  # Changed since the client got the first part
+        match = RANGE_RE.match(header.strip())
+        if not match or match.groups() == ('', ''):
+            return None  # Multiple or malformed ranges: send everything
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            if last and int(last) < start:
+                return None  # Invalid, so ignored
+            end = min(int(last) + 1, size) if last else size
+        else:
+            if int(last) == 0:
+                return "unsatisfiable"  # Asks for the last 0 bytes
+            start = max(size - int(last), 0)
+            end = size
+        if start >= size:
+            return "unsatisfiable"
+        return start, end
+
+def make_server(site, address, port, live_reload=None):
+    """
+    `live_reload`: A `LiveReload` to inject into pages and serve events
+        from, or None to disable live reloading.
+    """
+    server = ThreadingHTTPServer((address, port), SiteRequestHandler)
+    server.daemon_threads = True
+    server.site = site
+    server.live_reload = live_reload
+    return server
+
+
+class LiveReload():
+    """Tells open browser tabs to reload when their page changes."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = set()
+
+    def inject(self, response):
+        """A copy of HTML `response` with the live reload script added."""
+        size, mtime, etag = response.stat()
+        body = response.body
+        if body is None:
+            with open(response.path, 'rb') as f:
+                body = f.read()
+        script = '<script data-etag="{}">'.format(etag.replace('"', "&quot;"))
+        script = (script + LIVE_RELOAD_SCRIPT).encode('utf-8')
+        matches = list(BODY_END_RE.finditer(body))
+        pos = matches[-1].start() if matches else len(body)
+        injected = Response(response.content_type, body=body[:pos] + script + body[pos:])
+        injected.mtime = mtime
+        return injected
+
+    def get_etag(self, site, path):
+        """The current ETag of `path`, or None if it's missing or broken."""
+        try:
+            response = site.get(path)
+            return response.stat()[2] if response else None
+        except (ClearIceException, OSError):
+            return None
+
+    def stream_events(self, handler, site):
+        """Serves an event stream to a tab, until it disconnects."""
+        query = parse_qs(urlsplit(handler.path).query)
+        page = query.get("url", ["/"])[0]
+        client = LiveReloadClient(page, query.get("etag", [None])[0])
+        for path in query.get("css", []):
+            client.etags[path] = self.get_etag(site, path)
+
+        handler.close_connection = True  # The stream ends when the connection does
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+
+        with self.lock:
+            self.clients.add(client)
+        # The page may have changed before the tab connected
+        self.check_client(client, site)
+        try:
+            while True:
+                try:
+                    event = client.events.get(timeout=PING_INTERVAL)
+                except queue.Empty:
+                    handler.wfile.write(b": ping\n\n")
+                else:
+                    if event is None:
+                        break
+                    handler.wfile.write("event: {}\ndata: {}\n\n".format(*event).encode('utf-8'))
+                handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with self.lock:
+                self.clients.discard(client)
+
+    def check_client(self, client, site):
+        page_etag = self.get_etag(site, client.page)
+        if page_etag != client.etags[client.page]:
+            client.etags[client.page] = page_etag
+            client.events.put(("reload", client.page))
+            return
+        for path, etag in client.etags.items():
+            if path != client.page:
+                new_etag = self.get_etag(site, path)
+                if new_etag != etag:
+                    client.etags[path] = new_etag
+                    client.events.put(("css", path))
+
+    def notify(self, site):
+        """Sends events to tabs showing pages or stylesheets that changed.
+
+        Called after rebuilding. Only pages open in a tab are checked, so for
+        an `OnDemandSite` only those are rendered again.
+        """
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            self.check_client(client, site)
+
+    def close(self):
+        """Ends all event streams."""
+        with self.lock:
+            for client in self.clients:
+                client.events.put(None)
+
+class LiveReloadClient():
+    """An open browser tab and the ETags of what it has loaded."""
+
+    def __init__(self, page, etag):
+        self.page = page
+        self.etags = {page: etag}  # Maps path to ETag when it was loaded
+        self.events = queue.Queue()  # (event, data) tuples, None to stop
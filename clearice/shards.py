@@ -0,0 +1,154 @@
+"""Splitting a build across several machines.
+
+A sharded build runs `App.generate_urls()` in full on every machine, then each
+machine renders only its own deterministic subset of the urls into its own
+build directory. The shard writes a manifest next to its output listing the
+files it wrote and how long each url took to render. `merge_shards()` then
+combines the shard outputs into the final build directory and records the
+render times, so the next sharded build can balance the work across shards.
+"""
+
+import os
+import json
+import heapq
+
+from .helpers import walk_dir, remove_files, copy_file
+from .exceptions import ShardError
+
+# Both start with "." so `walk_dir()` ignores them, which keeps them from
+# being removed as stale files or merged as content.
+SHARD_MANIFEST = ".clearice-shard.json"
+BUILD_MANIFEST = ".clearice-manifest.json"
+
+
+def parse_shard(s):
+    """Parse a "i/N" string into a 1-based `(index, count)` tuple."""
+    try:
+        index, count = (int(part) for part in s.split('/'))
+    except ValueError:
+        raise ShardError('Expected shard in the form "i/N", got "{}"'.format(s)) from None
+    check_shard((index, count))
+    return index, count
+
+def check_shard(shard):
+    index, count = shard
+    if count < 1 or not 1 <= index <= count:
+        raise ShardError('Shard index must be between 1 and the shard count '
+                '(got {}/{})'.format(index, count))
+
+def read_render_times(manifest_path):
+    """Returns {url: seconds} from a build manifest, or {} if there is none."""
+    if not manifest_path or not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise ShardError(str(e), manifest_path) from None
+    return data.get("render_times", {})
+
+def partition_urls(urls, count, render_times=None):
+    """Split `urls` into `count` lists of roughly equal total render time.
+
+    Urls without a previous render time are assumed to take the average time
+    of those that have one. The result only depends on the url set and the
+    render times, so every machine computes the same partition.
+    """
+    urls = list(urls)
+    render_times = render_times or {}
+    known = [render_times[url] for url in urls if url in render_times]
+    default_cost = sum(known) / len(known) if known else 1.0
+
+    # Longest-processing-time-first: hand the most expensive remaining url to
+    # the shard with the least total work so far.
+    costs = sorted(
+        ((render_times.get(url, default_cost), url) for url in urls),
+        key=lambda pair: (-pair[0], pair[1])
+    )
+    shards = [[] for i in range(count)]
+    loads = [(0.0, i) for i in range(count)]
+    for cost, url in costs:
+        load, i = heapq.heappop(loads)
+        shards[i].append(url)
+        heapq.heappush(loads, (load + cost, i))
+
+    for shard_urls in shards:
+        shard_urls.sort()
+    return shards
+
+def write_shard_manifest(build_dir, shard, written_files, render_times):
+    manifest = {
+        "shard": list(shard),
+        "files": sorted(os.path.relpath(f, build_dir) for f in written_files),
+        "render_times": render_times,
+    }
+    with open(os.path.join(build_dir, SHARD_MANIFEST), 'w') as f:
+        json.dump(manifest, f)
+
+def read_shard_manifest(shard_dir):
+    path = os.path.join(shard_dir, SHARD_MANIFEST)
+    if not os.path.exists(path):
+        raise ShardError('Not a shard output directory (missing {})'.format(
+                SHARD_MANIFEST), shard_dir)
+    with open(path) as f:
+        try:
+            return json.load(f)
+        except ValueError as e:
+            raise ShardError(str(e), path) from None
+
+def merge_shards(shard_dirs, build_dir):
+    """Combine shard outputs into `build_dir`, removing stale files.
+
+    Returns the number of files merged.
+    """
+    build_dir = os.path.abspath(build_dir)
+    manifests = [read_shard_manifest(d) for d in shard_dirs]
+
+    # All shards of one build must agree on the shard count and cover it.
+    counts = set(m["shard"][1] for m in manifests)
+    indexes = sorted(m["shard"][0] for m in manifests)
+    if len(counts) != 1 or indexes != list(range(1, counts.pop()+1)):
+        raise ShardError('Shards do not form a complete set: got '
+                '{}'.format(', '.join("{}/{}".format(*m["shard"]) for m in manifests)))
+
+    existing_files = set(abspath for abspath, relpath in walk_dir(build_dir))
+    written_files = set()
+    render_times = {}
+    for shard_dir, manifest in zip(shard_dirs, manifests):
+        render_times.update(manifest["render_times"])
+        for relpath in manifest["files"]:
+            src = os.path.join(shard_dir, relpath)
+            dest = os.path.join(build_dir, relpath)
+            if dest in written_files:
+                raise ShardError('File "{}" was written by more than one '
+                        'shard'.format(relpath))
+            # A shard built into `build_dir` itself is already in place
+            if os.path.abspath(src) != dest:
+                copy_output(src, dest)
+            written_files.add(dest)
+
+    remove_files(existing_files - written_files)
+    # Left by a shard built into `build_dir`, which isn't a shard anymore
+    shard_manifest = os.path.join(build_dir, SHARD_MANIFEST)
+    if os.path.exists(shard_manifest):
+        os.remove(shard_manifest)
+
+    os.makedirs(build_dir, exist_ok=True)
+    with open(os.path.join(build_dir, BUILD_MANIFEST), 'w') as f:
+        json.dump({"render_times": render_times}, f)
+
+    return len(written_files)
+
+def copy_output(src, dest):
+    """Copy a single built file, keeping relative symlinks pointing correctly."""
+    if os.path.lexists(dest):
+        os.remove(dest)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    if os.path.islink(src):
+        target = os.readlink(src)
+        if not os.path.isabs(target):
+            target = os.path.join(os.path.dirname(src), target)
+            target = os.path.relpath(target, os.path.dirname(dest))
+        os.symlink(target, dest)
+    else:
+        copy_file(src, dest)
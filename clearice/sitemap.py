@@ -0,0 +1,183 @@
+"""Sitemaps (https://www.sitemaps.org/) listing every page of the site.
+
+Enabled with a "sitemap" section in the config:
+
+    sitemap:
+        base_url: https://example.com
+
+The protocol limits a sitemap file to 50,000 urls and 50MiB, so bigger sites
+get several files, "/sitemap-1.xml", "/sitemap-2.xml", ..., listed by a
+sitemap index at "/sitemap.xml". Files are streamed to disk, and each file
+records a digest of its entries so it is only rewritten when they change.
+"""
+
+import os
+import datetime
+import hashlib
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+from .exceptions import ConfigError
+from .generators import GeneratorBase
+from .output import remove_link
+from . import buildactions
+
+MAX_URLS = 50000
+MAX_BYTES = 50 * 1024 * 1024
+
+# Frontmatter fields used for <lastmod>, in order of preference. Pages with a
+# markdown file but none of these use the file's modification date.
+LASTMOD_FIELDS = ("lastmod", "updated", "date")
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>\n'
+DIGEST_FORMAT = '<!-- digest: {} -->\n'
+URLSET_START = '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+URLSET_END = '</urlset>\n'
+INDEX_START = '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+INDEX_END = '</sitemapindex>\n'
+
+# Characters left alone when percent-encoding urls: reserved characters, and
+# "%" so urls that are already encoded aren't encoded twice
+URL_SAFE = "/:@%!$&'()*+,;=?#[]~"
+
+
+def format_loc(url):
+    """`url` percent-encoded, as the protocol requires, and XML-escaped."""
+    return escape(quote(url, safe=URL_SAFE))
+
+def format_lastmod(value):
+    if isinstance(value, datetime.datetime):
+        # W3C datetimes with a time need a timezone
+        return value.isoformat() if value.tzinfo else value.date().isoformat()
+    return value.isoformat()
+
+def get_lastmod(view):
+    md_file = getattr(view, "md_file", None)
+    if md_file is None:
+        return None
+    for field in LASTMOD_FIELDS:
+        value = view.get(field)
+        if isinstance(value, datetime.date):
+            return format_lastmod(value)
+    return datetime.date.fromtimestamp(os.path.getmtime(md_file)).isoformat()
+
+def read_digest(path):
+    """The digest recorded in an existing sitemap file, or None."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            f.readline()  # XML declaration
+            line = f.readline()
+    except (OSError, UnicodeDecodeError):
+        return None
+    prefix, suffix = DIGEST_FORMAT.split('{}')
+    if line.startswith(prefix) and line.endswith(suffix):
+        return line[len(prefix):-len(suffix)]
+    return None
+
+
+class SitemapGenerator(GeneratorBase):
+    """Adds "/sitemap.xml" listing every page added by earlier generators.
+
+    Added after the default generators, so pages from generators added later
+    are not included.
+    """
+
+    def __init__(self, base_url=None, max_urls=MAX_URLS, max_bytes=MAX_BYTES, **kwargs):
+        if not isinstance(base_url, str) or not base_url:
+            raise ConfigError(None, 'sitemap base_url must be given, like "https://example.com"')
+        self.base_url = base_url.rstrip('/')
+        self.max_urls = max_urls
+        self.max_bytes = max_bytes
+
+        if not isinstance(self.max_urls, int) or not 1 <= self.max_urls <= MAX_URLS:
+            raise ConfigError(None, "sitemap max_urls must be an integer from 1 to {}".format(MAX_URLS))
+        if not isinstance(self.max_bytes, int) or not 1 <= self.max_bytes <= MAX_BYTES:
+            raise ConfigError(None, "sitemap max_bytes must be an integer from 1 to {}".format(MAX_BYTES))
+        if kwargs:
+            key = list(kwargs.keys())[0]
+            raise ConfigError(None, 'Unexpected field "{}" in sitemap config'.format(key))
+
+    @classmethod
+    def from_conf(cls, yaml_file, data):
+        if not isinstance(data, dict):
+            raise ConfigError(yaml_file, 'Expected sitemap option to be a dict, got "{}"'.format(type(data)))
+        try:
+            return cls(**data)
+        except ConfigError as e:
+            # Re-raise after adding yaml_file info
+            e.filename = yaml_file
+            raise e
+
+    def entry(self, url, lastmod):
+        loc = format_loc(self.base_url + url)
+        if lastmod:
+            return "<url><loc>{}</loc><lastmod>{}</lastmod></url>\n".format(loc, lastmod)
+        return "<url><loc>{}</loc></url>\n".format(loc)
+
+    def __call__(self, app):
+        urls = [url for url in app.sorted_urls if buildactions.is_page(app.url_map[url])]
+
+        # Split into files by the protocol limits. Entries aren't kept: each
+        # file formats its entries again from the urls and their lastmod
+        # while writing them out.
+        fixed_size = len(XML_DECLARATION + DIGEST_FORMAT.format("0" * 64) +
+                         URLSET_START + URLSET_END)
+        files = [SitemapFile(self, [])]
+        size = fixed_size
+        for url in urls:
+            lastmod = get_lastmod(app.url_map[url])
+            entry = self.entry(url, lastmod).encode('utf-8')
+            current = files[-1]
+            if current.urls and (len(current.urls) >= self.max_urls or
+                                 size + len(entry) > self.max_bytes):
+                current = SitemapFile(self, [])
+                files.append(current)
+                size = fixed_size
+            current.add(url, lastmod, entry)
+            size += len(entry)
+
+        if len(files) == 1:
+            app.add_url("/sitemap.xml/", files[0], name="sitemap.xml")
+            return
+
+        index = [XML_DECLARATION, INDEX_START]
+        for i, sitemap_file in enumerate(files, 1):
+            name = "sitemap-{}.xml".format(i)
+            app.add_url("/{}/".format(name), sitemap_file, name=name)
+            index.append("<sitemap><loc>{}</loc></sitemap>\n".format(
+                    format_loc("{}/{}".format(self.base_url, name))))
+        index.append(INDEX_END)
+        app.add_url("/sitemap.xml/", buildactions.File(''.join(index)), name="sitemap.xml")
+
+class SitemapFile(buildactions.BuildAction):
+    """Streams one `<urlset>` sitemap file to disk."""
+
+    def __init__(self, generator, urls):
+        self.generator = generator
+        self.urls = urls  # (url, lastmod or None)s
+        self._hash = hashlib.sha256()
+
+    def add(self, url, lastmod, entry):
+        self.urls.append((url, lastmod))
+        self._hash.update(entry)
+
+    @property
+    def digest(self):
+        return self._hash.hexdigest()
+
+    def do(self, app, dest):
+        remove_link(dest)
+        digest = self.digest
+        if read_digest(dest) == digest:
+            app.stats.incr("sitemap files unchanged")
+            return
+
+        self.makedirs(dest)
+        with open(dest, 'w', encoding='utf-8') as f:
+            f.write(XML_DECLARATION)
+            f.write(DIGEST_FORMAT.format(digest))
+            f.write(URLSET_START)
+            for url, lastmod in self.urls:
+                f.write(self.generator.entry(url, lastmod))
+            f.write(URLSET_END)
+        app.stats.incr("sitemap files written")
@@ -0,0 +1,214 @@
+"""Timing and memory instrumentation for builds.
+
+`App.stats` is a `BuildStats` instance that records, for each phase of a build
+(config load, each generator, rendering, writing, ...), the wall time, CPU
+time and memory use. Phases that run many times, like rendering each url, are
+accumulated under one name. These run too often to afford the system calls
+`BuildStats.phase()` makes, so they only record wall time, with
+`BuildStats.add_time()`. Free-form counters (bytes written, files skipped,
+...) can be recorded alongside with `BuildStats.incr()`.
+
+Phases and counters may be recorded from worker threads. Times from threads
+running in parallel add up, so a phase's wall time can exceed the build's.
+Memory is only traced for phases in the thread that created the stats.
+"""
+
+import sys
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # pragma: nocover
+    resource = None  # Not available on Windows
+
+
+def get_max_rss():
+    """Peak resident set size of this process in bytes, or None if unknown."""
+    if resource is None:
+        return None  # pragma: nocover
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+def format_bytes(n):
+    if n is None:
+        return "-"
+    if abs(n) < 1024:
+        return "{} B".format(n)
+    for unit in ("KiB", "MiB", "GiB"):
+        n /= 1024
+        if abs(n) < 1024 or unit == "GiB":
+            return "{:.1f} {}".format(n, unit)
+
+
+class PhaseStats():
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.wall_time = 0.0
+        self.cpu_time = None  # Only for phases recorded with `phase()`
+        self.peak_traced = None  # Bytes, only with `trace_memory`
+        self.max_rss = None  # Bytes, process-wide peak as of the phase's end
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "count": self.count,
+            "wall_time": self.wall_time,
+            "cpu_time": self.cpu_time,
+            "peak_traced": self.peak_traced,
+            "max_rss": self.max_rss,
+        }
+
+class BuildStats():
+
+    def __init__(self, trace_memory=False):
+        """
+        `trace_memory`: Use `tracemalloc` to record the peak memory allocated
+            within each phase, and enable `top_allocations()`. This slows the
+            build down noticeably, so it is off by default.
+        """
+        self.trace_memory = trace_memory
+        self.phases = {}  # Maps phase name to `PhaseStats`, in order started
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._thread_id = threading.get_ident()
+
+        self._started_tracing = False
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    @property
+    def _stack(self):
+        # Open phases of the current thread, as
+        # [PhaseStats, peak traced memory seen so far]
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager which records everything inside as phase `name`."""
+        with self._lock:
+            stats = self.phases.get(name)
+            if stats is None:
+                stats = self.phases[name] = PhaseStats(name)
+
+        stack = self._stack
+        trace = self.trace_memory and threading.get_ident() == self._thread_id
+        if trace:
+            # Credit the peak so far to the enclosing phase, then start fresh
+            # so this phase's peak is its own.
+            if stack:
+                stack[-1][1] = max(stack[-1][1], tracemalloc.get_traced_memory()[1])
+            self._reset_peak()
+        stack.append([stats, 0])
+
+        start_wall = time.perf_counter()
+        start_cpu = time.thread_time()
+        try:
+            yield stats
+        finally:
+            wall_time = time.perf_counter() - start_wall
+            cpu_time = time.thread_time() - start_cpu
+            max_rss = get_max_rss()
+            with self._lock:
+                stats.count += 1
+                stats.wall_time += wall_time
+                stats.cpu_time = (stats.cpu_time or 0.0) + cpu_time
+                stats.max_rss = max_rss
+
+            _, peak = stack.pop()
+            if trace:
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                stats.peak_traced = max(stats.peak_traced or 0, peak)
+                if stack:
+                    stack[-1][1] = max(stack[-1][1], peak)
+                self._reset_peak()
+
+    def add_time(self, name, wall_time):
+        """Add one run of phase `name` that took `wall_time` seconds.
+
+        For phases that run once per url, where `phase()` would slow down
+        the build it's measuring. Only wall time is recorded.
+        """
+        with self._lock:
+            stats = self.phases.get(name)
+            if stats is None:
+                stats = self.phases[name] = PhaseStats(name)
+            stats.count += 1
+            stats.wall_time += wall_time
+
+    @staticmethod
+    def _reset_peak():
+        # Python < 3.9 can't reset the peak, so phases report the peak of the
+        # whole build so far instead.
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def top_allocations(self, limit=10):
+        """The source lines currently holding the most allocated memory.
+
+        Returns a list of dicts with keys "filename", "lineno", "size" (bytes)
+        and "count" (number of allocations).
+        """
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("top_allocations() requires trace_memory=True")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+        top = []
+        for stat in snapshot.statistics("lineno")[:limit]:
+            frame = stat.traceback[0]
+            top.append({
+                "filename": frame.filename,
+                "lineno": frame.lineno,
+                "size": stat.size,
+                "count": stat.count,
+            })
+        return top
+
+    def stop(self):
+        """Stop tracing memory, if this object started it."""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def as_dict(self):
+        return {
+            "phases": [p.as_dict() for p in self.phases.values()],
+            "counters": dict(self.counters),
+            "max_rss": get_max_rss(),
+        }
+
+    def format(self):
+        """Human readable table of phases and counters."""
+        name_width = max([len(name) for name in self.phases] + [5])
+        fmt = "{:<%d}  {:>7}  {:>10}  {:>10}  {:>11}  {:>11}" % name_width
+        lines = [fmt.format("Phase", "Count", "Wall (s)", "CPU (s)", "Peak Alloc", "Max RSS")]
+        for p in self.phases.values():
+            lines.append(fmt.format(
+                p.name,
+                p.count,
+                "{:.3f}".format(p.wall_time),
+                "-" if p.cpu_time is None else "{:.3f}".format(p.cpu_time),
+                format_bytes(p.peak_traced),
+                format_bytes(p.max_rss),
+            ))
+        for name, value in sorted(self.counters.items()):
+            lines.append("{}: {}".format(name, value))
+        return '\n'.join(lines)
@@ -1,15 +1,20 @@
 import os
+import math
 
 from datetime import datetime
 
 import yaml
 import jinja2.exceptions
 
-from .helpers import remove_extension
+from .helpers import remove_extension, normalize_url
 from .exceptions import TemplateError, FrontmatterError, TemplateNotFound
 
 DEFAULT_TEMPLATE = "default.html"
 
+# Parsing frontmatter dominates reading large collections, and libyaml's
+# loader is many times faster than the pure Python one.
+FrontmatterLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 def extract_info_from_filename(fname):
     fname = remove_extension(fname)
     info = {}
@@ -40,32 +45,56 @@ def str_to_date(s):
 def read_frontmatter_file(filename):
     """Returns (frontmatter dict, contents string)."""
     with open(filename) as f:
-        lines = list(f)
+        fm = parse_frontmatter(_read_frontmatter_yaml(f, filename), filename)
+        content = f.read()
+    return fm, content
+
+def read_frontmatter(filename):
+    """Returns the frontmatter dict, without reading the rest of the file."""
+    with open(filename) as f:
+        return parse_frontmatter(_read_frontmatter_yaml(f, filename), filename)
 
-    # Find frontmatter markers
+def _read_frontmatter_yaml(f, filename):
+    # Reads lines from `f` up to and including the closing marker
     marker = "---\n"
-    fm_start = None
-    try:
-        fm_start = lines.index(marker)
-        fm_end = lines.index(marker, fm_start+1)
-    except ValueError:
-        # Allow last line to contain marker but no newline
-        if fm_start is not None and lines[-1] == marker[:-1]:
-            fm_end = len(lines)-1
+    preceding_lines = []
+    yaml_lines = None
+    for line in f:
+        if yaml_lines is None:
+            if line == marker:
+                yaml_lines = []
+            else:
+                preceding_lines.append(line)
+        elif line == marker or line == marker[:-1]:
+            # Allow last line to contain marker but no newline
+            break
         else:
-            raise FrontmatterError(filename, 'Missing opening and closing '
-                    '"---" frontmatter delimiter lines.') from None
+            yaml_lines.append(line)
+    else:
+        raise FrontmatterError(filename, 'Missing opening and closing '
+                '"---" frontmatter delimiter lines.') from None
 
     # Ensure that all preceeding lines are blank
     #TODO: Should we consider this to be no frontmatter instead of erroring?
-    if ''.join(lines[:fm_start]).strip():
+    if ''.join(preceding_lines).strip():
         raise FrontmatterError(filename, 'Frontmatter marker "---" may only '
                 'be preceeded by blank lines.') from None
 
-    yaml_lines = lines[fm_start+1:fm_end]
+    return ''.join(yaml_lines)
+
+def _skip_frontmatter(f):
+    # Reads lines from `f` up to and including the closing marker, for files
+    # already known to have valid frontmatter
+    opened = False
+    for line in f:
+        if not opened:
+            opened = line == "---\n"
+        elif line == "---\n" or line == "---":
+            return
 
+def parse_frontmatter(yaml_text, filename):
     try:
-        fm = yaml.load(''.join(yaml_lines))
+        fm = yaml.load(yaml_text, Loader=FrontmatterLoader)
     except (ValueError, yaml.error.YAMLError) as e:
         raise FrontmatterError(filename, e) from None
     if fm is None:
@@ -75,10 +104,100 @@ def read_frontmatter_file(filename):
         raise FrontmatterError(filename, 'Frontmatter must be a YAML mapping, '
                 'not "{}"'.format(type(fm))) from None
 
-    content = ''.join(lines[fm_end+1:])
-    return fm, content
+    return fm
+
+class FrontmatterCache():
+    """Parsed frontmatter of markdown files, kept while the files are unchanged.
+
+    An app keeps one between builds, so rebuilds only parse the frontmatter of
+    files that changed. Files are checked by size and mtime.
+    """
+
+    def __init__(self):
+        self.entries = {}  # Maps filename to ((size, mtime_ns), frontmatter)
+
+    def _lookup(self, filename, f, skip):
+        """The frontmatter of open file `f`. If `skip`, `f` is left after the
+        frontmatter block, ready to read the content."""
+        st = os.fstat(f.fileno())
+        key = (st.st_size, st.st_mtime_ns)
+        entry = self.entries.get(filename)
+        if entry is not None and entry[0] == key:
+            if skip:
+                _skip_frontmatter(f)
+            return entry[1]
+        fm = parse_frontmatter(_read_frontmatter_yaml(f, filename), filename)
+        self.entries[filename] = (key, fm)
+        return fm
+
+    def read(self, filename):
+        """Like `read_frontmatter()`."""
+        with open(filename) as f:
+            return self._lookup(filename, f, skip=False)
+
+    def read_file(self, filename):
+        """Like `read_frontmatter_file()`."""
+        with open(filename) as f:
+            fm = self._lookup(filename, f, skip=True)
+            content = f.read()
+        return fm, content
+
+class Paginator():
+    """One page of a paginated collection page, available in its context.
+
+    Items are sliced from the collection when accessed, so they follow the
+    collection's final order.
+    """
+
+    def __init__(self, collection, base_url, per_page, number):
+        self.collection = collection
+        self.base_url = base_url
+        self.per_page = per_page
+        self.number = number  # 1-based
+
+    @staticmethod
+    def count_pages(n_items, per_page):
+        return max(1, math.ceil(n_items / per_page))
+
+    @staticmethod
+    def url_for(base_url, number):
+        if number == 1:
+            return base_url
+        return normalize_url(base_url + "page/{}".format(number))
+
+    @property
+    def num_pages(self):
+        return self.count_pages(len(self.collection.items), self.per_page)
+
+    @property
+    def items(self):
+        start = (self.number - 1) * self.per_page
+        return self.collection.items[start:start+self.per_page]
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def page_url(self, number):
+        return self.url_for(self.base_url, number)
+
+    @property
+    def has_prev(self):
+        return self.number > 1
+
+    @property
+    def has_next(self):
+        return self.number < self.num_pages
+
+    @property
+    def prev_url(self):
+        return self.page_url(self.number - 1) if self.has_prev else None
+
+    @property
+    def next_url(self):
+        return self.page_url(self.number + 1) if self.has_next else None
 
 class View():
+    __slots__ = ()
 
     def __call__(self):
         raise NotImplementedError()  # pragma: no cover
@@ -102,6 +221,9 @@ class TemplateView(View):
         except KeyError:
             raise AttributeError
 
+    def get(self, key, default=None):
+        return self.context.get(key, default)
+
     def set_url(self, url):
         self.url = url
         self.context["url"] = url
@@ -145,10 +267,10 @@ class TemplateView(View):
 
 class MarkdownView(TemplateView):
 
-    def __init__(self, md_file, *args, **kwargs):
+    def __init__(self, md_file, app, *args, **kwargs):
         self.md_file = md_file
-        self.frontmatter, self.content = read_frontmatter_file(self.md_file)
-        super().__init__(*args, **kwargs)
+        self.frontmatter, self.content = app.frontmatter_cache.read_file(self.md_file)
+        super().__init__(app, *args, **kwargs)
 
     def get_context(self):
         context = super().get_context()
@@ -163,3 +285,100 @@ class MarkdownView(TemplateView):
         context.update(self.frontmatter)
 
         return context
+
+class CollectionItem(View):
+    """A collection item that holds only its frontmatter in memory.
+
+    Looking up fields that come from the frontmatter, the filename or the
+    collection is cheap. Anything else, like the content, builds a full
+    `MarkdownView` for the lookup. It is kept until the template render in
+    progress finishes (see `App.render_cache()`), so large collections don't
+    hold every item's body and context in memory. Rendering the item's own
+    page also builds a `MarkdownView`.
+    """
+
+    __slots__ = ("md_file", "app", "collection", "url", "frontmatter")
+
+    # Context keys only a full `MarkdownView` can provide
+    VIEW_KEYS = ("page", "context")
+
+    def __init__(self, md_file, app, collection, url=None):
+        self.md_file = md_file
+        self.app = app
+        self.collection = collection
+        self.url = url
+        self.frontmatter = app.frontmatter_cache.read(md_file)
+
+    @property
+    def info(self):
+        # Cheap to recompute, so not worth keeping per item
+        return extract_info_from_filename(os.path.basename(self.md_file))
+
+    def set_url(self, url):
+        self.url = url
+
+    def get(self, key, default=None):
+        # Same precedence as `MarkdownView.get_context()` and `set_url()`,
+        # from the highest
+        if key == "url":
+            return self.url
+        if key in self.frontmatter:
+            return self.frontmatter[key]
+        if key in ("date", "slug"):
+            info = self.info
+            if key in info:
+                return info[key]
+        if key == "frontmatter":
+            return self.frontmatter
+        if key == "content":
+            return self.view.content
+        if key in self.collection.context:
+            return self.collection.context[key]
+        if key == "template":
+            return DEFAULT_TEMPLATE
+        if key in ("app", "collection"):
+            return getattr(self, key)
+        if key == "collections":
+            return self.app.collections
+        if key in self.VIEW_KEYS:
+            return self.view.context[key]
+        return default
+
+    def fields(self):
+        """Dict of the fields available without reading the content."""
+        fields = {"url": self.url}
+        fields.update(self.collection.context)
+        fields.update(self.info)
+        fields.update(self.frontmatter)
+        return fields
+
+    _missing = object()
+
+    def __getitem__(self, key):
+        value = self.get(key, self._missing)
+        if value is self._missing:
+            raise KeyError(key)
+        return value
+
+    def __getattr__(self, key):
+        value = self.get(key, self._missing)
+        if value is self._missing:
+            raise AttributeError(key)
+        return value
+
+    @property
+    def view(self):
+        cache = self.app.render_cache()
+        key = (CollectionItem, self.md_file)
+        if cache is not None and key in cache:
+            return cache[key]
+        view = MarkdownView(self.md_file, self.app, collection=self.collection)
+        view.set_url(self.url)
+        if cache is not None:
+            cache[key] = view
+        return view
+
+    def __call__(self):
+        if not self.url:
+            raise RuntimeError("Programmer error: url should have been set")  # pragma: nocover
+        return self.view()
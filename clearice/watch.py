@@ -0,0 +1,181 @@
+"""Building the site again when its files change, for `clearice watch`.
+
+`ChangeHandler` receives filesystem events for the content directory, the
+template directory and "conf.yaml" (see `make_observer()`), and passes the
+changed paths to a `BuildScheduler`. The scheduler collects changes until
+they stop arriving for a moment, so saving several files at once makes one
+build, then builds on a worker thread. Changes that arrive during a build
+cancel it, and it starts again with the new changes included.
+"""
+
+import os
+import time
+import threading
+import traceback
+
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler, EVENT_TYPE_CREATED, \
+        EVENT_TYPE_DELETED, EVENT_TYPE_MODIFIED, EVENT_TYPE_MOVED
+
+from .exceptions import BuildCancelled
+from .helpers import IGNORED_FILES, fnmatch_one_of
+
+# Opened and closed events don't change anything
+CHANGE_EVENTS = (EVENT_TYPE_CREATED, EVENT_TYPE_DELETED, EVENT_TYPE_MODIFIED, EVENT_TYPE_MOVED)
+
+# Files the build ignores, like editor swap and backup files, plus the file
+# vim writes to test if it can write to a directory
+IGNORED_CHANGES = IGNORED_FILES + ["4913"]
+
+
+class BuildScheduler():
+
+    def __init__(self, build, quiet_period=0.1):
+        """
+        `build`: Called on the worker thread with a set of changed paths, or
+            None to build everything. It should raise `BuildCancelled` soon
+            after `self.cancel_event` is set, like `App` does when given it
+            as its `cancel_event`.
+        `quiet_period`: Seconds to wait for more changes before building.
+        """
+        self.build = build
+        self.quiet_period = quiet_period
+        self.cancel_event = threading.Event()
+        self.condition = threading.Condition()
+        self.changed_paths = set()  # Waiting to be built
+        self.build_all = False
+        self.has_changes = False
+        self.last_change_time = 0
+        self.building = False
+        self.stopping = False
+        self.n_cancelled = 0
+        self.thread = None
+
+    def add_changes(self, paths):
+        """Queue paths to build, or everything if `paths` is None."""
+        with self.condition:
+            if paths is None:
+                self.build_all = True
+            else:
+                self.changed_paths.update(paths)
+            self.has_changes = True
+            self.last_change_time = time.monotonic()
+            if self.building:
+                self.cancel_event.set()
+            self.condition.notify_all()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Cancel any build in progress and stop the worker thread."""
+        with self.condition:
+            self.stopping = True
+            self.cancel_event.set()
+            self.condition.notify_all()
+        if self.thread:
+            self.thread.join()
+
+    def wait_idle(self, timeout=None):
+        """Wait until all changes are built. Returns False on timeout."""
+        with self.condition:
+            return self.condition.wait_for(
+                    lambda: not self.has_changes and not self.building, timeout)
+
+    def _take_changes(self):
+        """Wait for changes to settle, then take them. Called with the lock
+        held. Returns False when stopping."""
+        while not self.stopping:
+            if not self.has_changes:
+                self.condition.wait()
+                continue
+            remaining = self.last_change_time + self.quiet_period - time.monotonic()
+            if remaining > 0:
+                self.condition.wait(remaining)
+                continue
+
+            paths = None if self.build_all else self.changed_paths
+            self.changed_paths = set()
+            self.build_all = False
+            self.has_changes = False
+            self.building = True
+            self.cancel_event.clear()
+            return True, paths
+        return False, None
+
+    def _run(self):
+        while True:
+            with self.condition:
+                running, paths = self._take_changes()
+            if not running:
+                return
+
+            cancelled = False
+            try:
+                self.build(paths)
+            except BuildCancelled:
+                cancelled = True
+            except Exception:
+                # Keep watching after unexpected errors
+                traceback.print_exc()
+
+            with self.condition:
+                if cancelled:
+                    # Build these along with the changes that cancelled it
+                    self.n_cancelled += 1
+                    if paths is None:
+                        self.build_all = True
+                    else:
+                        self.changed_paths.update(paths)
+                    self.has_changes = True
+                self.building = False
+                self.condition.notify_all()
+
+
+class ChangeHandler(FileSystemEventHandler):
+    """Passes changes to the site's files to a `BuildScheduler`."""
+
+    def __init__(self, app, scheduler):
+        self.scheduler = scheduler
+        self.conf_path = app.conf_path
+        # Builds write to these, even if they're in a watched directory, so
+        # their changes would start the next build forever
+        self.output_dirs = (app.build_dir, app.cache_dir)
+        self.watched_dirs = (app.content_dir, app.template_dir)
+
+    def is_watched(self, path):
+        if path == self.conf_path:
+            return True
+        if fnmatch_one_of(os.path.basename(path), IGNORED_CHANGES):
+            return False
+        if any(path.startswith(d + os.sep) for d in self.output_dirs):
+            return False
+        return any(path.startswith(d + os.sep) for d in self.watched_dirs)
+
+    def on_any_event(self, event):
+        if event.event_type not in CHANGE_EVENTS:
+            return
+        if event.is_directory and event.event_type == EVENT_TYPE_MODIFIED:
+            return  # A file in it changed, which has its own event
+        paths = [event.src_path]
+        if getattr(event, "dest_path", None):
+            paths.append(event.dest_path)
+        paths = [path for path in paths if self.is_watched(path)]
+        if paths:
+            self.scheduler.add_changes(paths)
+
+def make_observer(app, handler):
+    """An `Observer` sending changes of the site's files to `handler`.
+
+    Only the content and template directories are watched recursively, so
+    writing the build output doesn't make events. The directories are the
+    ones configured when this is called.
+    """
+    observer = Observer()
+    for path in (app.content_dir, app.template_dir):
+        if os.path.isdir(path):
+            observer.schedule(handler, path, recursive=True)
+    # For "conf.yaml"
+    observer.schedule(handler, app.root_dir, recursive=False)
+    return observer
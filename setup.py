@@ -28,12 +28,13 @@ setup(
         "Environment :: Console",
         "Operating System :: OS Independent",
         "Programming Language :: Python :: 3 :: Only",
-        "Programming Language :: Python :: 3.5",
+        "Programming Language :: Python :: 3.7",
         "Topic :: Internet :: WWW/HTTP",
         "License :: OSI Approved :: GNU Lesser General Public License v3 (LGPLv3)",
     ],
     keywords=["generator", "static website", "html"],
     packages=["clearice"],
+    python_requires=">=3.7",
     license="LICENSE.txt",
     install_requires=[
         "Jinja2",
@@ -43,6 +44,9 @@ setup(
         "hfilesize",
         "watchdog",
     ],
+    extras_require={
+        "images": ["Pillow"],
+    },
     entry_points={
         "console_scripts": [
             "clearice=clearice.cli:main",
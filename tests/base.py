@@ -13,6 +13,7 @@ class BaseTest(unittest.TestCase):
         self.tmp_dir = None
         self.paths_accounted_for = set()
         self.app = None  # Set by generate()
+        self.output = None  # Set by generate_in_memory()
 
     def write_file(self, path, content):
         if not self.tmp_dir:
@@ -107,6 +108,26 @@ class BaseTest(unittest.TestCase):
         self.app.generate()
         return self.app
 
+    def generate_in_memory(self, **kwargs):
+        """Generate into a `MemoryOutput` instead of the build directory.
+
+        Faster for tests that only check what was built, with
+        `assertOutputContents()` and `assertOutputFiles()`.
+        """
+        self.output = clearice.output.MemoryOutput()
+        self.make_app(output=self.output, **kwargs)
+        self.app.generate()
+        return self.output
+
+    def assertOutputContents(self, relpath, expected_contents):
+        self.assertIsNotNone(self.output)
+        self.assertIn(relpath, self.output.files)
+        self.assertEqual(self.output.read(relpath).decode('utf-8'), expected_contents)
+
+    def assertOutputFiles(self, relpaths):
+        self.assertIsNotNone(self.output)
+        self.assertEqual(sorted(self.output.files), sorted(relpaths))
+
     def tearDown(self):
         if self.tmp_dir:
             self.assertNoLooseFiles()
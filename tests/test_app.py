@@ -13,22 +13,22 @@ class TestApp(BaseTest):
         self.write_file("content/about.md", "---\n---\nAbout!")
         self.write_file("content/subdir/foo.md", "---\n---\nfoo!")
         self.write_file("content/subdir/index.md", "---\n---\nsubdir index")
-        self.generate()
-        self.assertFileContents("build/index.html", "Hello!")
-        self.assertFileContents("build/about/index.html", "About!")
-        self.assertFileContents("build/subdir/foo/index.html", "foo!")
-        self.assertFileContents("build/subdir/index.html", "subdir index")
+        self.generate_in_memory()
+        self.assertOutputContents("index.html", "Hello!")
+        self.assertOutputContents("about/index.html", "About!")
+        self.assertOutputContents("subdir/foo/index.html", "foo!")
+        self.assertOutputContents("subdir/index.html", "subdir index")
 
     def test_mankdown_simple(self):
         self.write_file("content/index.md", "---\n---\nHello!\n_i_**b**")
-        self.generate()
-        self.assertFileContents("build/index.html", "<p>Hello!\n<em>i</em><strong>b</strong></p>")
+        self.generate_in_memory()
+        self.assertOutputContents("index.html", "<p>Hello!\n<em>i</em><strong>b</strong></p>")
 
     def test_frontmatter_simple(self):
         self.write_file("templates/default.html", "{{ content }}{{ var1 }}")
         self.write_file("content/index.md", "---\nvar1: val1\n---\nHello!\n")
-        self.generate()
-        self.assertFileContents("build/index.html", "Hello!\nval1")
+        self.generate_in_memory()
+        self.assertOutputContents("index.html", "Hello!\nval1")
 
     def test_frontmatter_delimiter(self):
         self.write_file("templates/default.html", "{{ content }}")
@@ -72,8 +72,8 @@ class TestApp(BaseTest):
         #  Empty frontmatter yaml gives empty frontmatter dict
         self.write_file("templates/default.html", "{{ context.frontmatter | safe }}")
         self.write_file("content/index.md", "---\n\n---\n")
-        self.generate()
-        self.assertFileContents("build/index.html", "{}")
+        self.generate_in_memory()
+        self.assertOutputContents("index.html", "{}")
 
     def test_frontmatter_parse_errors(self):
         self.write_file("templates/default.html", "{{ context.frontmatter | safe }}")
@@ -148,8 +148,8 @@ class TestApp(BaseTest):
         self.write_file("templates/default.html",
                 "{{ date }}, {{ date.strftime('%A') }}, {{ slug }}")
         self.write_file("content/blog/2020-01-02_post_name.md", "---\n---")
-        self.generate()
-        self.assertFileContents("build/blog/2020-01-02_post_name/index.html",
+        self.generate_in_memory()
+        self.assertOutputContents("blog/2020-01-02_post_name/index.html",
                 "2020-01-02, Thursday, post_name")
 
     def test_date_from_frontmatter(self):
@@ -158,8 +158,8 @@ class TestApp(BaseTest):
                 "{{ date }}, {{ date.strftime('%A') }}")
         self.write_file("content/blog/2000-01-01_post.md",
                 "---\ndate: 2020-01-02\n---")  # Frontmatter overwrites filename date
-        self.generate()
-        self.assertFileContents("build/blog/2000-01-01_post/index.html",
+        self.generate_in_memory()
+        self.assertOutputContents("blog/2000-01-01_post/index.html",
                 "2020-01-02, Thursday") #TODO: day of week is locale specific
 
     def test_invalid_dates(self):
@@ -169,8 +169,8 @@ class TestApp(BaseTest):
         self.write_file("templates/default.html",
                 "{% if date is defined %}{{ date }}{% endif %}, {{ slug }}")
         self.write_file("content/blog/202A-01-02_post_name.md", "---\n---")
-        self.generate()
-        self.assertFileContents("build/blog/202A-01-02_post_name/index.html",
+        self.generate_in_memory()
+        self.assertOutputContents("blog/202A-01-02_post_name/index.html",
                 ", 202A-01-02_post_name")
 
         # Date in frontmatter out of month range
@@ -186,8 +186,8 @@ class TestApp(BaseTest):
         self.write_file("templates/default.html",
                 "{% if date is defined %}{{ date }}{% endif %}, {{ slug }}")
         self.write_file("content/blog/post.md", '---\ndate: "2000-01-38"\n---')
-        self.generate()
-        self.assertFileContents("build/blog/post/index.html",
+        self.generate_in_memory()
+        self.assertOutputContents("blog/post/index.html",
                 "2000-01-38, post")
 
     def test_relative_root_dir1(self):
@@ -234,8 +234,8 @@ class TestApp(BaseTest):
                 "{{ foo }}\n{{ content }}")
         self.write_file("content/index.md",
                 "---\nfoo: escape <br> me\n---\nshould be & escaped")
-        self.generate()
-        self.assertFileContents("build/index.html",
+        self.generate_in_memory()
+        self.assertOutputContents("index.html",
                 "escape &lt;br&gt; me\nshould be &amp; escaped")
 
     def test_extra_files_removed(self):
@@ -297,3 +297,85 @@ class TestApp(BaseTest):
         self.app.add_url("/textfile.txt", object())
         with self.assertRaisesRegex(RuntimeError, "Could not resolve action from view."):
             self.generate()
+
+    def test_html_transform(self):
+        self.write_file("content/file1", "file1 content")
+
+        self.make_app()
+        self.app.add_html_transform(lambda html, url: html.upper())
+        self.app.add_html_transform(lambda html, url: html + url)
+        self.app.add_url("/textfile.txt", clearice.buildactions.File("not html"))
+        self.app.add_url("/html_file", "html file")
+        self.app.add_url("/html_file2", lambda: clearice.buildactions.Html("html file 2"))
+        self.generate()
+
+        self.assertFileContents("build/textfile.txt", "not html")
+        self.assertFileContents("build/html_file/index.html", "HTML FILE/html_file")
+        self.assertFileContents("build/html_file2/index.html", "HTML FILE 2/html_file2")
+
+    def test_minify_html(self):
+        self.write_file("conf.yaml", "minify_html: true")
+        self.write_file("templates/default.html",
+                "<html>\n  <body>\n    <!-- comment -->\n    {{ content|markdown }}\n"
+                "    <pre>\n  keep   this\n</pre>\n  </body>\n</html>\n")
+        self.write_file("content/index.md", "---\n---\nHello,    world!")
+        self.generate_in_memory()
+        self.assertOutputContents("index.html",
+                "<html>\n<body>\n<p>Hello, world!</p>\n"
+                "<pre>\n  keep   this\n</pre>\n</body>\n</html>")
+        counters = self.app.stats.counters
+        self.assertEqual(counters["html bytes before minify"] - counters["html bytes after minify"], 36)
+
+    def test_url_for(self):
+        self.write_file("content/blog/_collection.yaml", """
+            pages:
+                - title: index
+                  template: index.html
+                  paginate: 1
+        """)
+        self.write_file("content/blog/post1.md", "---\n---")
+        self.write_file("content/blog/post2.md", "---\n---")
+        self.write_file("content/about.md", "---\n---")
+        self.write_file("templates/default.html", "")
+        self.write_file("templates/index.html",
+                "{{ url_for('about') }} {{ url_for('blog/post1') }} "
+                "{{ url_for('blog/index') }} {{ url_for('blog/index', page=2) }}")
+        self.generate_in_memory()
+        self.assertOutputContents("blog/index.html", "/about/ /blog/post1/ /blog/ /blog/page/2/")
+
+        self.make_app()
+        self.app.add_url("/a/", "a", name="a")
+        with self.assertRaisesRegex(clearice.exceptions.UrlConflictError,
+                'Url name "a" is already used by "/a/"'):
+            self.app.add_url("/b/", "b", name="a")
+        self.app.add_url("/c/", "c", name="a", params={"n": 1})
+        self.assertEqual(self.app.url_for("a", n="1"), "/c/")
+
+    def test_url_for_not_found(self):
+        self.write_file("content/index.md", "---\n---")
+        self.write_file("templates/default.html", "{{ url_for('nope', page=2) }}")
+        self.assertGenerateRaises(
+            clearice.exceptions.TemplateError,
+            'No url named "nope with page=2"'
+        )
+
+    def test_url_tree(self):
+        self.make_app()
+        for url in ["/", "/docs/", "/docs/a/", "/docs/a/x/", "/docs/a-b/",
+                    "/docs/b/deep/", "/docs/c.css/", "/docsx/"]:
+            self.app.add_url(url, "")
+
+        self.assertEqual(self.app.urls_under("/docs/"), ["/docs/a-b/", "/docs/a/",
+                "/docs/a/x/", "/docs/b/deep/", "/docs/c.css/"])
+        self.assertEqual(self.app.urls_under("/nope/"), [])
+        self.assertEqual(self.app.children("/docs/"), ["/docs/a-b/", "/docs/a/", "/docs/c.css/"])
+        self.assertEqual(self.app.children("/"), ["/docs/", "/docsx/"])
+
+        self.assertEqual(self.app.parent("/docs/a/x/"), "/docs/a/")
+        self.assertEqual(self.app.parent("/docs/b/deep/"), "/docs/")
+        self.assertEqual(self.app.parent("/docs"), "/")
+        self.assertEqual(self.app.parent("/"), None)
+
+        # Urls added after a query are included in the next one
+        self.app.add_url("/docs/0/", "")
+        self.assertEqual(self.app.children("/docs/"), ["/docs/0/", "/docs/a-b/", "/docs/a/", "/docs/c.css/"])
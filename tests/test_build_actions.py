@@ -40,6 +40,17 @@ class TestBuildActions(BaseTest):
         self.assertFileContents("build/file", "file content")
         self.assertTrue(os.path.isfile(os.path.join(self.tmp_dir, "build/file")))
 
+    def test_copy_preserves_mtime(self):
+        os.utime(os.path.join(self.tmp_dir, "content/file"), ns=(1000000000, 2000000000))
+        self.app.add_url("/file", clearice.buildactions.Copy("file"))
+        self.generate()
+
+        self.assertFileContents("build/file", "file content")
+        st = os.stat(os.path.join(self.tmp_dir, "build/file"))
+        self.assertEqual(st.st_mtime_ns, 2000000000)
+        self.assertEqual(sum(n for name, n in self.app.stats.counters.items()
+                             if name.startswith("files copied with ")), 1)
+
     def test_link_soft(self):
         action = clearice.buildactions.Link("file")
 
@@ -83,3 +94,16 @@ class TestBuildActions(BaseTest):
         self.generate()
         self.assertFileContents("build/file", "file content")
         self.assertSoftLink("build/file", "content/file", is_relative=True)
+
+    def test_file_replaces_hard_link(self):
+        # Writing a file where a hard link to content was must not change
+        # the content file
+        self.app.add_url("/file", clearice.buildactions.Link("file", hard=True))
+        self.generate()
+        self.assertIsHardLink("build/file")
+
+        self.app.reset()
+        self.app.add_url("/file", clearice.buildactions.File("new content"))
+        self.generate()
+        self.assertFileContents("build/file", "new content")
+        self.assertFileContents("content/file", "file content")
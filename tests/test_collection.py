@@ -1,5 +1,6 @@
 
 import os.path
+from unittest import mock
 
 import clearice
 
@@ -16,8 +17,8 @@ class TestCollection(BaseTest):
         """)
         self.write_file("templates/test_page.html",
                 "{{ collection | length }}")
-        self.generate()
-        self.assertFileContents("build/blog/index.html", "0")
+        self.generate_in_memory()
+        self.assertOutputContents("blog/index.html", "0")
 
     def test_simple(self):
         self.write_file("content/blog/_collection.yaml", """
@@ -29,9 +30,9 @@ class TestCollection(BaseTest):
                 "---\ntitle: Item 1\n---")
         self.write_file("content/blog/item2.md",
                 "---\ntitle: Item 2\n---")
-        self.generate()
-        self.assertFileContents("build/blog/item1/index.html", "Item 1")
-        self.assertFileContents("build/blog/item2/index.html", "Item 2")
+        self.generate_in_memory()
+        self.assertOutputContents("blog/item1/index.html", "Item 1")
+        self.assertOutputContents("blog/item2/index.html", "Item 2")
 
     def test_blank_yaml(self):
         self.write_file("content/blog/_collection.yaml", "")
@@ -41,9 +42,9 @@ class TestCollection(BaseTest):
                 "---\ntitle: Item 1\n---")
         self.write_file("content/blog/item2.md",
                 "---\ntitle: Item 2\n---")
-        self.generate()
-        self.assertFileContents("build/blog/item1/index.html", "Item 1")
-        self.assertFileContents("build/blog/item2/index.html", "Item 2")
+        self.generate_in_memory()
+        self.assertOutputContents("blog/item1/index.html", "Item 1")
+        self.assertOutputContents("blog/item2/index.html", "Item 2")
 
     def test_yaml_empty_values(self):
         # When values like "context:" are empty, they return None. Are
@@ -63,8 +64,8 @@ class TestCollection(BaseTest):
             with self.subTest(yaml=yaml_txt, template=template_txt, expected=expected):
                 self.write_file("content/blog/_collection.yaml", yaml_txt)
                 self.write_file("templates/default.html", template_txt)
-                self.generate()
-                self.assertFileContents("build/blog/item1/index.html", expected)
+                self.generate_in_memory()
+                self.assertOutputContents("blog/item1/index.html", expected)
 
     def test_bad_config(self):
 
@@ -112,16 +113,16 @@ class TestCollection(BaseTest):
                 "---\ntitle: BBB\n---")
         self.write_file("content/blog/item2.md",
                 "---\ntitle: CCC\n---")
-        self.generate()
-        self.assertFileContents("build/blog/item1/index.html", "BBB. BBB CCC ")
-        self.assertFileContents("build/blog/item2/index.html", "CCC. BBB CCC ")
+        self.generate_in_memory()
+        self.assertOutputContents("blog/item1/index.html", "BBB. BBB CCC ")
+        self.assertOutputContents("blog/item2/index.html", "CCC. BBB CCC ")
 
         # Now change CCC to AAA. AAA comes before BBB
         self.write_file("content/blog/item2.md",
                 "---\ntitle: AAA\n---")
-        self.generate()
-        self.assertFileContents("build/blog/item1/index.html", "BBB. AAA BBB ")
-        self.assertFileContents("build/blog/item2/index.html", "AAA. AAA BBB ")
+        self.generate_in_memory()
+        self.assertOutputContents("blog/item1/index.html", "BBB. AAA BBB ")
+        self.assertOutputContents("blog/item2/index.html", "AAA. AAA BBB ")
 
     def test_item_order_date(self):
         self.write_file("content/blog/_collection.yaml", """
@@ -138,20 +139,92 @@ class TestCollection(BaseTest):
                 "---\ndate: 2018-01-20\na: first\n---")
         self.write_file("content/blog/item4.md",
                 "---\ndate: 2018-01-24\na: third\n---")
-        self.generate()
-        self.assertFileContents("build/blog/item1/index.html", "fourth. first second third fourth ")
-        self.assertFileContents("build/blog/item2/index.html", "second. first second third fourth ")
-        self.assertFileContents("build/blog/item3/index.html", "first. first second third fourth ")
-        self.assertFileContents("build/blog/item4/index.html", "third. first second third fourth ")
+        self.generate_in_memory()
+        self.assertOutputContents("blog/item1/index.html", "fourth. first second third fourth ")
+        self.assertOutputContents("blog/item2/index.html", "second. first second third fourth ")
+        self.assertOutputContents("blog/item3/index.html", "first. first second third fourth ")
+        self.assertOutputContents("blog/item4/index.html", "third. first second third fourth ")
 
         # Now switch first to come last
         self.write_file("content/blog/item3.md",
                 "---\ndate: 2222-01-20\na: first\n---")
-        self.generate()
-        self.assertFileContents("build/blog/item1/index.html", "fourth. second third fourth first ")
-        self.assertFileContents("build/blog/item2/index.html", "second. second third fourth first ")
-        self.assertFileContents("build/blog/item3/index.html", "first. second third fourth first ")
-        self.assertFileContents("build/blog/item4/index.html", "third. second third fourth first ")
+        self.generate_in_memory()
+        self.assertOutputContents("blog/item1/index.html", "fourth. second third fourth first ")
+        self.assertOutputContents("blog/item2/index.html", "second. second third fourth first ")
+        self.assertOutputContents("blog/item3/index.html", "first. second third fourth first ")
+        self.assertOutputContents("blog/item4/index.html", "third. second third fourth first ")
+
+    def test_item_order_typed(self):
+        # Numbers sort by value, not as text, and "-" reverses the order
+        for order, expected in [("weight", "2 10 x "), ("-weight", "x 10 2 ")]:
+            with self.subTest(order=order):
+                self.write_file("content/blog/_collection.yaml",
+                        "order: {}".format(order))
+                self.write_file("templates/default.html",
+                        "{% for item in collection %}{{ item.weight }} {% endfor %}")
+                self.write_file("content/blog/item1.md", "---\nweight: 10\n---")
+                self.write_file("content/blog/item2.md", "---\nweight: 2\n---")
+                self.write_file("content/blog/item3.md", "---\nweight: x\n---")
+                self.generate_in_memory()
+                self.assertOutputContents("blog/item1/index.html", expected)
+
+    def test_lazy_items(self):
+        self.write_file("content/blog/_collection.yaml", """
+            context:
+                author: nobody
+            url_format: "{{ date.year }}/{{ slug }}"
+            pages:
+                - title: index
+                  template: index.html
+        """)
+        self.write_file("content/blog/2018-01-01_a.md",
+                "---\ntitle: A\n---\n_body_")
+        self.write_file("templates/default.html",
+                "{{ url }} {{ title }} {{ author }} {{ content|markdown }}")
+        self.write_file("templates/index.html",
+                "{% for item in collection %}"
+                "{{ item.url }} {{ item.title }} {{ item.slug }} {{ item.author }} "
+                "{{ item['date'] }} {{ item.content }}"
+                "{% endfor %}")
+        self.generate_in_memory()
+        self.assertOutputContents("blog/2018/a/index.html",
+                "/blog/2018/a/ A nobody <p><em>body</em></p>")
+        self.assertOutputContents("blog/index.html",
+                "/blog/2018/a/ A a nobody 2018-01-01 _body_")
+
+        # Items don't keep their content or a full context around
+        item = list(self.app.collections)[0].items[0]
+        self.assertFalse(hasattr(item, "__dict__"))
+        self.assertEqual(item.get("missing", "default"), "default")
+        with self.assertRaises(AttributeError):
+            item.missing
+
+    def test_item_precedence(self):
+        # Items give the same values as their rendered page
+        self.write_file("content/blog/_collection.yaml", """
+            context:
+                content: from collection
+                frontmatter: from collection
+                slug: from collection
+            pages:
+                - title: index
+                  template: index.html
+        """)
+        self.write_file("content/blog/a.md", "---\ntitle: A\n---\nBody")
+        self.write_file("templates/default.html",
+                "{{ content }} {{ frontmatter.title }} {{ slug }}")
+        self.write_file("templates/index.html",
+                "{% for item in collection %}"
+                "{{ item.content }} {{ item.frontmatter.title }} {{ item.slug }}|"
+                "{{ item.content }}|{{ item['content'] }}"
+                "{% endfor %}")
+        with mock.patch.object(clearice.views, "MarkdownView",
+                               wraps=clearice.views.MarkdownView) as view_class:
+            self.generate_in_memory()
+        self.assertOutputContents("blog/a/index.html", "Body A a")
+        self.assertOutputContents("blog/index.html", "Body A a|Body|Body")
+        # One view for the item's page, one shared by the listing's lookups
+        self.assertEqual(view_class.call_count, 2)
 
     def test_non_item_file(self):
         self.write_file("content/blog/_collection.yaml", """
@@ -172,12 +245,12 @@ class TestCollection(BaseTest):
         self.write_file("content/blog/item3/index.md", "---\ntitle: Item 3\n---")
         self.write_file("content/blog/item3/supplimental_content.md", "---\ntitle: supplimental\n---")
         self.write_file("content/blog/not_an_item.yaml", "")
-        self.generate()
-        self.assertFileContents("build/blog/item1/index.html", "Item 1")
-        self.assertFileContents("build/blog/item2/index.html", "Item 2")
-        self.assertFileContents("build/blog/item3/index.html", "Item 3")
-        self.assertFileContents("build/blog/item3/supplimental_content/index.html", "supplimental")
-        self.assertFileContents("build/blog/index.html",
+        self.generate_in_memory()
+        self.assertOutputContents("blog/item1/index.html", "Item 1")
+        self.assertOutputContents("blog/item2/index.html", "Item 2")
+        self.assertOutputContents("blog/item3/index.html", "Item 3")
+        self.assertOutputContents("blog/item3/supplimental_content/index.html", "supplimental")
+        self.assertOutputContents("blog/index.html",
                 "/blog/item1/ /blog/item2/ /blog/item3/ ")
 
         # We don't copy over unknown files. In the future, specific unhandled
@@ -194,9 +267,9 @@ class TestCollection(BaseTest):
                 "---\ntitle: Item 1\n---")
         self.write_file("content/blog/item2.md",
                 "---\ntitle: Item 2\n---")
-        self.generate()
-        self.assertFileContents("build/blog/item1/index.html", "Item 1")
-        self.assertFileContents("build/blog/item2/index.html", "Item 2")
+        self.generate_in_memory()
+        self.assertOutputContents("blog/item1/index.html", "Item 1")
+        self.assertOutputContents("blog/item2/index.html", "Item 2")
 
     def test_pages(self):
         self.write_file("content/blog/_collection.yaml", """
@@ -211,13 +284,13 @@ class TestCollection(BaseTest):
         # No markdown content
         self.write_file("templates/page.html",
                 "{{ url }}\n{{ foo }}\n{{ content|markdown }}")
-        self.generate()
-        self.assertFileContents("build/blog/index.html", "/blog/\nbar\n")
+        self.generate_in_memory()
+        self.assertOutputContents("blog/index.html", "/blog/\nbar\n")
 
         # With markdown content
         self.write_file("content/blog/index.md", "---\n---\n_blah_")
-        self.generate()
-        self.assertFileContents("build/blog/index.html",
+        self.generate_in_memory()
+        self.assertOutputContents("blog/index.html",
                 "/blog/\nbar\n<p><em>blah</em></p>")
 
     def test_pages_with_path(self):
@@ -232,12 +305,172 @@ class TestCollection(BaseTest):
         """)
 
         self.write_file("templates/default.html", "{{ url }}")
-        self.generate()
-        self.assertFileContents("build/blog/index.html", "/blog/")
-        self.assertFileContents("build/blog/tags/index.html", "/blog/tags/")
-        self.assertFileContents("build/blog/subdir/page1/index.html", "/blog/subdir/page1/")
-        self.assertFileContents("build/blog/subdir/page2/index.html", "/blog/subdir/page2/")
-        self.assertFileContents("build/blog/subdir/page3/index.html", "/blog/subdir/page3/")
+        self.generate_in_memory()
+        self.assertOutputContents("blog/index.html", "/blog/")
+        self.assertOutputContents("blog/tags/index.html", "/blog/tags/")
+        self.assertOutputContents("blog/subdir/page1/index.html", "/blog/subdir/page1/")
+        self.assertOutputContents("blog/subdir/page2/index.html", "/blog/subdir/page2/")
+        self.assertOutputContents("blog/subdir/page3/index.html", "/blog/subdir/page3/")
+
+    def test_paginate(self):
+        self.write_file("content/blog/_collection.yaml", """
+            order: title
+            pages:
+                - title: index
+                  template: page.html
+                  paginate: 2
+        """)
+        self.write_file("templates/page.html",
+                "{{ url }} {{ paginator.number }}/{{ paginator.num_pages }} "
+                "{{ paginator.prev_url }} {{ paginator.next_url }} "
+                "{% for item in paginator %}{{ item.title }},{% endfor %}")
+        self.write_file("templates/default.html", "{{ title }}")
+        for i in range(5):
+            self.write_file("content/blog/item{}.md".format(i),
+                    "---\ntitle: Item {}\n---".format(i))
+        self.generate_in_memory()
+
+        self.assertOutputContents("blog/index.html",
+                "/blog/ 1/3 None /blog/page/2/ Item 0,Item 1,")
+        self.assertOutputContents("blog/page/2/index.html",
+                "/blog/page/2/ 2/3 /blog/ /blog/page/3/ Item 2,Item 3,")
+        self.assertOutputContents("blog/page/3/index.html",
+                "/blog/page/3/ 3/3 /blog/page/2/ None Item 4,")
+        self.assertOutputFiles(["blog/index.html", "blog/page/2/index.html",
+                "blog/page/3/index.html"] +
+                ["blog/item{}/index.html".format(i) for i in range(5)])
+
+    def test_paginate_no_items(self):
+        self.write_file("content/blog/_collection.yaml", """
+            pages:
+                - title: archive
+                  paginate: 10
+        """)
+        self.write_file("templates/default.html",
+                "{{ paginator.num_pages }} {{ paginator.items | length }}")
+        self.generate_in_memory()
+        self.assertOutputContents("blog/archive/index.html", "1 0")
+        self.assertOutputFiles(["blog/archive/index.html"])
+
+    def test_queries(self):
+        self.write_file("content/blog/_collection.yaml", """
+            name: blog
+            order: title
+            pages:
+                - title: index
+                  template: index.html
+        """)
+        self.write_file("content/blog/2019-05-01_a.md",
+                "---\ntitle: A\ntags: [x, y]\nauthor: ann\n---")
+        self.write_file("content/blog/2020-02-01_b.md",
+                "---\ntitle: B\ntags: [y]\nauthor: bob\n---")
+        self.write_file("content/blog/2020-03-01_c.md",
+                "---\ntitle: C\ntags: [x]\nauthor: bob\n---")
+        self.write_file("content/blog/d.md",
+                "---\ntitle: D\n---")
+        self.write_file("templates/default.html", "")
+        self.write_file("templates/index.html",
+            '{% macro titles(items) %}{% for i in items %}{{ i.title }}{% endfor %}{% endmacro %}'
+            '{{ titles(collection.where(tags="x")) }}|'
+            '{{ titles(collection.where(tags="y", author="bob")) }}|'
+            '{{ titles(collection.where(author="nobody")) }}|'
+            '{{ titles(collection.where()) }}|'
+            '{{ collection.values("tags") | join(",") }}|'
+            '{% for year, items in collection.by_year() %}{{ year }}:{{ titles(items) }} {% endfor %}|'
+            '{% for month, items in collection.by_month() %}{{ month[1] }}:{{ titles(items) }} {% endfor %}|'
+            '{{ titles(collection.sorted_by("date", reverse=True)) }}|'
+            '{{ titles(collections.blog.sorted_by("author")) }}'
+        )
+        self.generate_in_memory()
+        self.assertOutputContents("blog/index.html",
+                "AC|B||ABCD|x,y|2020:BC 2019:A |3:C 2:B 5:A |CBAD|ABCD")
+
+    def test_taxonomy(self):
+        self.write_file("content/blog/_collection.yaml", """
+            order: title
+            taxonomies:
+                - field: tags
+                  template: tag.html
+                  index_template: tags.html
+                  paginate: 2
+                - field: category
+                  url: topics
+                  template: topic.html
+        """)
+        self.write_file("content/blog/a.md",
+                "---\ntitle: A\ntags: [Big Cats, x]\ncategory: news\n---")
+        self.write_file("content/blog/b.md",
+                "---\ntitle: B\ntags: [x]\n---")
+        self.write_file("content/blog/c.md",
+                "---\ntitle: C\ntags: [x]\ncategory: news\n---")
+        self.write_file("templates/default.html", "")
+        self.write_file("templates/topic.html",
+                "{{ term }}:{% for i in term %}{{ i.title }}{% endfor %}")
+        self.write_file("templates/tags.html",
+                "{% for t in taxonomy %}{{ t.url }} {{ t|length }},{% endfor %}"
+                "{{ taxonomy['x'].url }} {{ url_for('blog/tags', term='x', page=2) }}")
+        self.write_file("templates/tag.html",
+                "{{ term }}:{% for i in paginator %}{{ i.title }}{% endfor %}"
+                " {{ paginator.next_url }}")
+        self.generate_in_memory()
+
+        self.assertOutputContents("blog/tags/index.html",
+                "/blog/tags/big-cats/ 1,/blog/tags/x/ 3,/blog/tags/x/ /blog/tags/x/page/2/")
+        self.assertOutputContents("blog/tags/big-cats/index.html",
+                "Big Cats:A None")
+        self.assertOutputContents("blog/tags/x/index.html",
+                "x:AB /blog/tags/x/page/2/")
+        self.assertOutputContents("blog/tags/x/page/2/index.html",
+                "x:C None")
+        self.assertOutputContents("blog/topics/news/index.html", "news:AC")
+        self.assertOutputContents("blog/topics/index.html", "")
+        self.assertOutputFiles(["blog/{}/index.html".format(name) for name in ["a", "b", "c"]] + [
+                "blog/tags/index.html", "blog/tags/big-cats/index.html",
+                "blog/tags/x/index.html", "blog/tags/x/page/2/index.html",
+                "blog/topics/index.html", "blog/topics/news/index.html"])
+
+    def test_taxonomy_slugs(self):
+        # Terms that slugify the same still get their own page
+        self.write_file("content/blog/_collection.yaml", """
+            taxonomies: [{field: tags, template: tag.html, index_template: tags.html}]
+        """)
+        self.write_file("content/blog/a.md", "---\ntags: [C, Python, '!!!']\n---")
+        self.write_file("content/blog/b.md", "---\ntags: [C++, python]\n---")
+        self.write_file("templates/default.html", "")
+        self.write_file("templates/tag.html", "{{ term }}")
+        self.write_file("templates/tags.html",
+                "{% for t in taxonomy %}{{ t }} {{ t.url }},{% endfor %}")
+        self.generate_in_memory()
+
+        self.assertOutputContents("blog/tags/index.html",
+                "!!! /blog/tags/term/,C /blog/tags/c/,C++ /blog/tags/c-2/,"
+                "Python /blog/tags/python/,python /blog/tags/python-2/,")
+        for slug, name in [("term", "!!!"), ("c", "C"), ("c-2", "C++"),
+                           ("python", "Python"), ("python-2", "python")]:
+            self.assertOutputContents("blog/tags/{}/index.html".format(slug), name)
+
+    def test_taxonomy_bad_config(self):
+        to_test = [
+            ("taxonomies: tags", '"taxonomies" field must be a list'),
+            ("taxonomies: [tags]", "Expected dict describing taxonomy"),
+            ("taxonomies: [{url: tags}]", 'Taxonomies must have a "field"'),
+            ("taxonomies: [{field: tags, url: /tags}]", "Taxonomy url must be a string relative"),
+            ("taxonomies: [{field: tags, paginate: -1}]", '"paginate" option must be a positive number'),
+            ("taxonomies: [{field: tags, foo: bar}]", "Unexpected fields in taxonomy"),
+            ("taxonomies: [{field: tags}, {field: tags}]", 'Duplicate taxonomy for field "tags"'),
+            ("""
+                pages: [{title: tags}]
+                taxonomies: [{field: tags}]
+            """, 'Taxonomy "tags" url "/blog/tags/" conflicts with an existing url'),
+        ]
+        self.write_file("templates/default.html", "")
+        for yaml_str, failure_regex in to_test:
+            with self.subTest(yaml=yaml_str):
+                self.write_file("content/blog/_collection.yaml", yaml_str)
+                self.assertGenerateRaises(
+                    clearice.exceptions.ConfigError,
+                    failure_regex,
+                )
 
     def test_page_bad_config(self):
         to_test = [
@@ -273,6 +506,16 @@ class TestCollection(BaseTest):
                 pages:
                     not_a: list
             """, '"pages" field must be a list'),
+            ("""
+                pages:
+                    - title: index
+                      paginate: 0
+            """, '"paginate" option must be a positive number'),
+            ("""
+                pages:
+                    - title: index
+                      paginate: many
+            """, '"paginate" option must be a positive number'),
             ("""
                 pages:
                     - not_a_dict
@@ -386,9 +629,9 @@ class TestCollection(BaseTest):
         self.write_file("templates/default.html",
                 "{{ url }}")
         self.write_file("content/blog/item.md", "---\npage_data: blah\ndate: 2012-12-21\n---\n")
-        self.generate()
+        self.generate_in_memory()
 
-        self.assertFileContents("build/blog/bar/2012-12-21/blah/index.html",
+        self.assertOutputContents("blog/bar/2012-12-21/blah/index.html",
                 "/blog/bar/2012-12-21/blah/")
 
     def test_url_format_errors(self):
@@ -0,0 +1,96 @@
+
+import os
+import gzip
+
+import clearice
+
+from .base import BaseTest
+
+class TestCompress(BaseTest):
+
+    def read_gzip(self, path):
+        self.account_for_file(path)
+        with gzip.open(os.path.join(self.tmp_dir, path), 'rt', encoding='utf-8') as f:
+            return f.read()
+
+    def mtime(self, path):
+        return os.stat(os.path.join(self.tmp_dir, path)).st_mtime_ns
+
+    def test_no_conf(self):
+        self.write_file("templates/default.html", "{{ content }}")
+        self.write_file("content/index.md", "---\n---\nHello!")
+        self.generate()
+        self.assertFileContents("build/index.html", "Hello!")
+        self.assertFileNotExists("build/index.html.gz")
+
+    def test_defaults(self):
+        self.write_file("conf.yaml", """
+            compress:
+                level: 6
+            static:
+                patterns: ["*.css", "*.txt"]
+        """)
+        self.write_file("templates/default.html", "{{ content }}")
+        self.write_file("content/index.md", "---\n---\nHello!")
+        self.write_file("content/style.css", "body {}")
+        self.write_file("content/file.txt", "not compressed")
+        self.generate()
+
+        self.assertFileContents("build/index.html", "Hello!")
+        self.assertEqual(self.read_gzip("build/index.html.gz"), "Hello!")
+        self.assertFileContents("build/style.css", "body {}")
+        self.assertEqual(self.read_gzip("build/style.css.gz"), "body {}")
+        self.assertFileContents("build/file.txt", "not compressed")
+        self.assertFileNotExists("build/file.txt.gz")
+        self.assertEqual(self.mtime("build/index.html.gz"), self.mtime("build/index.html"))
+        self.assertEqual(self.app.stats.counters["compressed files written"], 2)
+
+    def test_unchanged_skipped(self):
+        self.write_file("conf.yaml", "compress: true")
+        self.write_file("templates/default.html", "{{ content }}")
+        self.write_file("content/index.md", "---\n---\nHello!")
+        self.write_file("content/page.md", "---\n---\nPage")
+        self.generate()
+        self.assertEqual(self.app.stats.counters["compressed files written"], 2)
+        page_mtime = self.mtime("build/page/index.html")
+
+        # Only the changed page is written and compressed again
+        self.write_file("content/index.md", "---\n---\nChanged!")
+        self.generate()
+        self.assertEqual(self.app.stats.counters["compressed files written"], 1)
+        self.assertEqual(self.mtime("build/page/index.html"), page_mtime)
+        self.assertEqual(self.read_gzip("build/index.html.gz"), "Changed!")
+        self.assertEqual(self.read_gzip("build/page/index.html.gz"), "Page")
+        self.assertFileContents("build/index.html", "Changed!")
+        self.assertFileContents("build/page/index.html", "Page")
+
+    def test_stale_removed(self):
+        self.write_file("conf.yaml", "compress: true")
+        self.write_file("templates/default.html", "{{ content }}")
+        self.write_file("content/index.md", "---\n---\nHello!")
+        self.write_file("content/page.md", "---\n---\nPage")
+        self.generate()
+
+        os.remove(os.path.join(self.tmp_dir, "content/page.md"))
+        self.generate()
+        self.assertFileNotExists("build/page/index.html.gz")
+        self.assertFileContents("build/index.html", "Hello!")
+        self.assertEqual(self.read_gzip("build/index.html.gz"), "Hello!")
+
+    def test_conf_errors(self):
+        tests = [
+            ("compress: [1, 2]", 'Expected compress option to be a dict'),
+            ("compress: {level: 10}", 'compress level must be an integer from 1 to 9'),
+            ("compress: {formats: [lzma]}", 'Unrecognized compress format "lzma"'),
+            ("compress: {formats: gzip}", 'compress formats must be a list'),
+            ("compress: {patterns: '*.html'}", 'compress patterns must be a list of strings'),
+            ("compress: {workers: 0}", 'compress workers must be a positive integer'),
+            ("compress: {foo: bar}", 'Unexpected field "foo" in compress config'),
+        ]
+        for conf, error_msg in tests:
+            with self.subTest(conf=conf):
+                self.write_file("conf.yaml", conf)
+                self.assertGenerateRaises(
+                    clearice.exceptions.ConfigError,
+                    error_msg
+                )
@@ -1,5 +1,11 @@
 
+import os
+import stat
+import shutil
+import tempfile
 import unittest
+import contextlib
+from unittest import mock
 
 from clearice import helpers
 
@@ -23,3 +29,42 @@ class TestHelpers(unittest.TestCase):
             with self.subTest(url_in=url_in, url_out=url_out):
                 result = helpers.normalize_url(url_in)
                 self.assertEqual(result, url_out)
+
+    def test_copy_file(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            src = os.path.join(tmp_dir, "src")
+            with open(src, 'wb') as f:
+                f.write(b"content" * 1000)
+            os.chmod(src, 0o640)
+            os.utime(src, ns=(1000000000, 2000000000))
+
+            # Force each fallback in turn
+            no_reflink = mock.patch.object(helpers, "_reflink", return_value=None)
+            no_copy_range = mock.patch.object(helpers.os, "copy_file_range",
+                    side_effect=OSError, create=True)
+            no_sendfile = mock.patch.object(helpers.os, "sendfile",
+                    side_effect=OSError, create=True)
+            tests = [
+                ([], None),
+                ([no_reflink], None),
+                ([no_reflink, no_copy_range], "sendfile"),
+                ([no_reflink, no_copy_range, no_sendfile], "buffered"),
+            ]
+            for patches, expected_method in tests:
+                with self.subTest(expected_method=expected_method):
+                    dest = os.path.join(tmp_dir, "dest")
+                    with contextlib.ExitStack() as stack:
+                        for patch in patches:
+                            stack.enter_context(patch)
+                        method = helpers.copy_file(src, dest)
+                    if expected_method:
+                        self.assertEqual(method, expected_method)
+                    with open(dest, 'rb') as f:
+                        self.assertEqual(f.read(), b"content" * 1000)
+                    st = os.stat(dest)
+                    self.assertEqual(st.st_mtime_ns, 2000000000)
+                    self.assertEqual(stat.S_IMODE(st.st_mode), 0o640)
+                    os.remove(dest)
+        finally:
+            shutil.rmtree(tmp_dir)
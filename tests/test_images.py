@@ -0,0 +1,203 @@
+
+import os
+import json
+import unittest
+
+import clearice
+from clearice.generators import Image
+
+from .base import BaseTest
+
+@unittest.skipIf(Image is None, "Pillow is not installed")
+class TestImages(BaseTest):
+
+    def write_image(self, path, size, color="red", fmt="PNG"):
+        self.write_file(path, "")
+        Image.new("RGB", size, color).save(os.path.join(self.tmp_dir, path), format=fmt)
+
+    def assertImage(self, path, size, fmt):
+        self.account_for_file(path)
+        with Image.open(os.path.join(self.tmp_dir, path)) as image:
+            self.assertEqual(image.size, size)
+            self.assertEqual(image.format, fmt)
+
+    def account_for_cache(self):
+        for dirpath, dirnames, filenames in os.walk(os.path.join(self.tmp_dir, ".clearice-cache")):
+            for filename in filenames:
+                self.account_for_file(os.path.relpath(os.path.join(dirpath, filename), self.tmp_dir))
+
+    def test_derivatives(self):
+        self.write_image("content/photos/cat.png", (1000, 500))
+        self.write_image("content/small.png", (200, 100))
+        self.write_file("content/index.md", "---\n---")
+        self.write_file("templates/default.html",
+                "{{ srcset('photos/cat.png') }}\n{{ srcset('/small.png', 'webp') }}")
+        self.write_file("conf.yaml", """
+            images:
+                widths: [400, 800, 1600]
+                workers: 0
+            static:
+                patterns: ["*.png"]
+        """)
+        self.generate()
+        self.account_for_cache()
+
+        self.assertImage("build/photos/cat.png", (1000, 500), "PNG")
+        self.assertImage("build/photos/cat.png.400w.png", (400, 200), "PNG")
+        self.assertImage("build/photos/cat.png.800w.png", (800, 400), "PNG")
+        self.assertImage("build/photos/cat.png.1000w.png", (1000, 500), "PNG")
+        self.assertImage("build/photos/cat.png.400w.webp", (400, 200), "WEBP")
+        self.assertImage("build/photos/cat.png.800w.webp", (800, 400), "WEBP")
+        self.assertImage("build/photos/cat.png.1000w.webp", (1000, 500), "WEBP")
+        self.assertImage("build/small.png", (200, 100), "PNG")
+        self.assertImage("build/small.png.200w.png", (200, 100), "PNG")
+        self.assertImage("build/small.png.200w.webp", (200, 100), "WEBP")
+        self.assertFileContents("build/index.html",
+                "/photos/cat.png.400w.png 400w, /photos/cat.png.800w.png 800w, /photos/cat.png.1000w.png 1000w\n"
+                "/small.png.200w.webp 200w")
+        self.assertEqual(self.app.stats.counters["image derivatives created"], 8)
+
+        # Cached derivatives aren't made again
+        self.generate()
+        self.assertNotIn("image derivatives created", self.app.stats.counters)
+
+        # Only the changed image is processed
+        self.write_image("content/small.png", (300, 100), "blue")
+        self.generate()
+        self.account_for_cache()
+        self.assertEqual(self.app.stats.counters["image derivatives created"], 2)
+        self.assertFileNotExists("build/small.png.200w.png")
+        self.assertImage("build/small.png.300w.png", (300, 100), "PNG")
+        self.assertImage("build/small.png.300w.webp", (300, 100), "WEBP")
+
+        # Derivatives of the old image are removed from the cache
+        self.assertEqual(self.app.stats.counters["image derivatives removed"], 2)
+        cache_files = os.listdir(os.path.join(self.tmp_dir, ".clearice-cache/images"))
+        self.assertEqual(len(cache_files), 9)  # 8 derivatives and sizes.json
+        os.remove(os.path.join(self.tmp_dir, "content/small.png"))
+        self.write_file("templates/default.html", "{{ srcset('photos/cat.png') }}")
+        self.generate()
+        cache_files = os.listdir(os.path.join(self.tmp_dir, ".clearice-cache/images"))
+        self.assertEqual(len(cache_files), 7)
+        self.assertEqual(len(json.loads(self.read_file(".clearice-cache/images/sizes.json"))), 1)
+
+    def test_workers(self):
+        self.write_image("content/a.jpg", (100, 100), fmt="JPEG")
+        self.write_image("content/b.jpg", (100, 100), "blue", fmt="JPEG")
+        self.write_file("conf.yaml", """
+            images:
+                widths: [50]
+                formats: [jpeg]
+                workers: 2
+        """)
+        self.generate()
+        self.account_for_cache()
+        self.assertImage("build/a.jpg.50w.jpg", (50, 50), "JPEG")
+        self.assertImage("build/b.jpg.50w.jpg", (50, 50), "JPEG")
+
+    def test_made_when_built(self):
+        self.write_image("content/a.png", (100, 100))
+        self.write_image("content/b.png", (100, 100), "blue")
+        self.write_file("conf.yaml", """
+            images:
+                widths: [50]
+                formats: [original]
+                workers: 0
+        """)
+        # Generating urls only reads image sizes
+        self.make_app()
+        self.app.reset()
+        self.app.generate_urls()
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, ".clearice-cache/images")),
+                ["sizes.json"])
+        self.assertNotIn("image derivatives created", self.app.stats.counters)
+
+        # A shard only makes the variants it publishes
+        self.make_app(shard=(1, 2))
+        self.app.generate()
+        self.account_for_cache()
+        self.assertEqual(self.app.stats.counters["image derivatives created"], 1)
+        built = [name for name in os.listdir(os.path.join(self.tmp_dir, "build"))
+                 if not name.startswith(".")]
+        self.assertEqual(len(built), 1)
+        self.account_for_files("build/"+name for name in os.listdir(os.path.join(self.tmp_dir, "build")))
+
+    def test_same_name(self):
+        # Images of the same name with different extensions
+        self.write_image("content/cat.png", (100, 50))
+        self.write_image("content/cat.jpg", (100, 50), fmt="JPEG")
+        self.write_file("conf.yaml", """
+            images:
+                widths: [40]
+                workers: 0
+        """)
+        self.generate()
+        self.account_for_cache()
+        self.assertImage("build/cat.png.40w.png", (40, 20), "PNG")
+        self.assertImage("build/cat.png.40w.webp", (40, 20), "WEBP")
+        self.assertImage("build/cat.jpg.40w.jpg", (40, 20), "JPEG")
+        self.assertImage("build/cat.jpg.40w.webp", (40, 20), "WEBP")
+
+    def test_same_extension(self):
+        # "original" and "png" are the same format for a png
+        self.write_image("content/x.png", (100, 50))
+        self.write_file("content/index.md", "---\n---")
+        self.write_file("templates/default.html",
+                "{{ srcset('x.png') }}\n{{ srcset('x.png', 'png') }}")
+        self.write_file("conf.yaml", """
+            images:
+                widths: [40]
+                formats: [original, png]
+                workers: 0
+        """)
+        self.generate()
+        self.account_for_cache()
+        self.assertImage("build/x.png.40w.png", (40, 20), "PNG")
+        self.assertFileContents("build/index.html", "/x.png.40w.png 40w\n/x.png.40w.png 40w")
+        self.assertEqual(self.app.stats.counters["image derivatives created"], 1)
+
+    def test_url_conflict(self):
+        self.write_image("content/x.png", (100, 50))
+        self.write_image("content/x.png.40w.png", (40, 20))
+        self.write_file("conf.yaml", """
+            images:
+                widths: [40]
+                formats: [original]
+                workers: 0
+            static:
+                patterns: ["*.png"]
+        """)
+        # Only possible with a file named like a variant
+        self.assertGenerateRaises(
+            clearice.exceptions.UrlConflictError,
+            'Url "/x.png.40w.png/" was added more than once'
+        )
+        self.account_for_cache()
+
+    def test_srcset_not_found(self):
+        self.write_file("content/index.md", "---\n---")
+        self.write_file("templates/default.html", "{{ srcset('nope.png') }}")
+        self.write_file("conf.yaml", "images: {widths: [10]}")
+        self.assertGenerateRaises(
+            clearice.exceptions.TemplateError,
+            'No image "nope.png" in content directory'
+        )
+        self.account_for_cache()
+
+    def test_conf_errors(self):
+        tests = [
+            ("images: [1]", 'Expected images option to be a dict'),
+            ("images: {widths: []}", 'images widths must be a list of positive integers'),
+            ("images: {widths: [0]}", 'images widths must be a list of positive integers'),
+            ("images: {formats: [gif]}", 'Unrecognized images format "gif"'),
+            ("images: {quality: 101}", 'images quality must be an integer from 1 to 100'),
+            ("images: {workers: -1}", 'images workers must be a non-negative integer'),
+            ("images: {foo: bar}", 'Unexpected field "foo" in images config'),
+        ]
+        for conf, error_msg in tests:
+            with self.subTest(conf=conf):
+                self.write_file("conf.yaml", conf)
+                self.assertGenerateRaises(
+                    clearice.exceptions.ConfigError,
+                    error_msg
+                )
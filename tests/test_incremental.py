@@ -0,0 +1,163 @@
+
+import os
+from unittest import mock
+
+import clearice
+from clearice.incremental import IncrementalBuilder
+
+from .base import BaseTest
+
+class TestIncrementalBuilder(BaseTest):
+
+    def write_site(self):
+        self.write_file("conf.yaml", """
+            static:
+                patterns: ["*.css"]
+        """)
+        self.write_file("templates/base.html", "[{% block body %}{% endblock %}]")
+        self.write_file("templates/page.html",
+            "{% extends 'base.html' %}{% block body %}{{ title }}{% endblock %}")
+        self.write_file("templates/item.html", "{{ title }}")
+        self.write_file("templates/list.html",
+            "{% for item in collection %}{{ item.title }},{% endfor %}")
+        self.write_file("content/about.md", "---\ntitle: About\ntemplate: page.html\n---")
+        self.write_file("content/style.css", "body {}")
+        self.write_file("content/blog/_collection.yaml", """
+            pages:
+              - title: index
+                template: list.html
+            context:
+                template: item.html
+            order: title
+        """)
+        self.write_file("content/blog/a.md", "---\ntitle: A\n---")
+        self.write_file("content/blog/b.md", "---\ntitle: B\n---")
+        self.account_for_files([
+            "build/about/index.html",
+            "build/style.css",
+            "build/blog/index.html",
+            "build/blog/a/index.html",
+            "build/blog/b/index.html",
+        ])
+
+    def test_builds(self):
+        self.write_site()
+        builder = IncrementalBuilder(self.make_app())
+
+        def build(*paths):
+            n_built = builder.build([os.path.join(self.tmp_dir, path) for path in paths])
+            counters = self.app.stats.counters
+            self.assertEqual(n_built + counters.get("urls unchanged", 0), len(self.app.url_map))
+            return n_built - 1  # Not counting the static file, which always runs
+
+        self.assertEqual(builder.build(), 5)
+        self.assertFileContents("build/blog/index.html", "A,B,")
+
+        # The page itself, and pages listing the collection
+        self.write_file("content/about.md", "---\ntitle: About us\ntemplate: page.html\n---")
+        self.assertEqual(build("content/about.md"), 2)
+        self.assertFileContents("build/about/index.html", "[About us]")
+
+        self.write_file("content/blog/a.md", "---\ntitle: C\n---")
+        self.assertEqual(build("content/blog/a.md"), 2)
+        self.assertFileContents("build/blog/index.html", "B,C,")
+        self.assertFileContents("build/blog/a/index.html", "C")
+
+        # Templates are followed through "extends"
+        self.write_file("templates/base.html", "({% block body %}{% endblock %})")
+        self.assertEqual(build("templates/base.html"), 1)
+        self.assertFileContents("build/about/index.html", "(About us)")
+        self.write_file("templates/item.html", "<{{ title }}>")
+        self.assertEqual(build("templates/item.html"), 2)
+        self.assertFileContents("build/blog/b/index.html", "<B>")
+
+        # Static files don't affect pages that don't use them
+        self.write_file("content/style.css", "body { color: red }")
+        self.assertEqual(build("content/style.css"), 0)
+        self.assertFileContents("build/style.css", "body { color: red }")
+
+        # Nothing happens for files outside of the site's files
+        self.write_file("notes.txt", "")
+        self.assertEqual(builder.build([os.path.join(self.tmp_dir, "notes.txt")]), 0)
+
+        # Removing an item
+        os.remove(os.path.join(self.tmp_dir, "content/blog/b.md"))
+        self.assertEqual(build("content/blog/b.md"), 1)
+        self.assertFileNotExists("build/blog/b/index.html")
+        self.assertFileContents("build/blog/index.html", "C,")
+
+        # Changing the config builds everything
+        self.write_file("conf.yaml", """
+            static:
+                patterns: ["*.css"]
+            minify_html: true
+        """)
+        self.assertEqual(build("conf.yaml"), 3)
+
+        # After a failed build, everything is built
+        self.write_file("templates/item.html", "{{ nope }}")
+        with self.assertRaises(clearice.exceptions.TemplateVarUndefined):
+            build("templates/item.html")
+        self.write_file("templates/item.html", "{{ title }}")
+        self.assertEqual(build("templates/item.html"), 3)
+
+    def test_template_variables(self):
+        self.write_file("templates/default.html", "{{ content }}")
+        self.write_file("templates/links.html", "{{ url_for('a') }}")
+        self.write_file("content/a.md", "---\n---\nA")
+        self.write_file("content/links.md", "---\ntemplate: links.html\n---")
+        self.write_file("content/uses_url_for.md", "---\n---\n{{ url_for('a') }}")
+        self.account_for_files(["build/a/index.html", "build/links/index.html",
+                                "build/uses_url_for/index.html", "build/b/index.html"])
+        builder = IncrementalBuilder(self.make_app())
+        builder.build()
+        self.assertEqual(builder.page_deps(self.app.url_map["/links/"]).names, {"url_for"})
+        self.assertEqual(builder.page_deps(self.app.url_map["/uses_url_for/"]).names,
+                         {"url_for", "content"})
+
+        # Adding a url name rebuilds pages using url_for()
+        self.write_file("content/b.md", "---\n---")
+        builder.build([os.path.join(self.tmp_dir, "content/b.md")])
+        self.assertEqual(self.app.stats.counters["urls built"], 3)
+        self.assertEqual(self.app.stats.counters["urls unchanged"], 1)
+
+    def test_indirect_aggregates(self):
+        # Other pages can be reached through "page" and "context"
+        self.write_file("content/blog/_collection.yaml", """
+            name: blog
+            order: title
+            context: {template: item.html}
+        """)
+        self.write_file("templates/item.html",
+                "{% for p in page.collection %}{{ p.title }}{% endfor %}|"
+                "{% for p in context.collections.blog %}{{ p.title }}{% endfor %}")
+        self.write_file("content/blog/a.md", "---\ntitle: A\n---")
+        self.write_file("content/blog/b.md", "---\ntitle: B\n---")
+        self.account_for_files(["build/blog/a/index.html", "build/blog/b/index.html"])
+        builder = IncrementalBuilder(self.make_app())
+        builder.build()
+        self.assertFileContents("build/blog/a/index.html", "AB|AB")
+
+        self.write_file("content/blog/b.md", "---\ntitle: C\n---")
+        builder.build([os.path.join(self.tmp_dir, "content/blog/b.md")])
+        self.assertFileContents("build/blog/a/index.html", "AC|AC")
+        self.assertFileContents("build/blog/b/index.html", "AC|AC")
+
+
+class TestFrontmatterCache(BaseTest):
+
+    def test_cache(self):
+        self.write_file("a.md", "---\ntitle: A\n---\nContent")
+        path = os.path.join(self.tmp_dir, "a.md")
+        cache = clearice.views.FrontmatterCache()
+        fm = cache.read(path)
+        self.assertEqual(fm, {"title": "A"})
+        # Hits only skip the frontmatter
+        with mock.patch.object(clearice.views, "_read_frontmatter_yaml") as read_yaml:
+            self.assertIs(cache.read_file(path)[0], fm)
+            self.assertEqual(cache.read_file(path)[1], "Content")
+            self.assertIs(cache.read(path), fm)
+        self.assertEqual(read_yaml.call_count, 0)
+
+        self.write_file("a.md", "---\ntitle: Changed\n---\nNew content")
+        self.assertEqual(cache.read_file(path), ({"title": "Changed"}, "New content"))
@@ -0,0 +1,69 @@
+
+import unittest
+
+from clearice.minify import minify_html, HtmlMinifier
+
+DOCUMENT = """<!DOCTYPE html>
+<html>
+  <head>
+    <!-- a comment -->
+    <!--[if IE]><p>ie</p><![endif]-->
+    <style>
+      body { margin: 0 }
+    </style>
+  </head>
+  <body>
+    <p class="a  b" data-x='>'>Hello,    world \xa0 x</p>
+    <pre>
+  keep   this <b>x</b>
+    </PRE >
+    <textarea>  a
+  b </textarea>
+    <script>if (a < b) {   x(); }</script>
+    a < b <= c
+  </body>
+</html>
+"""
+
+MINIFIED = """<!DOCTYPE html>
+<html>
+<head>
+<!--[if IE]><p>ie</p><![endif]-->
+<style>
+      body { margin: 0 }
+    </style>
+</head>
+<body>
+<p class="a  b" data-x='>'>Hello, world \xa0 x</p>
+<pre>
+  keep   this <b>x</b>
+    </PRE >
+<textarea>  a
+  b </textarea>
+<script>if (a < b) {   x(); }</script>
+a < b <= c
+</body>
+</html>
+"""
+
+class TestMinify(unittest.TestCase):
+
+    def test_minify(self):
+        self.assertEqual(minify_html(DOCUMENT), MINIFIED)
+
+    def test_streaming(self):
+        # Output must not depend on where the input is split
+        for chunk_size in range(1, 40):
+            with self.subTest(chunk_size=chunk_size):
+                minifier = HtmlMinifier()
+                out = ''.join(
+                    minifier.feed(DOCUMENT[i:i+chunk_size])
+                    for i in range(0, len(DOCUMENT), chunk_size)
+                )
+                out += minifier.close()
+                self.assertEqual(out, MINIFIED)
+
+    def test_unterminated(self):
+        self.assertEqual(minify_html("<pre>  a  "), "<pre>  a  ")
+        self.assertEqual(minify_html("a  <!-- b  "), "a <!-- b  ")
+        self.assertEqual(minify_html("a  <b"), "a <b")
@@ -0,0 +1,71 @@
+
+import os
+
+import clearice
+from clearice.output import MemoryOutput, FileRef
+from clearice.incremental import IncrementalBuilder
+from clearice import server
+
+from .base import BaseTest
+
+class TestMemoryOutput(BaseTest):
+
+    def write_site(self):
+        self.write_file("conf.yaml", """
+            static:
+                patterns: ["*.css"]
+            sitemap:
+                base_url: https://example.com
+        """)
+        self.write_file("templates/default.html", "{{ title }}")
+        self.write_file("content/index.md", "---\ntitle: Home\n---")
+        self.write_file("content/blog/a.md", "---\ntitle: A\n---")
+        self.write_file("content/style.css", "body {}")
+
+    def test_generate(self):
+        self.write_site()
+        output = self.generate_in_memory()
+        self.assertEqual(sorted(output.files), [
+            "blog/a/index.html", "index.html", "sitemap.xml", "style.css"])
+        self.assertEqual(output.files["index.html"], b"Home")
+        self.assertEqual(output.read("blog/a/index.html"), b"A")
+
+        # Static files aren't copied
+        self.assertIsInstance(output.files["style.css"], FileRef)
+        self.assertEqual(output.files["style.css"].path,
+                         os.path.join(self.tmp_dir, "content/style.css"))
+        self.assertEqual(output.read("style.css"), b"body {}")
+
+        # Actions that only write to disk are built somewhere temporary
+        self.assertIn(b"<loc>https://example.com/blog/a/</loc>", output.read("sitemap.xml"))
+
+        self.assertFileNotExists("build")
+
+    def test_stale_files_removed(self):
+        self.write_site()
+        output = self.generate_in_memory()
+        os.remove(os.path.join(self.tmp_dir, "content/blog/a.md"))
+        self.make_app(output=output).generate()
+        self.assertNotIn("blog/a/index.html", output.files)
+        self.assertIn("index.html", output.files)
+
+    def test_incremental(self):
+        self.write_site()
+        output = MemoryOutput()
+        builder = IncrementalBuilder(self.make_app(output=output))
+        builder.build()
+        self.write_file("content/blog/a.md", "---\ntitle: Changed\n---")
+        builder.build([os.path.join(self.tmp_dir, "content/blog/a.md")])
+        self.assertEqual(self.app.stats.counters["urls unchanged"], 1)
+        self.assertEqual(output.files["blog/a/index.html"], b"Changed")
+
+    def test_memory_site(self):
+        self.write_site()
+        site = server.MemorySite(self.generate_in_memory())
+        response = site.get("/blog/a/")
+        self.assertEqual((response.content_type, response.body), (server.HTML_CONTENT_TYPE, b"A"))
+        self.assertEqual(site.get("/blog/a").body, b"A")
+        self.assertEqual(site.get("/").body, b"Home")
+        response = site.get("/style.css")
+        self.assertEqual(response.path, os.path.join(self.tmp_dir, "content/style.css"))
+        self.assertIsNone(site.get("/nope/"))
@@ -0,0 +1,125 @@
+
+import os
+import json
+
+import clearice
+from clearice import search
+
+from .base import BaseTest
+
+class TestSearch(BaseTest):
+
+    def write_site(self):
+        self.write_file("conf.yaml", "search: true")
+        self.write_file("templates/default.html", "")
+        self.write_file("content/a.md", "---\ntitle: Apples\n---\nAn apple a day.")
+        self.write_file("content/b.md", "---\n---\nBananas and apples, apples!")
+
+    def read_json(self, path):
+        return json.loads(self.read_file(path))
+
+    def read_output_json(self, relpath):
+        return json.loads(self.output.read(relpath).decode('utf-8'))
+
+    def account_for_cache(self):
+        for dirpath, dirnames, filenames in os.walk(os.path.join(self.tmp_dir, ".clearice-cache")):
+            for filename in filenames:
+                self.account_for_file(os.path.relpath(os.path.join(dirpath, filename), self.tmp_dir))
+
+    def account_for_output(self):
+        for path in os.listdir(os.path.join(self.tmp_dir, "build/search")):
+            self.account_for_file("build/search/" + path)
+        self.account_for_cache()
+        for name in ["a", "b"]:
+            self.account_for_file("build/{}/index.html".format(name))
+
+    def test_tokenize(self):
+        self.assertEqual(list(search.tokenize("A quick, QUICK fox's tail_end")),
+                ["quick", "quick", "fox", "tail_end"])
+
+    def test_index(self):
+        self.write_site()
+        self.generate_in_memory()
+        docs = self.read_output_json("search/docs.json")
+        self.assertEqual(docs["prefix_length"], 2)
+        self.assertEqual(sorted(docs["docs"]), [["/a/", "Apples"], ["/b/", ""]])
+        index = dict((url, i) for i, (url, title) in enumerate(docs["docs"]))
+
+        ap = self.read_output_json("search/ap.json")
+        self.assertEqual(sorted(ap.keys()), ["apple", "apples"])
+        self.assertEqual(sorted(ap["apples"]), sorted([[index["/a/"], 1], [index["/b/"], 2]]))
+        self.assertEqual(self.read_output_json("search/ba.json"), {"bananas": [[index["/b/"], 1]]})
+        self.account_for_cache()
+
+    def test_paginated_indexed_once(self):
+        self.write_file("conf.yaml", "search: true")
+        self.write_file("templates/default.html", "")
+        self.write_file("content/blog/_collection.yaml", """
+            pages:
+                - title: index
+                  paginate: 1
+        """)
+        self.write_file("content/blog/index.md", "---\ntitle: Blog\n---\nWelcome")
+        for i in range(3):
+            self.write_file("content/blog/item{}.md".format(i), "---\n---")
+        self.generate_in_memory()
+
+        docs = self.read_output_json("search/docs.json")["docs"]
+        self.assertEqual([doc for doc in docs if doc[1] == "Blog"], [["/blog/", "Blog"]])
+        self.assertEqual(self.read_output_json("search/we.json"),
+                {"welcome": [[docs.index(["/blog/", "Blog"]), 1]]})
+        self.account_for_cache()
+
+    def test_incremental(self):
+        self.write_site()
+        self.generate()
+        self.assertEqual(self.app.stats.counters["search pages indexed"], 2)
+        ba_path = os.path.join(self.tmp_dir, "build/search/ba.json")
+        ap_path = os.path.join(self.tmp_dir, "build/search/ap.json")
+        ba_mtime = os.path.getmtime(ba_path)
+        os.utime(ap_path, (0, 0))
+
+        # Nothing changed
+        self.generate()
+        self.assertEqual(self.app.stats.counters["search pages indexed"], 0)
+        self.assertEqual(self.app.stats.counters["search index files updated"], 0)
+
+        # Only files with the page's old or new terms are updated
+        self.write_file("content/a.md", "---\ntitle: Apricots\n---")
+        self.generate()
+        self.assertEqual(self.app.stats.counters["search pages indexed"], 1)
+        self.assertEqual(os.path.getmtime(ba_path), ba_mtime)
+        self.assertNotEqual(os.path.getmtime(ap_path), 0)
+        docs = self.read_json("build/search/docs.json")["docs"]
+        a = docs.index(["/a/", "Apricots"])
+        self.assertEqual(self.read_json("build/search/ap.json"), {
+            "apples": [[docs.index(["/b/", ""]), 2]],
+            "apricots": [[a, 1]],
+        })
+
+        # Removed pages' postings are removed, and their index reused
+        os.remove(os.path.join(self.tmp_dir, "content/b.md"))
+        self.paths_accounted_for.discard("content/b.md")
+        self.generate()
+        self.assertEqual(self.read_json("build/search/ap.json"), {"apricots": [[a, 1]]})
+        self.assertFileNotExists("build/search/ba.json")
+        self.assertEqual(self.read_json("build/search/docs.json")["docs"][1 - a], None)
+
+        self.write_file("content/c.md", "---\n---\nCherries")
+        self.generate()
+        self.assertEqual(self.read_json("build/search/docs.json")["docs"][1 - a], ["/c/", ""])
+        self.account_for_file("build/c/index.html")
+        self.account_for_output()
+        self.paths_accounted_for.discard("build/b/index.html")
+
+    def test_conf_errors(self):
+        self.write_file("templates/default.html", "")
+        for conf, failure_regex in [
+            ("search: [1]", "Expected search option to be true or a dict"),
+            ("search: {url: '/'}", "search url must be a non-empty string"),
+            ("search: {prefix_length: 3}", "search prefix_length must be an integer from 1 to 2"),
+            ("search: {foo: 1}", 'Unexpected field "foo" in search config'),
+        ]:
+            with self.subTest(conf=conf):
+                self.write_file("conf.yaml", conf)
+                self.assertGenerateRaises(clearice.exceptions.ConfigError, failure_regex)
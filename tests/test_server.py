@@ -0,0 +1,245 @@
+
+import os
+import re
+import time
+import threading
+import http.client
+import urllib.parse
+import urllib.request
+import urllib.error
+
+import clearice
+from clearice import server
+
+from .base import BaseTest
+
+class TestOnDemandSite(BaseTest):
+
+    def make_site(self):
+        return server.OnDemandSite(self.make_app())
+
+    def write_site(self):
+        self.write_file("templates/default.html", "{{ title }}")
+        self.write_file("content/index.md", "---\ntitle: Home\n---")
+        self.write_file("content/style.css", "body {}")
+        self.write_file("conf.yaml", """
+            static:
+                patterns: ["*.css"]
+            sitemap:
+                base_url: https://example.com
+        """)
+
+    def test_get(self):
+        self.write_site()
+        site = self.make_site()
+
+        response = site.get("/")
+        self.assertEqual(response.content_type, server.HTML_CONTENT_TYPE)
+        self.assertEqual(response.body, b"Home")
+        self.assertIs(site.get("/index.html?x=1"), response)  # Cached
+
+        response = site.get("/style.css")
+        self.assertEqual(response.content_type, "text/css; charset=utf-8")
+        self.assertEqual(response.path, self.app.get_content_path("style.css"))
+
+        # Actions without a source file are built somewhere temporary
+        response = site.get("/sitemap.xml")
+        self.assertIn(b"<loc>https://example.com/</loc>", response.body)
+
+        self.assertIsNone(site.get("/nope/"))
+
+        # Nothing was built
+        self.assertFileNotExists("build")
+
+    def test_reload(self):
+        self.write_site()
+        site = self.make_site()
+        self.assertEqual(site.get("/").body, b"Home")
+        self.write_file("content/index.md", "---\ntitle: Changed\n---")
+        self.assertEqual(site.get("/").body, b"Home")
+        site.reload()
+        self.assertEqual(site.get("/").body, b"Changed")
+
+    def test_reload_changed_paths(self):
+        self.write_site()
+        site = self.make_site()
+        app = site.app
+        self.assertEqual(site.get("/").body, b"Home")
+        jinja_env = app.jinja_env
+
+        # Changed content keeps the app and its compiled templates
+        self.write_file("content/index.md", "---\ntitle: Changed\n---")
+        site.reload([app.get_content_path("index.md")])
+        self.assertIs(site.app, app)
+        self.assertIs(app.jinja_env, jinja_env)
+        self.assertEqual(site.get("/").body, b"Changed")
+
+        # Unrelated files don't reload
+        response = site.get("/")
+        site.reload([os.path.join(self.tmp_dir, "notes.txt")])
+        self.assertIs(site.get("/"), response)
+
+        # Changed config is read again
+        self.write_file("conf.yaml", "minify_html: false")
+        site.reload([app.conf_path])
+        self.assertIsNot(app.jinja_env, jinja_env)
+        self.assertIsNone(site.get("/style.css"))
+
+    def test_server(self):
+        self.write_site()
+        self.write_file("content/about.md", "---\ntitle: About\n---")
+        self.write_file("templates/broken.html", "{{ nope }}")
+        self.write_file("content/broken.md", "---\ntemplate: broken.html\n---")
+        http_server = server.make_server(self.make_site(), "localhost", 0)
+        thread = threading.Thread(target=http_server.serve_forever)
+        thread.start()
+        base = "http://localhost:{}".format(http_server.server_port)
+        try:
+            with urllib.request.urlopen(base + "/about") as response:
+                # Redirected to the page's directory
+                self.assertEqual(response.geturl(), base + "/about/")
+                self.assertEqual(response.read(), b"About")
+            with urllib.request.urlopen(base + "/style.css") as response:
+                self.assertEqual(response.read(), b"body {}")
+
+            for path, status in [("/nope/", 404), ("/broken/", 500)]:
+                with self.assertRaises(urllib.error.HTTPError) as cm:
+                    urllib.request.urlopen(base + path)
+                self.assertEqual(cm.exception.code, status)
+                cm.exception.close()
+        finally:
+            http_server.shutdown()
+            http_server.server_close()
+            thread.join()
+
+    def start_server(self, site, live_reload=None):
+        http_server = server.make_server(site, "localhost", 0, live_reload=live_reload)
+        thread = threading.Thread(target=http_server.serve_forever)
+        thread.start()
+        def stop():
+            http_server.shutdown()
+            http_server.server_close()
+            thread.join()
+        self.addCleanup(stop)
+        return http_server.server_port
+
+    def test_conditional_range_keep_alive(self):
+        self.write_site()
+        self.write_file("content/big.css", "0123456789")
+        port = self.start_server(self.make_site())
+        conn = http.client.HTTPConnection("localhost", port)
+        self.addCleanup(conn.close)
+
+        def request(path, **headers):
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            return response, response.read()
+
+        # All requests share one connection
+        for path in ["/", "/big.css"]:
+            response, body = request(path)
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.getheader("Accept-Ranges"), "bytes")
+            etag = response.getheader("ETag")
+            last_modified = response.getheader("Last-Modified")
+
+            response, body = request(path, **{"If-None-Match": etag})
+            self.assertEqual((response.status, body), (304, b""))
+            response, body = request(path, **{"If-Modified-Since": last_modified})
+            self.assertEqual((response.status, body), (304, b""))
+            response, body = request(path, **{"If-None-Match": '"other"'})
+            self.assertEqual(response.status, 200)
+
+        for range_header, status, body, content_range in [
+            ("bytes=2-4", 206, b"234", "bytes 2-4/10"),
+            ("bytes=7-", 206, b"789", "bytes 7-9/10"),
+            ("bytes=-2", 206, b"89", "bytes 8-9/10"),
+            ("bytes=5-100", 206, b"56789", "bytes 5-9/10"),
+            ("bytes=10-", 416, b"", "bytes */10"),
+            ("bytes=-0", 416, b"", "bytes */10"),
+            ("bytes=5-3", 200, b"0123456789", None),
+            ("bytes=0-1,4-5", 200, b"0123456789", None),
+        ]:
+            with self.subTest(range=range_header):
+                response, response_body = request("/big.css", Range=range_header)
+                self.assertEqual(response.status, status)
+                self.assertEqual(response_body, body)
+                self.assertEqual(response.getheader("Content-Range"), content_range)
+
+        # Ranges only apply if the file is unchanged
+        response, body = request("/big.css", Range="bytes=2-4", **{"If-Range": '"other"'})
+        self.assertEqual((response.status, body), (200, b"0123456789"))
+
+    def test_directory_site(self):
+        self.write_site()
+        self.generate()
+        self.account_for_files(["build/index.html", "build/style.css", "build/sitemap.xml"])
+        site = server.DirectorySite(os.path.join(self.tmp_dir, "build"))
+        self.assertEqual(site.get("/").path, os.path.join(self.tmp_dir, "build/index.html"))
+        self.assertEqual(site.get("/style.css?v=1").content_type, "text/css; charset=utf-8")
+        self.assertIsNone(site.get("/nope/"))
+        self.assertIsNone(site.get("/../conf.yaml"))
+
+        port = self.start_server(site)
+        with urllib.request.urlopen("http://localhost:{}/".format(port)) as response:
+            self.assertEqual(response.read(), b"Home")
+
+    def test_live_reload_inject(self):
+        live_reload = server.LiveReload()
+        for body, expected_pos in [
+            (b"<html><body>Hi</body></html>", len(b"<html><body>Hi")),
+            (b"<BODY>a</body><script>'</body>'</script></BODY>", len(b"<BODY>a</body><script>'</body>'</script>")),
+            (b"Hi", 2),
+        ]:
+            with self.subTest(body=body):
+                response = server.Response(server.HTML_CONTENT_TYPE, body=body)
+                injected = live_reload.inject(response)
+                self.assertTrue(injected.body.startswith(body[:expected_pos] + b'<script data-etag="&quot;'))
+                self.assertTrue(injected.body.endswith(b"</script>\n" + body[expected_pos:]))
+                self.assertIn(server.EVENTS_PATH.encode('utf-8'), injected.body)
+                self.assertEqual(injected.mtime, response.mtime)
+
+    def test_live_reload(self):
+        self.write_site()
+        self.write_file("content/other.md", "---\ntitle: Other\n---")
+        site = self.make_site()
+        live_reload = server.LiveReload()
+        self.addCleanup(live_reload.close)
+        port = self.start_server(site, live_reload)
+
+        with urllib.request.urlopen("http://localhost:{}/".format(port)) as response:
+            page = response.read().decode('utf-8')
+        self.assertTrue(page.startswith("Home<script"))
+        etag = re.search(r'data-etag="([^"]*)"', page).group(1).replace("&quot;", '"')
+        self.assertEqual(etag, site.get("/").stat()[2])
+
+        conn = http.client.HTTPConnection("localhost", port, timeout=5)
+        self.addCleanup(conn.close)
+        conn.request("GET", "{}?url=/&etag={}&css=/style.css".format(
+                server.EVENTS_PATH, urllib.parse.quote(etag)))
+        events = conn.getresponse()
+        self.assertEqual(events.getheader("Content-Type"), "text/event-stream")
+        while not live_reload.clients:
+            time.sleep(0.01)  # Wait for the stream to be registered
+
+        def read_event():
+            return events.readline() + events.readline() + events.readline()
+
+        # Another page changing doesn't concern this tab
+        self.write_file("content/other.md", "---\ntitle: Changed\n---")
+        site.reload()
+        live_reload.notify(site)
+
+        # Stylesheets are swapped
+        self.write_file("content/style.css", "body { color: red }")
+        site.reload()
+        live_reload.notify(site)
+        self.assertEqual(read_event(), b"event: css\ndata: /style.css\n\n")
+
+        self.write_file("content/index.md", "---\ntitle: Changed\n---")
+        site.reload()
+        live_reload.notify(site)
+        self.assertEqual(read_event(), b"event: reload\ndata: /\n\n")
+
+        live_reload.close()
+        self.assertEqual(events.read(), b"")
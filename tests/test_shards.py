@@ -0,0 +1,141 @@
+
+import os
+
+import clearice
+from clearice import shards
+
+from .base import BaseTest
+
+class TestShards(BaseTest):
+
+    def write_site(self, n_pages):
+        self.write_file("templates/default.html", "{{ url }}")
+        for i in range(n_pages):
+            self.write_file("content/page{}.md".format(i), "---\n---")
+
+    def generate_shards(self, count, **kwargs):
+        for index in range(1, count+1):
+            self.make_app(
+                build_dir="shard{}".format(index),
+                shard=(index, count),
+                **kwargs
+            )
+            self.app.generate()
+            self.account_for_file("shard{}/{}".format(index, shards.SHARD_MANIFEST))
+
+    def merge(self, count):
+        shard_dirs = [os.path.join(self.tmp_dir, "shard{}".format(i+1)) for i in range(count)]
+        build_dir = os.path.join(self.tmp_dir, "build")
+        n_files = shards.merge_shards(shard_dirs, build_dir)
+        self.account_for_file("build/"+shards.BUILD_MANIFEST)
+        return n_files
+
+    def test_partition(self):
+        urls = ["/page{}/".format(i) for i in range(10)]
+        partition = shards.partition_urls(urls, 3)
+        self.assertEqual(sorted(sum(partition, [])), sorted(urls))
+        self.assertEqual([len(p) for p in partition], [4, 3, 3])
+
+        # Deterministic regardless of input order
+        self.assertEqual(shards.partition_urls(reversed(urls), 3), partition)
+
+    def test_partition_render_times(self):
+        # One slow page should get a shard to itself
+        urls = ["/a/", "/b/", "/c/", "/slow/"]
+        times = {"/a/": 1.0, "/b/": 1.0, "/c/": 1.0, "/slow/": 3.0}
+        partition = shards.partition_urls(urls, 2, times)
+        self.assertEqual(partition, [["/slow/"], ["/a/", "/b/", "/c/"]])
+
+        # Unknown urls are assumed to take the average time
+        partition = shards.partition_urls(urls + ["/new/"], 2, times)
+        self.assertEqual(partition, [["/c/", "/slow/"], ["/a/", "/b/", "/new/"]])
+
+    def test_parse_shard(self):
+        self.assertEqual(shards.parse_shard("2/4"), (2, 4))
+        for s in ["0/4", "5/4", "1/0", "1", "a/b", "1/2/3"]:
+            with self.subTest(shard=s):
+                with self.assertRaises(clearice.exceptions.ShardError):
+                    shards.parse_shard(s)
+
+    def test_shard_and_merge(self):
+        self.write_site(5)
+        self.generate_shards(2)
+
+        # Each page is built by exactly one shard
+        for i in range(5):
+            path = "page{}/index.html".format(i)
+            in_shard = [os.path.exists(os.path.join(self.tmp_dir, "shard{}".format(s), path))
+                        for s in (1, 2)]
+            self.assertEqual(sorted(in_shard), [False, True])
+
+        self.write_file("build/stale.html", "stale")
+        self.assertEqual(self.merge(2), 5)
+        for i in range(5):
+            self.assertFileContents("build/page{}/index.html".format(i),
+                    "/page{}/".format(i))
+            self.account_for_file("shard1/page{}/index.html".format(i))
+            self.account_for_file("shard2/page{}/index.html".format(i))
+        self.assertFileNotExists("build/stale.html")
+
+    def test_merge_into_shard_dir(self):
+        # Shard 1 built into the build directory it's merged into
+        self.write_site(5)
+        self.make_app(shard=(1, 2))
+        self.app.generate()
+        self.make_app(build_dir="shard2", shard=(2, 2))
+        self.app.generate()
+        self.account_for_file("shard2/"+shards.SHARD_MANIFEST)
+
+        shard_dirs = [os.path.join(self.tmp_dir, d) for d in ("build", "shard2")]
+        n_files = shards.merge_shards(shard_dirs, os.path.join(self.tmp_dir, "build"))
+        self.account_for_file("build/"+shards.BUILD_MANIFEST)
+        self.assertEqual(n_files, 5)
+        for i in range(5):
+            self.assertFileContents("build/page{}/index.html".format(i),
+                    "/page{}/".format(i))
+            self.account_for_file("shard2/page{}/index.html".format(i))
+        self.assertFileNotExists("build/"+shards.SHARD_MANIFEST)
+
+    def test_merge_manifest_balances_next_build(self):
+        self.write_site(4)
+        self.generate_shards(2)
+        self.merge(2)
+
+        manifest_path = os.path.join(self.tmp_dir, "build", shards.BUILD_MANIFEST)
+        times = shards.read_render_times(manifest_path)
+        self.assertEqual(sorted(times.keys()),
+                ["/page0/", "/page1/", "/page2/", "/page3/"])
+
+        # The next sharded build reads the merged manifest
+        self.generate_shards(2, manifest_path=manifest_path)
+        expected = shards.partition_urls(times.keys(), 2, times)
+        self.assertEqual(self.app.build_urls, expected[1])
+        for i in range(4):
+            self.account_for_file("shard1/page{}/index.html".format(i))
+            self.account_for_file("shard2/page{}/index.html".format(i))
+            self.account_for_file("build/page{}/index.html".format(i))
+
+    def test_merge_relative_link(self):
+        self.write_file("content/file.txt", "file content")
+        self.write_file("conf.yaml", """
+            static:
+                patterns:
+                    - "*.txt"
+                link: true
+        """)
+        self.generate_shards(1)
+        self.merge(1)
+        self.assertSoftLink("build/file.txt", "content/file.txt", is_relative=True)
+        self.account_for_file("shard1/file.txt")
+        self.account_for_file("build/file.txt")
+
+    def test_merge_incomplete(self):
+        self.write_site(2)
+        self.generate_shards(2)
+        for i in range(2):
+            self.account_for_file("shard1/page{}/index.html".format(i))
+            self.account_for_file("shard2/page{}/index.html".format(i))
+        with self.assertRaisesRegex(clearice.exceptions.ShardError,
+                "Shards do not form a complete set: got 2/2"):
+            shards.merge_shards([os.path.join(self.tmp_dir, "shard2")],
+                                os.path.join(self.tmp_dir, "build"))
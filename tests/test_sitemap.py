@@ -0,0 +1,113 @@
+
+import os
+import hashlib
+
+import clearice
+from clearice import sitemap
+
+from .base import BaseTest
+
+class TestSitemap(BaseTest):
+
+    def write_site(self, extra_conf=""):
+        self.write_file("conf.yaml", """
+            sitemap:
+                base_url: https://example.com/
+        """ + extra_conf)
+        self.write_file("templates/default.html", "")
+        self.write_file("content/a.md", "---\nupdated: 2020-05-06\n---")
+        self.write_file("content/b.md", "---\n---")
+        self.write_file("content/c.md", "---\n---")
+        os.utime(os.path.join(self.tmp_dir, "content/b.md"), (0, 86400 * 365 + 43200))
+        os.utime(os.path.join(self.tmp_dir, "content/c.md"), (0, 86400 * 365 + 43200))
+
+    def account_for_pages(self):
+        for name in ["a", "b", "c"]:
+            self.account_for_file("build/{}/index.html".format(name))
+
+    def urlset(self, entries):
+        body = ''.join(entries)
+        digest = hashlib.sha256(body.encode('utf-8')).hexdigest()
+        return (sitemap.XML_DECLARATION + sitemap.DIGEST_FORMAT.format(digest) +
+                sitemap.URLSET_START + body + sitemap.URLSET_END)
+
+    def test_sitemap(self):
+        self.write_site()
+        self.generate_in_memory()
+        self.assertOutputContents("sitemap.xml", self.urlset([
+            "<url><loc>https://example.com/a/</loc><lastmod>2020-05-06</lastmod></url>\n",
+            "<url><loc>https://example.com/b/</loc><lastmod>1971-01-01</lastmod></url>\n",
+            "<url><loc>https://example.com/c/</loc><lastmod>1971-01-01</lastmod></url>\n",
+        ]))
+
+    def test_encoded_urls(self):
+        self.write_site()
+        self.write_file("content/café & bar.md", "---\ndate: 2020-01-01\n---")
+        self.generate_in_memory()
+        self.assertIn("<url><loc>https://example.com/caf%C3%A9%20&amp;%20bar/</loc>"
+                      "<lastmod>2020-01-01</lastmod></url>\n",
+                      self.output.read("sitemap.xml").decode('utf-8'))
+        self.assertEqual(sitemap.format_loc("https://example.com/a%20b/"),
+                         "https://example.com/a%20b/")
+
+    def test_sharded(self):
+        self.write_site("""
+                max_urls: 2
+        """)
+        self.generate_in_memory()
+        self.assertOutputContents("sitemap.xml",
+            sitemap.XML_DECLARATION + sitemap.INDEX_START +
+            "<sitemap><loc>https://example.com/sitemap-1.xml</loc></sitemap>\n"
+            "<sitemap><loc>https://example.com/sitemap-2.xml</loc></sitemap>\n" +
+            sitemap.INDEX_END
+        )
+        self.assertOutputContents("sitemap-2.xml", self.urlset([
+            "<url><loc>https://example.com/c/</loc><lastmod>1971-01-01</lastmod></url>\n",
+        ]))
+        self.assertOutputFiles(["sitemap.xml", "sitemap-1.xml", "sitemap-2.xml",
+                                "a/index.html", "b/index.html", "c/index.html"])
+
+    def test_max_bytes(self):
+        entry = "<url><loc>https://example.com/a/</loc><lastmod>2020-05-06</lastmod></url>\n"
+        fixed = len(self.urlset([]))
+        self.write_site("""
+                max_bytes: {}
+        """.format(fixed + len(entry)))
+        self.generate_in_memory()
+        self.assertIn("sitemap-3.xml", self.output.files)
+        self.assertNotIn("sitemap-4.xml", self.output.files)
+        self.assertOutputContents("sitemap-1.xml", self.urlset([entry]))
+
+    def test_unchanged_not_rewritten(self):
+        self.write_site("""
+                max_urls: 2
+        """)
+        self.generate()
+        paths = [os.path.join(self.tmp_dir, "build/sitemap-{}.xml".format(i)) for i in (1, 2)]
+        for path in paths:
+            os.utime(path, (0, 0))
+
+        # Only the file containing the changed page is rewritten
+        self.write_file("content/c.md", "---\ndate: 2021-01-01\n---")
+        self.generate()
+        self.assertEqual(os.path.getmtime(paths[0]), 0)
+        self.assertNotEqual(os.path.getmtime(paths[1]), 0)
+        self.assertEqual(self.app.stats.counters["sitemap files unchanged"], 1)
+        self.assertEqual(self.app.stats.counters["sitemap files written"], 1)
+        self.assertIn("2021-01-01", self.read_file("build/sitemap-2.xml"))
+        self.account_for_file("build/sitemap.xml")
+        self.account_for_file("build/sitemap-1.xml")
+        self.account_for_pages()
+
+    def test_conf_errors(self):
+        self.write_file("templates/default.html", "")
+        for conf, failure_regex in [
+            ("sitemap: [1]", "Expected sitemap option to be a dict"),
+            ("sitemap: {max_urls: 2}", "sitemap base_url must be given"),
+            ("sitemap: {base_url: 'x', max_urls: 50001}", "sitemap max_urls must be an integer"),
+            ("sitemap: {base_url: 'x', max_bytes: 0}", "sitemap max_bytes must be an integer"),
+            ("sitemap: {base_url: 'x', foo: 1}", 'Unexpected field "foo" in sitemap config'),
+        ]:
+            with self.subTest(conf=conf):
+                self.write_file("conf.yaml", conf)
+                self.assertGenerateRaises(clearice.exceptions.ConfigError, failure_regex)
@@ -1,4 +1,6 @@
 
+import os
+
 import clearice
 
 from .base import BaseTest
@@ -110,6 +112,10 @@ class TestStaticFiles(BaseTest):
                 static:
                     link_type: geort
             """, 'Unrecognized link_type "geort", must be "soft" or "hard"'),
+            ("""
+                static:
+                    fingerprint: yes please
+            """, 'static fingerprint option must be true, false or a list of strings'),
         ]
         for conf, error_msg in tests:
             self.write_file("conf.yaml", conf)
@@ -154,3 +160,202 @@ class TestStaticFiles(BaseTest):
             large_assert("build/large.txt")
             self.assertFileContents("build/small.txt", "small")
             self.assertFileContents("build/large.txt", "LARGE"*50)
+
+    def test_fingerprint(self):
+        self.write_file("content/css/style.css", "body {}")
+        self.write_file("content/file.txt", "file content")
+        self.write_file("content/index.md", "---\n---")
+        self.write_file("templates/default.html",
+                "{{ asset_url('css/style.css') }} {{ asset_url('/file.txt') }} "
+                "{{ url_for('css/style.css') }}")
+        self.write_file("conf.yaml", """
+            static:
+                patterns:
+                    - "*.css"
+                    - "*.txt"
+                fingerprint:
+                    - "*.css"
+        """)
+        self.generate()
+
+        digest = clearice.cache.hash_file(os.path.join(self.tmp_dir, "content/css/style.css"))
+        fingerprinted = "css/style.{}.css".format(digest[:8])
+        self.assertFileContents("build/"+fingerprinted, "body {}")
+        self.assertFileNotExists("build/css/style.css")
+        self.assertFileContents("build/file.txt", "file content")
+        self.assertFileContents("build/index.html", "/{0} /file.txt /{0}".format(fingerprinted))
+        self.account_for_file(".clearice-cache/hashes.json")
+        self.assertEqual(self.app.stats.counters["files hashed"], 1)
+
+        # Unchanged files aren't hashed again
+        self.generate()
+        self.assertEqual(self.app.stats.counters["files hashed"], 0)
+        self.assertFileContents("build/"+fingerprinted, "body {}")
+
+        # Changed files are
+        self.write_file("content/css/style.css", "body { margin: 0 }")
+        self.generate()
+        self.assertEqual(self.app.stats.counters["files hashed"], 1)
+        self.assertFileNotExists("build/"+fingerprinted)
+        digest = clearice.cache.hash_file(os.path.join(self.tmp_dir, "content/css/style.css"))
+        self.assertFileContents("build/css/style.{}.css".format(digest[:8]), "body { margin: 0 }")
+
+    def test_asset_url_not_found(self):
+        self.write_file("content/index.md", "---\n---")
+        self.write_file("templates/default.html", "{{ asset_url('nope.css') }}")
+        self.assertGenerateRaises(
+            clearice.exceptions.TemplateError,
+            'No static file "nope.css" in content directory'
+        )
+
+    def test_sync(self):
+        self.write_file("content/copied.txt", "copied")
+        self.write_file("content/small.bin", "small!")
+        self.write_file("conf.yaml", """
+            static:
+                patterns: ["*.txt", "*.bin"]
+                link_above: 6 B
+        """)
+        self.write_file("content/large.txt", "large file")
+        self.generate()
+        counters = self.app.stats.counters
+        self.assertEqual(counters["static files copied"], 2)
+        self.assertEqual(counters["static files linked"], 1)
+        self.assertNotIn("static files skipped", counters)
+
+        # Nothing changed, so nothing is copied or linked
+        self.generate()
+        counters = self.app.stats.counters
+        self.assertNotIn("static files copied", counters)
+        self.assertNotIn("static files linked", counters)
+        self.assertEqual(counters["static files skipped"], 3)
+
+        # A modified file is copied again
+        path = os.path.join(self.tmp_dir, "content/copied.txt")
+        self.write_file("content/copied.txt", "edited")
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1000000000))
+        self.generate()
+        counters = self.app.stats.counters
+        self.assertEqual(counters["static files copied"], 1)
+        self.assertEqual(counters["static files skipped"], 2)
+        self.assertFileContents("build/copied.txt", "edited")
+        self.assertIsNormalFile("build/copied.txt")
+        self.assertFileContents("build/small.bin", "small!")
+        self.assertIsNormalFile("build/small.bin")
+        self.assertSoftLink("build/large.txt", "content/large.txt", is_relative=True)
+        self.assertFileContents("build/large.txt", "large file")
+
+        # Switching to hard links replaces the soft link
+        self.write_file("conf.yaml", """
+            static:
+                patterns: ["*.txt", "*.bin"]
+                link_above: 6 B
+                link_type: hard
+        """)
+        self.generate()
+        self.assertEqual(self.app.stats.counters["static files linked"], 1)
+        self.assertIsHardLink("build/large.txt")
+
+    def test_sync_disabled(self):
+        self.write_file("content/file.txt", "file content")
+        self.write_file("conf.yaml", """
+            static:
+                patterns: ["*.txt"]
+                sync: false
+        """)
+        self.generate()
+        self.generate()
+        self.assertEqual(self.app.stats.counters["static files copied"], 1)
+        self.assertFileContents("build/file.txt", "file content")
+
+    def test_parallel(self):
+        self.write_file("templates/default.html", "{{ url }}")
+        self.write_file("content/index.md", "---\n---")
+        for i in range(20):
+            self.write_file("content/files/{}.txt".format(i), str(i))
+
+        for workers, max_pending in [(0, 1), (1, 1), (3, 2), (8, 64)]:
+            with self.subTest(workers=workers, max_pending=max_pending):
+                self.write_file("conf.yaml", """
+                    static_workers: {}
+                    static_max_pending: {}
+                    static:
+                        patterns: ["*.txt"]
+                        sync: false
+                """.format(workers, max_pending))
+                self.make_app()
+                self.app.generate_urls()
+                urls = list(self.app.build_content())
+
+                self.assertEqual(sorted(urls), sorted(self.app.url_map.keys()))
+                self.assertEqual(self.app.stats.counters["static files copied"], 20)
+                self.assertFileContents("build/index.html", "/")
+                for i in range(20):
+                    self.assertFileContents("build/files/{}.txt".format(i), str(i))
+
+    def test_parallel_error(self):
+        self.write_file("content/file.txt", "file content")
+        self.write_file("conf.yaml", """
+            static:
+                patterns: ["*.txt"]
+        """)
+        self.make_app()
+        self.app.generate_urls()
+        os.remove(os.path.join(self.tmp_dir, "content/file.txt"))
+        with self.assertRaises(FileNotFoundError):
+            list(self.app.build_content())
+
+    def test_parallel_conf_errors(self):
+        tests = [
+            ("static_workers: -1", '"static_workers" must be a non-negative integer'),
+            ("static_max_pending: 0", '"static_max_pending" must be a positive integer'),
+        ]
+        for conf, error_msg in tests:
+            with self.subTest(conf=conf):
+                self.write_file("conf.yaml", conf)
+                self.assertGenerateRaises(
+                    clearice.exceptions.ConfigError,
+                    error_msg
+                )
+
+    def test_dedupe(self):
+        self.write_file("content/post1/shared.txt", "shared content")
+        self.write_file("content/post2/shared.txt", "shared content")
+        self.write_file("content/post3/renamed.txt", "shared content")
+        self.write_file("content/post3/other.txt", "other content!")  # Same size
+        self.write_file("conf.yaml", """
+            static:
+                patterns: ["*.txt"]
+                dedupe: true
+        """)
+        self.generate()
+        self.account_for_file(".clearice-cache/hashes.json")
+
+        paths = ["build/post1/shared.txt", "build/post2/shared.txt", "build/post3/renamed.txt"]
+        inodes = set()
+        for path in paths:
+            self.assertFileContents(path, "shared content")
+            inodes.add(os.stat(os.path.join(self.tmp_dir, path)).st_ino)
+        self.assertEqual(len(inodes), 1)
+        self.assertFileContents("build/post3/other.txt", "other content!")
+        self.assertNotIn(os.stat(os.path.join(self.tmp_dir, "build/post3/other.txt")).st_ino, inodes)
+
+        counters = self.app.stats.counters
+        self.assertEqual(counters["static files copied"], 2)
+        self.assertEqual(counters["static files deduplicated"], 2)
+        self.assertEqual(counters["dedupe bytes saved"], 2 * len("shared content"))
+
+        # Second build leaves everything alone
+        self.generate()
+        counters = self.app.stats.counters
+        self.assertEqual(counters["static files skipped"], 4)
+        self.assertNotIn("static files deduplicated", counters)
+        self.assertEqual(counters["dedupe bytes saved"], 2 * len("shared content"))
+
+        # Content no longer shared is split back out
+        self.write_file("content/post2/shared.txt", "changed")
+        self.generate()
+        self.assertFileContents("build/post1/shared.txt", "shared content")
+        self.assertFileContents("build/post2/shared.txt", "changed")
+        self.assertFileContents("build/post3/renamed.txt", "shared content")
+        self.assertEqual(self.app.stats.counters["dedupe bytes saved"], len("shared content"))
@@ -0,0 +1,78 @@
+
+import clearice
+from clearice.stats import BuildStats
+
+from .base import BaseTest
+
+class TestStats(BaseTest):
+
+    def test_build_phases(self):
+        self.write_file("templates/default.html", "{{ content }}")
+        self.write_file("content/index.md", "---\n---\nHello!")
+        self.write_file("content/about.md", "---\n---\nAbout!")
+        self.write_file("content/blog/_collection.yaml", "name: blog")
+        self.generate()
+        self.account_for_files(["build/index.html", "build/about/index.html"])
+
+        phases = self.app.stats.phases
+        self.assertEqual(list(phases.keys()), [
+            "config",
+            "generate_urls",
+            "generator: Collection blog",
+            "generator: MarkdownGenerator",
+            "scan build dir",
+            "render",
+            "write",
+            "cleanup",
+        ])
+        self.assertEqual(phases["render"].count, 2)
+        self.assertEqual(phases["write"].count, 2)
+        # Per-url phases only record wall time
+        self.assertIsNone(phases["render"].cpu_time)
+        self.assertIsNone(phases["render"].max_rss)
+        self.assertIsNotNone(phases["generate_urls"].cpu_time)
+        self.assertEqual(self.app.stats.counters["urls built"], 2)
+        for phase in phases.values():
+            self.assertGreaterEqual(phase.wall_time, 0)
+            self.assertIsNone(phase.peak_traced)
+
+        # Stats start over on reset
+        self.app.reset()
+        self.assertEqual(list(self.app.stats.phases.keys()), ["config"])
+
+    def test_trace_memory(self):
+        stats = BuildStats(trace_memory=True)
+        try:
+            with stats.phase("outer"):
+                with stats.phase("inner"):
+                    data = bytearray(1024*1024)
+                    del data
+                with stats.phase("small"):
+                    pass
+            self.assertGreaterEqual(stats.phases["inner"].peak_traced, 1024*1024)
+            self.assertGreaterEqual(stats.phases["outer"].peak_traced, 1024*1024)
+            self.assertLess(stats.phases["small"].peak_traced, 1024*1024)
+
+            top = stats.top_allocations(3)
+            self.assertLessEqual(len(top), 3)
+            self.assertEqual(set(top[0].keys()), {"filename", "lineno", "size", "count"})
+        finally:
+            stats.stop()
+
+        with self.assertRaisesRegex(RuntimeError, "requires trace_memory=True"):
+            stats.top_allocations()
+
+    def test_format(self):
+        stats = BuildStats()
+        with stats.phase("render"):
+            pass
+        stats.add_time("write", 0.25)
+        stats.add_time("write", 0.5)
+        stats.incr("bytes saved", 10)
+        stats.incr("bytes saved", 5)
+        lines = stats.format().split('\n')
+        self.assertTrue(lines[0].startswith("Phase"))
+        self.assertTrue(lines[1].startswith("render"))
+        self.assertEqual(lines[2].split(), ["write", "2", "0.750", "-", "-", "-"])
+        self.assertEqual(lines[3], "bytes saved: 15")
+        self.assertEqual(stats.as_dict()["counters"], {"bytes saved": 15})
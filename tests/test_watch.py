@@ -0,0 +1,159 @@
+
+import io
+import os
+import threading
+import contextlib
+
+from watchdog.events import FileModifiedEvent, FileMovedEvent, DirModifiedEvent, \
+        FileOpenedEvent
+
+from clearice.exceptions import BuildCancelled
+from clearice.incremental import IncrementalBuilder
+from clearice.watch import BuildScheduler, ChangeHandler
+
+from .base import BaseTest
+
+class TestBuildScheduler(BaseTest):
+
+    def make_scheduler(self, build):
+        scheduler = BuildScheduler(build, quiet_period=0.05)
+        scheduler.start()
+        self.addCleanup(scheduler.stop)
+        return scheduler
+
+    def test_coalesce(self):
+        builds = []
+        scheduler = self.make_scheduler(builds.append)
+        scheduler.add_changes(["a"])
+        scheduler.add_changes(["b", "a"])
+        self.assertTrue(scheduler.wait_idle(5))
+        self.assertEqual(builds, [{"a", "b"}])
+
+        scheduler.add_changes(["c"])
+        scheduler.add_changes(None)
+        self.assertTrue(scheduler.wait_idle(5))
+        self.assertEqual(builds, [{"a", "b"}, None])
+
+    def test_cancel(self):
+        builds = []
+        started = threading.Event()
+
+        def build(paths):
+            builds.append(paths)
+            if len(builds) == 1:
+                started.set()
+                # Wait for the next change to cancel this build
+                self.assertTrue(scheduler.cancel_event.wait(5))
+                raise BuildCancelled()
+
+        scheduler = self.make_scheduler(build)
+        scheduler.add_changes(["a"])
+        self.assertTrue(started.wait(5))
+        scheduler.add_changes(["b"])
+        self.assertTrue(scheduler.wait_idle(5))
+        self.assertEqual(builds, [{"a"}, {"a", "b"}])
+        self.assertEqual(scheduler.n_cancelled, 1)
+
+    def test_errors_keep_watching(self):
+        builds = []
+        def build(paths):
+            builds.append(paths)
+            if len(builds) == 1:
+                raise ValueError("Unexpected")
+        scheduler = self.make_scheduler(build)
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            scheduler.add_changes(["a"])
+            self.assertTrue(scheduler.wait_idle(5))
+        self.assertIn("ValueError: Unexpected", stderr.getvalue())
+        scheduler.add_changes(["b"])
+        self.assertTrue(scheduler.wait_idle(5))
+        self.assertEqual(builds, [{"a"}, {"b"}])
+
+
+class TestChangeHandler(BaseTest):
+
+    def test_filter(self):
+        self.write_file("conf.yaml", "minify_html: false")
+        app = self.make_app()
+        changes = []
+        class Scheduler():
+            def add_changes(self, paths):
+                changes.append(paths)
+        handler = ChangeHandler(app, Scheduler())
+
+        def path(relpath):
+            return os.path.join(self.tmp_dir, relpath)
+        for event in [
+            FileModifiedEvent(path("content/a.md")),
+            FileModifiedEvent(path("templates/default.html")),
+            FileModifiedEvent(path("conf.yaml")),
+            FileMovedEvent(path("notes.md"), path("content/b.md")),
+            FileMovedEvent(path("content/.c.md.tmp"), path("content/c.md")),
+            # Ignored
+            FileModifiedEvent(path("notes.md")),
+            FileModifiedEvent(path("content/.a.md.swp")),
+            FileModifiedEvent(path("content/a.md~")),
+            FileModifiedEvent(path("templates/4913")),
+            FileMovedEvent(path("content/.a.md.tmp"), path("content/.a.md.swx")),
+            FileModifiedEvent(path("build/index.html")),
+            FileModifiedEvent(path(".clearice-cache/hashes.json")),
+            FileOpenedEvent(path("content/a.md")),
+            DirModifiedEvent(path("content")),
+        ]:
+            handler.dispatch(event)
+        self.assertEqual(changes, [
+            [path("content/a.md")],
+            [path("templates/default.html")],
+            [path("conf.yaml")],
+            [path("content/b.md")],
+            [path("content/c.md")],
+        ])
+
+    def test_output_in_content(self):
+        # Builds write to the build and cache directories, which must not
+        # start another build even when they're in the content directory
+        self.write_file("conf.yaml", "content_dir: .")
+        app = self.make_app()
+        changes = []
+        class Scheduler():
+            def add_changes(self, paths):
+                changes.append(paths)
+        handler = ChangeHandler(app, Scheduler())
+
+        def path(relpath):
+            return os.path.join(self.tmp_dir, relpath)
+        for event in [
+            FileModifiedEvent(path("a.md")),
+            FileModifiedEvent(path("build/index.html")),
+            FileModifiedEvent(path(".clearice-cache/search/state.json")),
+        ]:
+            handler.dispatch(event)
+        self.assertEqual(changes, [[path("a.md")]])
+
+
+class TestCancel(BaseTest):
+
+    def test_cancel_build(self):
+        self.write_file("templates/default.html", "{{ title }}")
+        self.write_file("content/a.md", "---\ntitle: A\n---")
+        self.write_file("content/b.md", "---\ntitle: B\n---")
+        self.account_for_files(["build/a/index.html", "build/b/index.html"])
+        app = self.make_app()
+        builder = IncrementalBuilder(app)
+        builder.build()
+
+        app.cancel_event = threading.Event()
+        app.cancel_event.set()
+        self.write_file("content/a.md", "---\ntitle: AA\n---")
+        with self.assertRaises(BuildCancelled):
+            builder.build([os.path.join(self.tmp_dir, "content/a.md")])
+        # Builds on from the last finished build
+        self.assertIsNotNone(builder.last_build)
+
+        app.cancel_event.clear()
+        self.write_file("content/b.md", "---\ntitle: BB\n---")
+        self.assertEqual(builder.build([os.path.join(self.tmp_dir, "content/b.md"),
+                                        os.path.join(self.tmp_dir, "content/a.md")]), 2)
+        self.assertFileContents("build/a/index.html", "AA")
+        self.assertFileContents("build/b/index.html", "BB")